@@ -0,0 +1,157 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# On-disk cache shared by the ESC tools (autodetect results, params index,
+# compiled params, ...)
+# Files live in $XDG_CACHE_HOME/voxl-esc (~/.cache/voxl-esc by default).
+#
+# The autodetect cache remembers the last good port, baud rate, ESC IDs and
+# versions per USB serial adapter, keyed by the adapter's USB serial number,
+# so that the entry still applies when the adapter shows up under a
+# different /dev node. Ports without a serial number are keyed by path.
+
+import os
+import json
+import time
+import errno
+
+AUTODETECT_CACHE_FILE = 'autodetect.json'
+
+
+def _makedirs(path):
+    # several tools (or pool workers) may create the directory at the same time
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(base, 'voxl-esc')
+    if not os.path.isdir(path):
+        _makedirs(path)
+    return path
+
+
+def cache_path(name):
+    return os.path.join(cache_dir(), name)
+
+
+def load_json(name, default=None):
+    try:
+        with open(cache_path(name), 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def save_json(name, data):
+    '''
+    Write a cache file atomically, so that concurrent tools never read a partial file
+    '''
+    try:
+        path = cache_path(name)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        pass   # caching is best effort
+
+
+def load_bytes(name):
+    try:
+        with open(cache_path(name), 'rb') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def save_bytes(name, data):
+    '''
+    Write a binary cache file atomically. name may include a subdirectory
+    '''
+    try:
+        path = cache_path(name)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        if not os.path.isdir(os.path.dirname(path)):
+            _makedirs(os.path.dirname(path))
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        pass   # caching is best effort
+
+
+def get_adapter_keys(devpaths):
+    '''
+    Map device paths to adapter keys ("usb:<serial number>" or "path:<devpath>")
+    '''
+    serial_numbers = {}
+    try:
+        from serial.tools import list_ports
+        for port in list_ports.comports():
+            if getattr(port, 'serial_number', None):
+                serial_numbers[os.path.realpath(port.device)] = port.serial_number
+    except ImportError:
+        pass
+    keys = {}
+    for devpath in devpaths:
+        serial_number = serial_numbers.get(os.path.realpath(devpath))
+        keys[devpath] = ('usb:' + serial_number) if serial_number else ('path:' + devpath)
+    return keys
+
+
+def load_autodetect():
+    return load_json(AUTODETECT_CACHE_FILE, {})
+
+
+def store_autodetect(results):
+    '''
+    Remember escscan.ScanResult entries for the adapters they were found on
+    '''
+    if len(results) == 0:
+        return
+    cache = load_autodetect()
+    keys = get_adapter_keys([r.devpath for r in results])
+    for r in results:
+        cache[keys[r.devpath]] = {
+            'devpath'  : r.devpath,
+            'baudrate' : int(r.baudrate),
+            'esc_ids'  : list(r.esc_ids),
+            'versions' : [list(v) for v in r.versions],
+            'time'     : time.time(),
+        }
+    save_json(AUTODETECT_CACHE_FILE, cache)
@@ -0,0 +1,320 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Helpers for the ESC feed-forward calibration (voxl-esc-calibrate.py)
+#
+# Adaptive sweep: instead of holding every power step for a fixed time, a step
+# ends as soon as the RPM has settled, i.e. the spread and the slope of the
+# last few feedback samples are both small. Where RPM is close to linear in
+# power, the step size is increased, since the fit gains little from dense
+# points there.
+#
+# Fit: the ESC feed-forward curve is motor_voltage_mv = a2*rpm^2 + a1*rpm + a0
+# (named pwm_vs_rpm_curve_a0..a2 in the params files). Measurements are rows
+# of [power (0-100), rpm, battery voltage (V), current (A)]. Before fitting,
+# samples whose rpm (feedback dropouts) or battery voltage (supply sag)
+# deviate strongly from the other samples at the same power are rejected,
+# then the curve is fit with iteratively reweighted least squares (Tukey
+# bisquare weights), so that remaining outliers have little influence.
+#
+# Sweeps: the raw measurements of a calibration run can be saved (.npz, one
+# array per ESC id plus a label naming the motor / prop combination, like the
+# params files) and fit again offline with voxl-esc-refit.py.
+
+import os
+from collections import deque
+
+import numpy as np
+
+
+class SettlingDetector(object):
+    '''
+    Decide when RPM has settled after a power step. The last `window` samples
+    must have a standard deviation below max(min_std, rel_std * mean rpm)
+    and a linear trend below max(min_slope, rel_slope * mean rpm) per second.
+
+    Only new feedback enters the window. libesc has no feedback counter or
+    timestamp, so a sample whose feedback values all equal those of the
+    previous sample is taken as the same packet read again. This matters when
+    several ESCs share the feedback rate and are polled faster than each one
+    reports.
+    '''
+    def __init__(self, window=10, rel_std=0.01, min_std=30.0, rel_slope=0.03, min_slope=150.0):
+        self.window    = window
+        self.rel_std   = rel_std
+        self.min_std   = min_std
+        self.rel_slope = rel_slope
+        self.min_slope = min_slope
+        self.samples   = deque(maxlen=window)
+
+    def reset(self):
+        self.samples.clear()
+
+    def add(self, sample):
+        '''
+        Add a telemetry sample, returns True once the rpm has settled
+        '''
+        if self.samples and sample[2:] == self.samples[-1][2:]:
+            return False   # same rpm, power, voltage, current and temperature: no new feedback
+        self.samples.append(sample)
+        if len(self.samples) < self.window:
+            return False
+        t   = np.array([s.t for s in self.samples])
+        rpm = np.array([s.rpm for s in self.samples])
+        mean = np.mean(rpm)
+        if mean <= 0:
+            return False
+        slope = np.polyfit(t - t[0], rpm, 1)[0] if t[-1] > t[0] else 0.0
+        return (np.std(rpm) < max(self.min_std, self.rel_std * mean) and
+                abs(slope) < max(self.min_slope, self.rel_slope * mean))
+
+
+class AdaptiveStep(object):
+    '''
+    Power step size for the sweep. After every step, the RPM of the step is
+    compared against a linear extrapolation of the two previous steps; while
+    the error stays below tolerance (fraction of rpm), the step size doubles
+    up to max_step, otherwise it drops back to min_step.
+    '''
+    def __init__(self, min_step=1, max_step=4, tolerance=0.02):
+        self.min_step  = min_step
+        self.max_step  = max_step
+        self.tolerance = tolerance
+        self.step      = min_step
+        self.points    = deque(maxlen=3)
+
+    def update(self, pwm, rpm):
+        self.points.append((pwm, rpm))
+        if len(self.points) == 3:
+            (p0, r0), (p1, r1), (p2, r2) = self.points
+            predicted = r1 + (r1 - r0) * (p2 - p1) / float(p1 - p0) if p1 != p0 else r1
+            if r2 > 0 and abs(predicted - r2) / r2 < self.tolerance:
+                self.step = min(self.step * 2, self.max_step)
+            else:
+                self.step = self.min_step
+        return self.step
+
+
+def motor_voltages(measurements):
+    '''
+    Commanded motor voltage (mV) of every measurement row.
+    Reported power is 0-100, but in ESC firmware it is 0-1000
+    '''
+    data = np.asarray(measurements, dtype=float).reshape(-1, 4)
+    return data[:, 0] * 10.0 / 999.0 * (data[:, 2] * 1000.0)
+
+
+def _mad(x):
+    return np.median(np.abs(x - np.median(x)))
+
+
+def reject_outliers(measurements, rpm_tolerance=0.1, voltage_tolerance=0.05, num_mads=5.0):
+    '''
+    Boolean mask of the measurement rows to keep. Within each power level, a
+    sample is rejected if its rpm or battery voltage differs from the median
+    of that level by more than num_mads median absolute deviations and by
+    more than the relative tolerance. Zero rpm is always rejected.
+    '''
+    data = np.asarray(measurements, dtype=float).reshape(-1, 4)
+    keep = data[:, 1] > 0
+    levels = np.round(data[:, 0])
+    for level in np.unique(levels):
+        idx = np.nonzero((levels == level) & keep)[0]
+        if len(idx) < 3:
+            continue
+        for (col, tolerance) in [(1, rpm_tolerance), (2, voltage_tolerance)]:
+            values = data[idx, col]
+            median = np.median(values)
+            dev = np.abs(values - median)
+            bad = (dev > num_mads * 1.4826 * _mad(values)) & (dev > tolerance * abs(median))
+            keep[idx[bad]] = False
+    return keep
+
+
+def fit_curve(measurements, iterations=5):
+    '''
+    Robust quadratic fit of motor voltage vs rpm. Returns a dict with
+    'coeffs' ([a2, a1, a0], np.polyfit order), 'mask' (rows used for the fit),
+    'weights', residual statistics in mV ('rms', 'max') and 'r2'
+    '''
+    data = np.asarray(measurements, dtype=float).reshape(-1, 4)
+    mask = reject_outliers(data)
+    rpm = data[mask, 1]
+    mv  = motor_voltages(data[mask])
+    if len(rpm) < 3:
+        raise ValueError('not enough valid measurements for a quadratic fit')
+
+    weights = np.ones(len(rpm))
+    for _ in range(iterations):
+        coeffs = np.polyfit(rpm, mv, 2, w=np.sqrt(weights))
+        residuals = mv - np.polyval(coeffs, rpm)
+        scale = 1.4826 * _mad(residuals)
+        if scale <= 0:
+            break
+        u = residuals / (4.685 * scale)
+        weights = np.where(np.abs(u) < 1.0, (1.0 - u * u) ** 2, 0.0)
+
+    residuals = mv - np.polyval(coeffs, rpm)
+    ss_tot = np.sum((mv - np.mean(mv)) ** 2)
+    return {
+        'coeffs'  : coeffs,
+        'mask'    : mask,
+        'weights' : weights,
+        'rms'     : float(np.sqrt(np.mean(residuals ** 2))),
+        'max'     : float(np.max(np.abs(residuals))),
+        'r2'      : float(1.0 - np.sum(residuals ** 2) / ss_tot) if ss_tot > 0 else 1.0,
+    }
+
+
+def rpm_limits(measurements, mask=None):
+    '''
+    (min_rpm, max_rpm): median rpm at the lowest and at the highest power level
+    '''
+    data = np.asarray(measurements, dtype=float).reshape(-1, 4)
+    if mask is not None:
+        data = data[mask]
+    levels = np.round(data[:, 0])
+    return (int(round(np.median(data[levels == levels.min(), 1]))),
+            int(round(np.median(data[levels == levels.max(), 1]))))
+
+
+def coefficient_spread(fits, rpm_range):
+    '''
+    Spread of per-motor fits (dict esc_id -> [a2, a1, a0]): min / max / std of
+    every coefficient, plus the largest difference (mV) between any per-motor
+    curve and the mean curve over rpm_range = (rpm_min, rpm_max)
+    '''
+    coeffs = np.array([fits[esc_id] for esc_id in sorted(fits)])
+    rpm = np.linspace(rpm_range[0], rpm_range[1], 100)
+    curves = np.array([np.polyval(c, rpm) for c in coeffs])
+    return {
+        'min'            : coeffs.min(axis=0),
+        'max'            : coeffs.max(axis=0),
+        'std'            : coeffs.std(axis=0),
+        'max_curve_diff' : float(np.max(np.abs(curves - curves.mean(axis=0)))) if len(curves) else 0.0,
+    }
+
+
+SWEEP_EXTENSION = '.npz'
+
+
+def save_sweep(path, measurements, label='', pwm_range=(0, 100)):
+    '''
+    Save the raw measurements of a sweep (dict esc_id -> rows)
+    '''
+    arrays = dict(('id_%d' % esc_id, np.asarray(rows, dtype=float).reshape(-1, 4))
+                  for (esc_id, rows) in measurements.items())
+    with open(path, 'wb') as f:  # savez appends .npz to plain path names
+        np.savez(f, label=np.array(label), pwm_range=np.array(pwm_range, dtype=float), **arrays)
+
+
+def load_sweep(path):
+    '''
+    (measurements, label, pwm_range) of a sweep saved by save_sweep()
+    '''
+    with np.load(path) as data:
+        measurements = dict((int(k[3:]), data[k]) for k in data.files if k.startswith('id_'))
+        label = data['label'].item()
+        if isinstance(label, bytes) and not isinstance(label, str):
+            label = label.decode('utf-8')
+        return (measurements, label, tuple(data['pwm_range']))
+
+
+def find_sweep_files(path):
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for (root, dirs, files) in os.walk(path):
+        dirs.sort()
+        found += [os.path.join(root, f) for f in sorted(files) if f.endswith(SWEEP_EXTENSION)]
+    return found
+
+
+def refit_sweep(args):
+    '''
+    Fit every ESC of a saved sweep again, using only measurements within
+    pwm_window = (pwm_min, pwm_max) if given. Takes a (path, pwm_window)
+    tuple so it can be used with Pool.map(). Returns a dict with 'path',
+    'label' and 'fits' (esc_id -> coeffs, residuals and rpm limits), or
+    'error' if the file could not be loaded.
+    '''
+    (path, pwm_window) = args
+    try:
+        (measurements, label, pwm_range) = load_sweep(path)
+    except (IOError, ValueError, KeyError) as e:
+        return {'path': path, 'error': str(e)}
+    result = {'path': path, 'label': label, 'fits': {}}
+    for (esc_id, data) in sorted(measurements.items()):
+        if pwm_window is not None:
+            data = data[(data[:, 0] >= pwm_window[0]) & (data[:, 0] <= pwm_window[1])]
+        try:
+            fit = fit_curve(data)
+        except ValueError as e:
+            result['fits'][esc_id] = {'error': str(e)}
+            continue
+        result['fits'][esc_id] = {
+            'coeffs'   : [float(c) for c in fit['coeffs']],
+            'rms'      : fit['rms'],
+            'max'      : fit['max'],
+            'rejected' : int(np.sum(~fit['mask'])),
+            'samples'  : len(fit['mask']),
+            'rpm_limits' : rpm_limits(data, fit['mask']),
+        }
+    return result
+
+
+def summarize_fits(results):
+    '''
+    Group per-motor fits of refit_sweep() results by label. Returns an
+    ordered list of (label, summary) with the number of motors, mean and std
+    of the coefficients ([a2, a1, a0]), the worst rms residual and the rpm
+    range reached by every motor.
+    '''
+    groups = {}
+    for result in results:
+        for fit in result.get('fits', {}).values():
+            if 'error' not in fit:
+                groups.setdefault(result['label'] or 'unlabeled', []).append(fit)
+    summary = []
+    for label in sorted(groups):
+        fits = groups[label]
+        coeffs = np.array([f['coeffs'] for f in fits])
+        summary.append((label, {
+            'motors'  : len(fits),
+            'mean'    : coeffs.mean(axis=0).tolist(),
+            'std'     : coeffs.std(axis=0).tolist(),
+            'max_rms' : max(f['rms'] for f in fits),
+            'min_rpm' : max(f['rpm_limits'][0] for f in fits),
+            'max_rpm' : min(f['rpm_limits'][1] for f in fits),
+        }))
+    return summary
@@ -0,0 +1,177 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Reading back ESC config from several ESCs at once. Requests for all four
+# config sections (id, board, uart, tune) go out to every ESC up front, then
+# we wait until every ESC has a complete config instead of sleeping a fixed
+# time per ESC. Requests to consecutive ESCs are spaced by a small gap so the
+# responses, which share the bus, do not pile up on top of each other.
+#
+# upload_config() builds on the readback to push only the config sections
+# that differ from what the ESCs already have, and confirms every push by
+# reading the config back instead of sleeping.
+
+import time
+
+from libesc.esctypes import EscTypes as types
+
+from escparams import read_params_fields, diff_fields
+
+# config sections in upload order: (params filter name, XML section, push packet type)
+CONFIG_SECTIONS = [
+    ('board', 'BoardParams', types.ESC_PACKET_TYPE_BOARD_CONFIG),
+    ('id',    'IdParams',    types.ESC_PACKET_TYPE_ID_CONFIG),
+    ('uart',  'UartParams',  types.ESC_PACKET_TYPE_UART_CONFIG),
+    ('tune',  'TuneParams',  types.ESC_PACKET_TYPE_TUNE_CONFIG),
+]
+
+READBACK_TIMEOUT     = 1.0    # seconds, overall
+READBACK_RETRY_AFTER = 0.15   # seconds without a complete config before requesting again
+READBACK_MAX_RETRIES = 3
+REQUEST_GAP          = 0.01   # seconds between requests to consecutive ESCs
+
+
+def request_config(esc_manager, esc_id):
+    esc_manager.request_config_id(esc_id)
+    esc_manager.request_config_board(esc_id)
+    esc_manager.request_config_uart(esc_id)
+    esc_manager.request_config_tune(esc_id)
+
+
+def params_valid(esc):
+    return esc.params.is_valid()
+
+
+def readback_config(esc_manager, esc_ids, is_complete=params_valid,
+                    timeout=READBACK_TIMEOUT, retry_after=READBACK_RETRY_AFTER,
+                    max_retries=READBACK_MAX_RETRIES, request_gap=REQUEST_GAP):
+    '''
+    Request config from all esc_ids and wait until is_complete(esc) holds for
+    every one of them or the timeout expires. ESCs that are still incomplete
+    after retry_after are asked again, up to max_retries times.
+    Returns dict esc_id -> readback latency in seconds (None if it timed out)
+    '''
+    escs     = dict((esc_id, esc_manager.get_esc_by_id(esc_id)) for esc_id in esc_ids)
+    latency  = dict((esc_id, None) for esc_id in esc_ids)
+    retries  = dict((esc_id, 0) for esc_id in esc_ids)
+    t_sent   = {}
+
+    t_start = time.time()
+    for esc_id in esc_ids:
+        request_config(esc_manager, esc_id)
+        t_sent[esc_id] = time.time()
+        if request_gap > 0:
+            time.sleep(request_gap)
+
+    pending = set(esc_ids)
+    while pending and time.time() - t_start < timeout:
+        t_now = time.time()
+        for esc_id in sorted(pending):
+            if is_complete(escs[esc_id]):
+                latency[esc_id] = t_now - t_start
+                pending.discard(esc_id)
+            elif t_now - t_sent[esc_id] > retry_after and retries[esc_id] < max_retries:
+                request_config(esc_manager, esc_id)
+                t_sent[esc_id] = t_now
+                retries[esc_id] += 1
+        time.sleep(0.002)
+    return latency
+
+
+def select_sections(params_filter):
+    return [s for s in CONFIG_SECTIONS if 'all' in params_filter or s[0] in params_filter]
+
+
+def load_params(esc_manager, params_data, params_type):
+    '''
+    Load params into esc_manager.esc_dummy for upload_config, params_type is
+    'xml' for an XML string or 'eep' for compiled params bytes
+    '''
+    if params_type == 'xml':
+        esc_manager.esc_dummy.params.parse_xml_string(params_data)
+    else:
+        esc_manager.esc_dummy.params.parse_params_all(params_data)
+
+
+def diff_sections(expected, esc, sections):
+    '''
+    Return the names of the sections whose values in esc.params differ from
+    expected (as returned by read_params_fields). All sections are reported
+    as different if the ESC params are not valid
+
+    libesc only packs the whole params set (get_param_bytes_all), not single
+    config sections, so sections are compared by their parsed values rather
+    than by their packed bytes. Numbers are equal within a relative 1e-6
+    (escparams.diff_fields), since floats come back from the ESC rounded to
+    float32 (about 6e-8 relative). A change smaller than 1e-6 relative, close
+    to what float32 can represent, is therefore not pushed
+    '''
+    if not esc.params.is_valid():
+        return [name for (name, xml_section, packet_type) in sections]
+    actual = read_params_fields(esc.params.get_xml_string())
+    return [name for (name, xml_section, packet_type) in sections
+            if diff_fields(expected.get(xml_section, {}), actual.get(xml_section, {}))]
+
+
+def upload_config(esc_manager, esc_ids, sections=CONFIG_SECTIONS, differential=True,
+                  timeout=READBACK_TIMEOUT, log=None):
+    '''
+    Push config sections from esc_manager.esc_dummy.params to the ESCs.
+    With differential=True the current config is read back first and only the
+    sections that differ on at least one ESC are pushed. Every push is
+    confirmed by reading the config back from all ESCs.
+    Returns (names of pushed sections, ids of ESCs that did not confirm)
+    '''
+    expected = read_params_fields(esc_manager.esc_dummy.params.get_xml_string())
+    escs = dict((esc_id, esc_manager.get_esc_by_id(esc_id)) for esc_id in esc_ids)
+
+    to_push = sections
+    if differential:
+        readback_config(esc_manager, esc_ids, timeout=timeout)
+        changed = set()
+        for esc_id in esc_ids:
+            changed.update(diff_sections(expected, escs[esc_id], sections))
+        to_push = [s for s in sections if s[0] in changed]
+
+    pushed = []
+    failed = set()
+    for (name, xml_section, packet_type) in to_push:
+        if log is not None:
+            log('-- %s config' % name)
+        esc_manager.push_config_data(packet_type)
+        pushed.append(name)
+
+        confirmed = lambda esc: len(diff_sections(expected, esc, [(name, xml_section, packet_type)])) == 0
+        latency = readback_config(esc_manager, esc_ids, is_complete=confirmed, timeout=timeout)
+        failed.update(esc_id for esc_id in esc_ids if latency[esc_id] is None)
+    return (pushed, sorted(failed))
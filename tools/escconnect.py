@@ -0,0 +1,136 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Connection handling shared by the tools: the common command line options
+# and connect(), which autodetects the port if needed, opens it (or attaches
+# to a running voxl-esc-daemon.py) and waits for the ESCs to be detected.
+# Errors are printed and end the program, as in the tools themselves.
+#
+# open_escs() is the non-interactive variant used to reconnect after the ESCs
+# were reset (provisioning, auto-tuning), it raises EscConnectError instead.
+
+import sys
+
+from escscan import autodetect, wait_for_escs, store_detected
+from escdaemon import DEFAULT_SOCKET
+
+RESET_BOOT_TIME = 1.5   # seconds between resetting the ESCs and reconnecting
+
+
+class EscConnectError(Exception):
+    pass
+
+
+def add_connection_args(parser, baud_rate_option='--baud-rate', daemon=True):
+    parser.add_argument('--device',                 required=False, default=None)
+    parser.add_argument(baud_rate_option, dest='baud_rate', required=False, default=None)
+    parser.add_argument('--scan-parallel',          action='store_true')
+    if daemon:
+        parser.add_argument('--daemon',             nargs='?', const=DEFAULT_SOCKET, default=None)  # attach to voxl-esc-daemon.py
+    parser.add_argument('--expect-escs', type=int,  required=False, default=None)  # wait until this many ESCs are detected
+
+
+def connect(args, ids=None):
+    '''
+    Open the ESCs selected by the connection options in args, waiting for
+    at least --expect-escs ESCs and all ESC ids in ids. args.device and
+    args.baud_rate are updated with the port that was used.
+    Returns (esc_manager, detected ESCs)
+    '''
+    daemon = getattr(args, 'daemon', None)
+    autodetected = False
+
+    if args.device is not None and args.baud_rate is None:
+        print('ERROR: Please provide baud rate with --baud-rate option')
+        sys.exit(1)
+
+    if args.device is None and daemon is None:
+        print('INFO: Device and baud rate are not provided, attempting to autodetect..')
+        (args.device, args.baud_rate) = autodetect(args.scan_parallel)
+        autodetected = True
+
+        if args.device is not None and args.baud_rate is not None:
+            print('')
+            print('INFO: ESC(s) detected on port: ' + args.device + ' using baudrate: ' + str(args.baud_rate))
+            print('INFO: Attempting to open...')
+        else:
+            print('ERROR: No ESC(s) detected, exiting.')
+            sys.exit(1)
+
+    try:
+        if daemon is not None:
+            from escdaemon import RemoteEscManager
+            esc_manager = RemoteEscManager()
+            esc_manager.open(daemon)
+        else:
+            from libesc.escmanager import EscManager
+            esc_manager = EscManager()
+            esc_manager.open(args.device, args.baud_rate)
+    except Exception as e:
+        print('ERROR: Unable to connect to ESCs :')
+        print(e)
+        sys.exit(1)
+
+    # wait until the ESCs have been detected (all expected ones, or until no new ESC shows up)
+    escs = wait_for_escs(esc_manager, args.expect_escs, ids)
+    if args.expect_escs is not None and len(escs) < args.expect_escs:
+        print('ERROR: Expected %d ESCs, detected %d--exiting.' % (args.expect_escs, len(escs)))
+        esc_manager.close()
+        sys.exit(1)
+    if len(escs) == 0:
+        print('ERROR: No ESCs detected--exiting.')
+        esc_manager.close()
+        sys.exit(1)
+    if autodetected:
+        store_detected(args.device, args.baud_rate, escs)
+    return (esc_manager, escs)
+
+
+def open_escs(devpath, baudrate, esc_ids, expect=None):
+    '''
+    Open the port and wait until all esc_ids (and at least expect ESCs) have
+    been detected. Returns (esc_manager, detected ESCs)
+    '''
+    from libesc.escmanager import EscManager
+    esc_manager = EscManager()
+    try:
+        esc_manager.open(devpath, baudrate)
+    except Exception as e:
+        raise EscConnectError('unable to open %s: %s' % (devpath, e))
+    escs = wait_for_escs(esc_manager, expect, esc_ids)
+    found = set(e.get_id() for e in escs)
+    if not set(esc_ids) <= found or (expect is not None and len(escs) < expect):
+        esc_manager.close()
+        raise EscConnectError('detected %d ESC(s) (%s), expected %s' % (len(escs),
+            ', '.join(str(i) for i in sorted(found)), expect if expect is not None else len(esc_ids)))
+    return (esc_manager, escs)
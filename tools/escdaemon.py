@@ -0,0 +1,526 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# ESC session daemon: holds one EscManager open and serves it to local
+# clients over a Unix domain socket, so that back to back tool runs skip
+# autodetect, port setup and ESC discovery, and several clients can watch
+# telemetry at the same time.
+#
+# The protocol is one JSON object per line. Requests carry an "id" and get a
+# response with the same id ({"id", "ok", "result"} or {"id", "ok", "error"});
+# send_targets has no id and no response, so command loops do not wait on
+# the socket. Subscribed clients receive feedback events:
+#
+#   {"event": "feedback", "escs": [[id, rpm, power, voltage, current, temperature], ...]}
+#
+# When a client disconnects, the ESCs it commanded are set back to zero power.
+# Messages to a client go through a bounded outbox drained by a writer thread
+# per client; a client that stops reading is dropped once its outbox is full,
+# so it can not stall telemetry for the others.
+#
+# RemoteEscManager is a drop-in replacement for EscManager on the client side
+# (the subset used by the tools, no firmware upload or protocol switching).
+
+import os
+import json
+import time
+import socket
+import base64
+import threading
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'), 'voxl-esc.sock')
+FEEDBACK_RATE  = 100.0   # Hz, default feedback event rate for clients
+CALL_TIMEOUT   = 5.0     # seconds
+CLIENT_OUTBOX  = 256     # messages queued for a client before it is dropped
+
+CONFIG_REQUESTS = ['id', 'board', 'uart', 'tune']
+
+
+class EscDaemonError(Exception):
+    pass
+
+
+def _encode(msg):
+    return (json.dumps(msg, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _read_lines(sock):
+    '''
+    Generator of decoded JSON messages received on sock, ends when the peer
+    closes the connection
+    '''
+    f = sock.makefile('rb')
+    try:
+        while True:
+            line = f.readline()
+            if not line:
+                return
+            try:
+                yield json.loads(line.decode('utf-8'))
+            except ValueError:
+                continue
+    finally:
+        f.close()
+
+
+def daemon_running(socket_path=DEFAULT_SOCKET):
+    '''
+    True if a daemon accepts connections on socket_path
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def _feedback(esc):
+    return [esc.get_id(), esc.get_rpm(), esc.get_power(), esc.get_voltage(),
+            esc.get_current(), esc.get_temperature()]
+
+
+class _Client(object):
+    def __init__(self, sock):
+        self.sock       = sock
+        self.outbox     = Queue(CLIENT_OUTBOX)
+        self.fb_period  = 0.0
+        self.fb_next    = 0.0
+        self.commanded  = set()
+        self.writer     = threading.Thread(target=self._write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def send(self, msg):
+        '''
+        Queue msg for the writer thread, never blocks. A client whose outbox
+        is full has stopped reading and is dropped
+        '''
+        try:
+            self.outbox.put_nowait(_encode(msg))
+        except Full:
+            self.drop()
+
+    def _write(self):
+        while True:
+            data = self.outbox.get()
+            if data is None:
+                return
+            try:
+                self.sock.sendall(data)
+            except socket.error:
+                self.drop()
+                return
+
+    def drop(self):
+        # ends the reader loop in EscDaemon._serve_client, which cleans up
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def close(self):
+        self.drop()
+        try:
+            self.outbox.put_nowait(None)
+        except Full:
+            pass   # the writer fails on the shut down socket instead
+        self.writer.join(1.0)
+        self.sock.close()
+
+
+class EscDaemon(object):
+    '''
+    Serve an open EscManager on a Unix domain socket
+    '''
+    def __init__(self, esc_manager, socket_path=DEFAULT_SOCKET, log=None):
+        self.esc_manager = esc_manager
+        self.socket_path = socket_path
+        self.log         = log if log is not None else (lambda msg: None)
+        self.lock        = threading.Lock()   # serializes EscManager calls
+        self.clients     = []
+        self.running     = False
+        self.server      = None
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            if daemon_running(self.socket_path):
+                raise EscDaemonError('an ESC daemon is already running on %s' % self.socket_path)
+            os.unlink(self.socket_path)   # left behind by a daemon that was killed
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # only the owner may connect, the socket can end up in /tmp
+        umask = os.umask(0o077)
+        try:
+            self.server.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        self.server.listen(8)
+        self.running = True
+
+        publisher = threading.Thread(target=self._publish)
+        publisher.daemon = True
+        publisher.start()
+
+        try:
+            while self.running:
+                try:
+                    (sock, addr) = self.server.accept()
+                except socket.error:
+                    if not self.running:
+                        break
+                    raise
+                client = _Client(sock)
+                with self.lock:
+                    self.clients.append(client)
+                t = threading.Thread(target=self._serve_client, args=(client,))
+                t.daemon = True
+                t.start()
+        finally:
+            self.running = False
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        self.running = False
+        if self.server is not None:
+            try:
+                self.server.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.server.close()
+
+    def _serve_client(self, client):
+        self.log('client connected (%d total)' % len(self.clients))
+        try:
+            for msg in _read_lines(client.sock):
+                try:
+                    result = self._dispatch(client, msg)
+                    if 'id' in msg:
+                        client.send({'id': msg['id'], 'ok': True, 'result': result})
+                except Exception as e:
+                    if 'id' in msg:
+                        client.send({'id': msg['id'], 'ok': False, 'error': str(e)})
+        except socket.error:
+            pass
+        finally:
+            with self.lock:
+                self.clients.remove(client)
+                # never leave motors spinning for a client that is gone
+                if client.commanded:
+                    for esc_id in client.commanded:
+                        esc = self.esc_manager.get_esc_by_id(esc_id)
+                        if esc is not None:
+                            esc.set_target_power(0)
+                    self.esc_manager.send_pwm_targets()
+            client.close()
+            self.log('client disconnected (%d total)' % len(self.clients))
+
+    def _params(self, esc_id):
+        if esc_id is None:
+            return self.esc_manager.esc_dummy.params
+        esc = self.esc_manager.get_esc_by_id(esc_id)
+        if esc is None:
+            raise EscDaemonError('no ESC with ID %d' % esc_id)
+        return esc.params
+
+    def _dispatch(self, client, msg):
+        cmd = msg.get('cmd')
+        m = self.esc_manager
+        with self.lock:
+            if cmd == 'send_targets':
+                for (esc_id, value) in msg['targets'].items():
+                    esc = m.get_esc_by_id(int(esc_id))
+                    if esc is None:
+                        continue
+                    if msg['mode'] == 'rpm':
+                        esc.set_target_rpm(value)
+                    else:
+                        esc.set_target_power(value)
+                    client.commanded.add(int(esc_id))
+                for (esc_id, leds) in msg.get('leds', {}).items():
+                    esc = m.get_esc_by_id(int(esc_id))
+                    if esc is not None:
+                        esc.set_leds(leds)
+                if msg['mode'] == 'rpm':
+                    m.send_rpm_targets()
+                else:
+                    m.send_pwm_targets()
+            elif cmd == 'get_escs':
+                return [[e.get_id(), list(e.get_versions())] for e in m.get_escs()]
+            elif cmd == 'subscribe':
+                rate = float(msg.get('rate', FEEDBACK_RATE))
+                client.fb_period = 1.0 / rate if rate > 0 else 0.0
+            elif cmd == 'set_highspeed_fb':
+                m.set_highspeed_fb(msg['esc_id'])
+            elif cmd == 'request_config':
+                if msg['section'] not in CONFIG_REQUESTS:
+                    raise EscDaemonError('unknown config section %s' % msg['section'])
+                # the manager outlives its clients: params read back for an earlier client
+                # may be stale, drop them so that this readback waits for fresh config
+                # packets (params still incomplete from this readback are kept)
+                esc = m.get_esc_by_id(msg['esc_id'])
+                if esc is not None and esc.params.is_valid():
+                    esc.params = type(esc.params)()
+                getattr(m, 'request_config_' + msg['section'])(msg['esc_id'])
+            elif cmd == 'get_params':
+                params = self._params(msg.get('esc_id'))
+                valid = msg.get('esc_id') is None or params.is_valid()
+                result = {'valid': bool(valid)}
+                if valid and msg.get('xml', True):
+                    result['xml'] = params.get_xml_string()
+                if valid and msg.get('bytes', False):
+                    result['bytes'] = base64.b64encode(bytes(params.get_param_bytes_all())).decode('ascii')
+                return result
+            elif cmd == 'load_params':
+                if 'xml' in msg:
+                    m.esc_dummy.params.parse_xml_string(msg['xml'])
+                else:
+                    m.esc_dummy.params.parse_params_all(base64.b64decode(msg['eep']))
+            elif cmd == 'push_config_data':
+                m.push_config_data(msg['packet_type'])
+            elif cmd == 'reset_all':
+                m.reset_all()
+            elif cmd == 'reset_id':
+                m.reset_id(msg['esc_id'])
+            else:
+                raise EscDaemonError('unknown command %s' % cmd)
+        return None
+
+    def _publish(self):
+        while self.running:
+            t_now = time.time()
+            with self.lock:
+                due = [c for c in self.clients if c.fb_period > 0 and t_now >= c.fb_next]
+                periods = [c.fb_period for c in self.clients if c.fb_period > 0]
+                if due:
+                    event = {'event': 'feedback', 'escs': [_feedback(e) for e in self.esc_manager.get_escs()]}
+            if due:
+                for c in due:
+                    c.fb_next = max(c.fb_next + c.fb_period, t_now)
+                    c.send(event)
+            time.sleep(min(periods) / 4.0 if periods else 0.01)
+
+
+class RemoteParams(object):
+    def __init__(self, manager, esc_id):
+        self.manager = manager
+        self.esc_id  = esc_id
+
+    def is_valid(self):
+        return self.manager._call('get_params', esc_id=self.esc_id, xml=False)['valid']
+
+    def get_xml_string(self):
+        return self.manager._call('get_params', esc_id=self.esc_id).get('xml')
+
+    def get_param_bytes_all(self):
+        result = self.manager._call('get_params', esc_id=self.esc_id, xml=False, bytes=True)
+        return base64.b64decode(result['bytes']) if 'bytes' in result else None
+
+    def parse_xml_string(self, xml_string):
+        self.manager._call('load_params', xml=xml_string)
+
+    def parse_params_all(self, param_bytes):
+        self.manager._call('load_params', eep=base64.b64encode(bytes(param_bytes)).decode('ascii'))
+
+
+class RemoteEsc(object):
+    def __init__(self, manager, esc_id, versions=(0, 0)):
+        self.manager  = manager
+        self.esc_id   = esc_id
+        self.versions = list(versions)
+        self.params   = RemoteParams(manager, esc_id)
+        self.target_power = None
+        self.target_rpm   = None
+        self.leds         = None
+
+    def get_id(self):
+        return self.esc_id
+
+    def get_versions(self):
+        return self.versions
+
+    def _fb(self, i):
+        fb = self.manager.feedback.get(self.esc_id)
+        return fb[i] if fb is not None else 0
+
+    def get_rpm(self):
+        return self._fb(1)
+
+    def get_power(self):
+        return self._fb(2)
+
+    def get_voltage(self):
+        return self._fb(3)
+
+    def get_current(self):
+        return self._fb(4)
+
+    def get_temperature(self):
+        return self._fb(5)
+
+    def set_target_power(self, power):
+        self.target_power = power
+
+    def set_target_rpm(self, rpm):
+        self.target_rpm = rpm
+
+    def set_leds(self, leds):
+        self.leds = list(leds)
+
+
+class RemoteEscManager(object):
+    '''
+    EscManager interface backed by an EscDaemon
+    '''
+    def __init__(self):
+        self.sock      = None
+        self.escs      = {}
+        self.feedback  = {}
+        self.responses = Queue()
+        self.call_lock = threading.Lock()
+        self.next_id   = 0
+        self.esc_dummy = RemoteEsc(self, None)
+
+    def open(self, socket_path=DEFAULT_SOCKET, feedback_rate=FEEDBACK_RATE):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except socket.error as e:
+            self.sock.close()
+            self.sock = None
+            raise EscDaemonError('unable to connect to ESC daemon at %s: %s' % (socket_path, e))
+        self.reader = threading.Thread(target=self._read)
+        self.reader.daemon = True
+        self.reader.start()
+        if feedback_rate > 0:
+            self._call('subscribe', rate=feedback_rate)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.reader.join(1.0)
+            self.sock.close()
+            self.sock = None
+
+    def _read(self):
+        try:
+            for msg in _read_lines(self.sock):
+                if msg.get('event') == 'feedback':
+                    for fb in msg['escs']:
+                        self.feedback[fb[0]] = fb
+                else:
+                    self.responses.put(msg)
+        except (socket.error, ValueError):
+            pass
+        self.responses.put(None)
+
+    def _send(self, msg):
+        if self.sock is None:
+            raise EscDaemonError('not connected to ESC daemon')
+        self.sock.sendall(_encode(msg))
+
+    def _call(self, cmd, **kwargs):
+        with self.call_lock:
+            self.next_id += 1
+            kwargs.update(cmd=cmd, id=self.next_id)
+            self._send(kwargs)
+            while True:
+                try:
+                    msg = self.responses.get(timeout=CALL_TIMEOUT)
+                except Empty:
+                    raise EscDaemonError('no response from ESC daemon to %s' % cmd)
+                if msg is None:
+                    raise EscDaemonError('connection to ESC daemon lost')
+                if msg.get('id') == self.next_id:
+                    break
+            if not msg['ok']:
+                raise EscDaemonError(msg['error'])
+            return msg['result']
+
+    def get_escs(self):
+        escs = []
+        for (esc_id, versions) in self._call('get_escs'):
+            if esc_id not in self.escs:
+                self.escs[esc_id] = RemoteEsc(self, esc_id, versions)
+            self.escs[esc_id].versions = versions
+            escs.append(self.escs[esc_id])
+        return escs
+
+    def get_esc_by_id(self, esc_id):
+        if esc_id not in self.escs:
+            self.get_escs()
+        return self.escs.get(esc_id)
+
+    def set_highspeed_fb(self, esc_id):
+        self._call('set_highspeed_fb', esc_id=esc_id)
+
+    def _send_targets(self, mode, attr):
+        targets = dict((str(i), getattr(e, attr)) for (i, e) in self.escs.items() if getattr(e, attr) is not None)
+        leds = dict((str(i), e.leds) for (i, e) in self.escs.items() if e.leds is not None)
+        self._send({'cmd': 'send_targets', 'mode': mode, 'targets': targets, 'leds': leds})
+
+    def send_pwm_targets(self):
+        self._send_targets('pwm', 'target_power')
+
+    def send_rpm_targets(self):
+        self._send_targets('rpm', 'target_rpm')
+
+    def request_config_id(self, esc_id):
+        self._call('request_config', esc_id=esc_id, section='id')
+
+    def request_config_board(self, esc_id):
+        self._call('request_config', esc_id=esc_id, section='board')
+
+    def request_config_uart(self, esc_id):
+        self._call('request_config', esc_id=esc_id, section='uart')
+
+    def request_config_tune(self, esc_id):
+        self._call('request_config', esc_id=esc_id, section='tune')
+
+    def push_config_data(self, packet_type):
+        self._call('push_config_data', packet_type=packet_type)
+
+    def reset_all(self):
+        self._call('reset_all')
+
+    def reset_id(self, esc_id):
+        self._call('reset_id', esc_id=esc_id)
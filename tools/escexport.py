@@ -0,0 +1,312 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Live telemetry export for dashboards. Like the display, the exporter is
+# fed with push() from the command loop, which only appends the sample to a
+# bounded buffer; a separate thread does all the work:
+#
+# - UDP stream at full rate: every sample is sent, batched into one datagram
+#   per wakeup. Every datagram starts with a one byte format tag (UDP_TAGS).
+#   Binary datagrams ('B') continue with a sequence of records in the layout
+#   of the record files (escrecord.RECORD_FORMAT), JSON datagrams ('J') with
+#   one JSON object per line with the fields of escrecord.RECORD_FIELDS.
+# - HTTP endpoint (/metrics, Prometheus text format, or /metrics.json) with
+#   gauges averaged over the last metrics period and cumulative counters.
+
+import sys
+import json
+import time
+import socket
+import struct
+import threading
+from collections import deque
+
+from escloop import monotonic
+from escrecord import RECORD_FORMAT, RECORD_FIELDS
+
+UDP_FORMATS     = ['json', 'binary']
+UDP_TAGS        = {'json': b'J', 'binary': b'B'}   # first byte of every datagram
+MAX_DATAGRAM    = 1400     # bytes, keep datagrams below a typical MTU
+EXPORT_PERIOD   = 0.02     # seconds between wakeups of the export thread
+METRICS_PERIOD  = 1.0      # seconds, averaging period of the HTTP gauges
+HTTP_POLL_INTERVAL = 0.05  # seconds, bounds the time stop() waits for the HTTP server
+GAUGE_FIELDS    = ['command', 'rpm', 'power', 'voltage', 'current', 'temperature']
+
+
+def parse_address(address, default_host='127.0.0.1'):
+    '''
+    'host:port' or 'port' -> (host, port)
+    '''
+    if ':' in address:
+        (host, port) = address.rsplit(':', 1)
+    else:
+        (host, port) = (default_host, address)
+    return (host or default_host, int(port))
+
+
+def encode_samples(rows, udp_format):
+    '''
+    Encode rows (tuples in RECORD_FIELDS order) into datagrams of at most
+    MAX_DATAGRAM bytes, each starting with the tag of udp_format
+    '''
+    tag = UDP_TAGS[udp_format]
+    if udp_format == 'binary':
+        size = struct.calcsize(RECORD_FORMAT)
+        per_datagram = max(1, (MAX_DATAGRAM - len(tag)) // size)
+        return [tag + b''.join(struct.pack(RECORD_FORMAT, *r) for r in rows[i:i+per_datagram])
+                for i in range(0, len(rows), per_datagram)]
+    datagrams = []
+    lines = []
+    size = len(tag)
+    for r in rows:
+        d = dict(zip(RECORD_FIELDS, r))
+        if d['command'] != d['command']:   # nan is not valid JSON
+            d['command'] = None
+        line = json.dumps(d, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        if lines and size + len(line) + 1 > MAX_DATAGRAM:
+            datagrams.append(tag + b'\n'.join(lines))
+            lines = []
+            size = len(tag)
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        datagrams.append(tag + b'\n'.join(lines))
+    return datagrams
+
+
+def decode_datagram(data):
+    '''
+    Inverse of encode_samples(): list of dicts with the RECORD_FIELDS keys.
+    Raises ValueError for datagrams with an unknown tag or a bad payload
+    '''
+    (tag, payload) = (data[:1], data[1:])
+    if tag == UDP_TAGS['json']:
+        return [json.loads(line.decode('utf-8')) for line in payload.split(b'\n') if line]
+    if tag == UDP_TAGS['binary']:
+        size = struct.calcsize(RECORD_FORMAT)
+        if len(payload) % size:
+            raise ValueError('binary datagram of %d bytes is not a multiple of the record size' % len(payload))
+        return [dict(zip(RECORD_FIELDS, struct.unpack_from(RECORD_FORMAT, payload, i)))
+                for i in range(0, len(payload), size)]
+    raise ValueError('unknown datagram format tag %r' % tag)
+
+
+class TelemetryExporter(object):
+    '''
+    Export telemetry samples over UDP (udp_target = (host, port)) and / or
+    HTTP (http_address = (host, port)). push() never blocks; samples are
+    dropped (and counted) if the export thread falls behind.
+    '''
+    def __init__(self, udp_target=None, udp_format='json', http_address=None,
+                 metrics_period=METRICS_PERIOD, max_samples=4096):
+        if udp_format not in UDP_FORMATS:
+            raise ValueError('unknown UDP format %s' % udp_format)
+        self.udp_target   = udp_target
+        self.udp_format   = udp_format
+        self.http_address = http_address
+        self.metrics_period = metrics_period
+        self.samples      = deque(maxlen=max_samples)
+        self.time_offset  = time.time() - monotonic()
+        self.stop_event   = threading.Event()
+        self.lock         = threading.Lock()
+        self.thread       = None
+        self.udp_socket   = None
+        self.http_server  = None
+
+        # counters (cumulative) and gauges (averaged over the last metrics period)
+        self.counters = {'samples_pushed': 0, 'samples_dropped': 0, 'samples_exported': 0,
+                         'udp_datagrams': 0, 'udp_errors': 0}
+        self.esc_samples = {}
+        self.gauges      = {}
+        self.sums        = {}
+        self.t_metrics   = monotonic()
+
+    def start(self):
+        if self.udp_target is not None:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.setblocking(False)
+        if self.http_address is not None:
+            self.http_server = _make_http_server(self.http_address, self)
+            t = threading.Thread(target=self.http_server.serve_forever, args=(HTTP_POLL_INTERVAL,))
+            t.daemon = True
+            t.start()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+        if self.udp_socket is not None:
+            self.udp_socket.close()
+            self.udp_socket = None
+
+    def push(self, sample, command=float('nan')):
+        if len(self.samples) == self.samples.maxlen:
+            self.counters['samples_dropped'] += 1
+        self.counters['samples_pushed'] += 1
+        self.samples.append((sample, command))
+
+    def _run(self):
+        while not self.stop_event.wait(EXPORT_PERIOD):
+            self._export()
+        self._export()
+
+    def _export(self):
+        rows = []
+        while True:
+            try:
+                (s, command) = self.samples.popleft()
+            except IndexError:
+                break
+            rows.append((s.t + self.time_offset, s.esc_id, command, s.rpm, s.power,
+                         s.voltage, s.current, s.temperature))
+
+        if rows and self.udp_socket is not None:
+            for datagram in encode_samples(rows, self.udp_format):
+                try:
+                    self.udp_socket.sendto(datagram, self.udp_target)
+                    self.counters['udp_datagrams'] += 1
+                except socket.error:
+                    self.counters['udp_errors'] += 1
+
+        with self.lock:
+            self.counters['samples_exported'] += len(rows)
+            for r in rows:
+                esc_id = r[1]
+                self.esc_samples[esc_id] = self.esc_samples.get(esc_id, 0) + 1
+                sums = self.sums.setdefault(esc_id, [0] + [0.0] * len(GAUGE_FIELDS))
+                sums[0] += 1
+                for (i, value) in enumerate(r[2:]):
+                    if value == value:
+                        sums[i + 1] += value
+            t_now = monotonic()
+            if t_now - self.t_metrics >= self.metrics_period:
+                for (esc_id, sums) in self.sums.items():
+                    if sums[0] > 0:
+                        self.gauges[esc_id] = dict((f, sums[i + 1] / sums[0]) for (i, f) in enumerate(GAUGE_FIELDS))
+                self.sums = {}
+                self.t_metrics = t_now
+
+    def snapshot(self):
+        with self.lock:
+            return {'counters'    : dict(self.counters),
+                    'esc_samples' : dict((str(k), v) for (k, v) in self.esc_samples.items()),
+                    'gauges'      : dict((str(k), dict(v)) for (k, v) in self.gauges.items())}
+
+    def format_metrics(self):
+        '''
+        Metrics in the Prometheus text exposition format
+        '''
+        snap = self.snapshot()
+        lines = []
+        for (name, value) in sorted(snap['counters'].items()):
+            lines.append('# TYPE voxl_esc_%s_total counter' % name)
+            lines.append('voxl_esc_%s_total %d' % (name, value))
+        lines.append('# TYPE voxl_esc_esc_samples_total counter')
+        for (esc_id, value) in sorted(snap['esc_samples'].items()):
+            lines.append('voxl_esc_esc_samples_total{esc_id="%s"} %d' % (esc_id, value))
+        for field in GAUGE_FIELDS:
+            lines.append('# TYPE voxl_esc_%s gauge' % field)
+            for (esc_id, gauges) in sorted(snap['gauges'].items()):
+                lines.append('voxl_esc_%s{esc_id="%s"} %g' % (field, esc_id, gauges[field]))
+        return '\n'.join(lines) + '\n'
+
+
+def _make_http_server(address, exporter):
+    try:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    except ImportError:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                (body, content_type) = (exporter.format_metrics(), 'text/plain; version=0.0.4')
+            elif self.path == '/metrics.json':
+                (body, content_type) = (json.dumps(exporter.snapshot(), sort_keys=True), 'application/json')
+            else:
+                self.send_error(404)
+                return
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return HTTPServer(address, MetricsHandler)
+
+
+def add_export_args(parser):
+    '''
+    Export options shared by the tools that read telemetry
+    '''
+    parser.add_argument('--udp',         type=str, required=False, default=None)  # host:port to stream samples to
+    parser.add_argument('--udp-format',  type=str, required=False, default='json', choices=UDP_FORMATS)
+    parser.add_argument('--http-port',   type=str, required=False, default=None)  # [host:]port of the metrics endpoint
+
+
+def open_exporter(args):
+    '''
+    Start a TelemetryExporter as requested by the add_export_args() options,
+    None if no export was requested
+    '''
+    if args.udp is None and args.http_port is None:
+        return None
+    try:
+        udp_target   = parse_address(args.udp) if args.udp is not None else None
+        http_address = parse_address(args.http_port) if args.http_port is not None else None
+    except ValueError:
+        print('ERROR: Export addresses must be given as [host:]port')
+        sys.exit(1)
+    try:
+        exporter = TelemetryExporter(udp_target, args.udp_format, http_address).start()
+    except socket.error as e:
+        print('ERROR: Could not start telemetry export: ' + str(e))
+        sys.exit(1)
+    if udp_target is not None:
+        print('INFO: Streaming telemetry (%s) to %s:%d' % (args.udp_format, udp_target[0], udp_target[1]))
+    if http_address is not None:
+        print('INFO: Serving metrics on http://%s:%d/metrics' % http_address)
+    return exporter
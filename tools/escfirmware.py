@@ -0,0 +1,125 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Local cache of the firmware image last flashed to each ESC, used by
+# voxl-esc-upload-firmware.py --trust-cache. For every adapter (see
+# esccache.get_adapter_keys) and ESC ID we remember the image digest and the
+# firmware versions the ESC reported after booting that image.
+#
+# Delta flashing is not possible with this bootloader: libesc uploads the
+# whole image and exposes neither a page write nor a readback or CRC of the
+# flash, and the ESCs report no unique board id. A cache entry therefore only
+# says what was last flashed to an ID through this adapter; skipping an ESC
+# because of it is left to the user (--trust-cache).
+#
+# flash_escs() runs the update itself. Every ESC is reset into its bootloader
+# right before its own upload: the bootloader only waits a short time for the
+# host before booting the firmware again, so ESCs reset up front would have
+# left their bootloader by the time their turn comes.
+
+import time
+import hashlib
+
+import esccache
+import escprotocol as proto
+
+FIRMWARE_CACHE_FILE = 'firmware.json'
+RESET_DELAY = 0.25   # seconds between resetting an ESC and talking to its bootloader
+
+
+def image_digest(image):
+    return hashlib.sha1(bytearray(image)).hexdigest()
+
+
+class FirmwareCache(object):
+    def __init__(self, devpath):
+        self.key   = esccache.get_adapter_keys([devpath])[devpath]
+        self.cache = esccache.load_json(FIRMWARE_CACHE_FILE, {})
+
+    def get(self, esc_id):
+        return self.cache.get(self.key, {}).get(str(esc_id))
+
+    def put(self, esc_id, image, versions):
+        self.cache.setdefault(self.key, {})[str(esc_id)] = {
+            'digest'   : image_digest(image),
+            'size'     : len(image),
+            'versions' : list(versions) if versions is not None else None,
+        }
+
+    def forget(self, esc_id):
+        self.cache.get(self.key, {}).pop(str(esc_id), None)
+
+    def save(self):
+        esccache.save_json(FIRMWARE_CACHE_FILE, self.cache)
+
+    def is_current(self, esc_id, image, versions):
+        '''
+        True if image was the last one flashed to esc_id through this adapter
+        and the ESC still reports the versions it had after that flash. This
+        can not detect a swapped or externally reflashed board with the same
+        versions
+        '''
+        entry = self.get(esc_id)
+        return (entry is not None and entry['versions'] is not None and versions is not None and
+                entry['digest'] == image_digest(image) and entry['versions'] == list(versions))
+
+
+def flash_escs(esc_manager, image, flash_ids, reset_ids, firmware_baud_rate, bootloader_baud_rate,
+               reset_delay=RESET_DELAY, progress=None):
+    '''
+    Flash image to the ESCs in flash_ids, one after another. ESCs in
+    reset_ids are reset into their bootloader right before their upload (the
+    others are expected to be in the bootloader already, e.g. after a manual
+    power cycle). progress(esc_id, fraction) is called during each upload.
+    Returns a list of (esc_id, success, seconds)
+    '''
+    results = []
+    for esc_id in flash_ids:
+        if esc_id in reset_ids and firmware_baud_rate is not None:
+            esc_manager.set_protocol(proto.ESC_PROTOCOL_FIRMWARE)
+            esc_manager.set_baudrate(firmware_baud_rate)
+            esc_manager.reset_id(esc_id)
+            time.sleep(reset_delay)
+        esc_manager.set_protocol(proto.ESC_PROTOCOL_BOOTLOADER)
+        esc_manager.set_baudrate(bootloader_baud_rate)
+
+        t_start = time.time()
+        success = True
+        for fraction in esc_manager.upload_firmware(image, esc_id):
+            if fraction == -1:
+                success = False
+                break
+            if progress is not None:
+                progress(esc_id, fraction)
+        results.append((esc_id, success, time.time() - t_start))
+    return results
@@ -0,0 +1,137 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Fixed rate loop scheduling for the ESC tools. Deadlines are absolute
+# (start + n * period) on a monotonic clock, so time spent sending commands
+# and printing inside the loop does not accumulate into the command period.
+
+import sys
+import time
+import math
+from array import array
+
+
+def _get_monotonic():
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    if sys.platform.startswith('linux'):
+        try:
+            import ctypes
+            import ctypes.util
+
+            class timespec(ctypes.Structure):
+                _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+            librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+            clock_gettime = librt.clock_gettime
+            clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+            CLOCK_MONOTONIC = 1
+            ts = timespec()
+
+            def monotonic():
+                clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(ts))
+                return ts.tv_sec + ts.tv_nsec * 1e-9
+            monotonic()
+            return monotonic
+        except (OSError, AttributeError):
+            pass
+    return time.time
+
+monotonic = _get_monotonic()
+
+
+def percentile(sorted_values, p):
+    if len(sorted_values) == 0:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo = int(math.floor(k))
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class RateLoop(object):
+    '''
+    Fixed rate loop with absolute deadlines. Call wait() at the top of every
+    iteration; it sleeps until the next deadline and records how late the
+    wakeup was. If an iteration overruns by more than a full period, the
+    missed deadlines are skipped (counted as overruns) instead of bursting
+    commands to catch up.
+    '''
+    def __init__(self, rate_hz):
+        if rate_hz <= 0:
+            raise ValueError('loop rate must be positive')
+        self.rate_hz    = float(rate_hz)
+        self.period     = 1.0 / self.rate_hz
+        self.t_start    = monotonic()
+        self.t_next     = self.t_start
+        self.iterations = 0
+        self.overruns   = 0
+        self.lateness   = array('d')   # wakeup time - deadline, seconds
+
+    def elapsed(self):
+        return monotonic() - self.t_start
+
+    def wait(self):
+        self.t_next += self.period
+        t_now = monotonic()
+        if self.t_next > t_now:
+            time.sleep(self.t_next - t_now)
+            t_now = monotonic()
+        late = t_now - self.t_next
+        self.lateness.append(late)
+        if late > self.period:
+            missed = int(late / self.period)
+            self.overruns += missed
+            self.t_next   += missed * self.period
+        self.iterations += 1
+        return t_now
+
+    def get_stats(self):
+        elapsed = self.elapsed()
+        lateness = sorted(self.lateness)
+        return {
+            'rate_hz'          : self.rate_hz,
+            'achieved_rate_hz' : self.iterations / elapsed if elapsed > 0 else 0.0,
+            'iterations'       : self.iterations,
+            'overruns'         : self.overruns,
+            'jitter_p50_ms'    : percentile(lateness, 50) * 1000.0,
+            'jitter_p99_ms'    : percentile(lateness, 99) * 1000.0,
+            'jitter_max_ms'    : (lateness[-1] if lateness else 0.0) * 1000.0,
+        }
+
+    def summary(self):
+        s = self.get_stats()
+        return ['Loop rate: %.1f Hz (target %.1f Hz), %d iterations, %d overruns' % (
+                    s['achieved_rate_hz'], s['rate_hz'], s['iterations'], s['overruns']),
+                'Loop jitter: p50 %.3f ms, p99 %.3f ms, max %.3f ms' % (
+                    s['jitter_p50_ms'], s['jitter_p99_ms'], s['jitter_max_ms'])]
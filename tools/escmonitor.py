@@ -0,0 +1,250 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Link health monitor. libesc talks to the ESCs through pyserial; the monitor
+# taps serial.Serial.write() / read() and runs both directions through the
+# packet parser of escprotocol, so it sees exactly what is on the wire:
+#
+# - packets sent and received per packet type and per ESC ID
+# - crc and framing errors and dropped bytes in the received stream
+# - feedback requests (the feedback ID byte of PWM / RPM commands) that were
+#   not answered before the next request for the same ESC
+# - command to feedback latency: time from sending a command that requests
+#   feedback from an ESC until that ESC's feedback packet has been read
+# - feedback age: how old the latest feedback of an ESC is when the tool
+#   reads its values (call feedback_read() next to get_rpm() and friends)
+
+import threading
+from array import array
+
+import escprotocol as proto
+from escloop import monotonic, percentile
+
+LATENCY_BINS_MS = [0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0]
+
+COMMAND_TYPES = (proto.ESC_PACKET_TYPE_PWM_CMD, proto.ESC_PACKET_TYPE_RPM_CMD)
+
+
+def packet_esc_id(packet_type, payload):
+    '''
+    ESC ID a packet is addressed to / comes from, None for broadcasts
+    '''
+    payload = bytearray(payload)
+    if packet_type in COMMAND_TYPES:
+        return proto.parse_commands(payload)[2]
+    if packet_type == proto.ESC_PACKET_TYPE_FB_RESPONSE:
+        return payload[0] >> 4 if payload else None
+    if packet_type in proto.CONFIG_REQUESTS or packet_type in proto.CONFIG_REQUESTS.values() or \
+            packet_type == proto.ESC_PACKET_TYPE_VERSION_RESPONSE:
+        return payload[0] if payload and payload[0] != 0xFF else None
+    return None
+
+
+def histogram(sorted_values, bins=LATENCY_BINS_MS):
+    '''
+    Count sorted values (ms) per bin: [(upper edge or None, count), ...]
+    '''
+    counts = []
+    i = 0
+    for edge in bins:
+        n = 0
+        while i < len(sorted_values) and sorted_values[i] < edge:
+            n += 1
+            i += 1
+        counts.append((edge, n))
+    counts.append((None, len(sorted_values) - i))
+    return counts
+
+
+class LinkMonitor(object):
+    '''
+    Tap the serial traffic of this process. install() patches serial.Serial,
+    so it also covers ports that are already open; traffic is only counted
+    between install() and uninstall().
+    '''
+    def __init__(self):
+        self.lock        = threading.Lock()
+        self.tx_parser   = proto.PacketParser()
+        self.rx_parser   = proto.PacketParser()
+        self.tx_bytes    = 0
+        self.rx_bytes    = 0
+        self.tx_packets  = {}      # packet type -> count
+        self.rx_packets  = {}
+        self.tx_ids      = {}      # esc id -> packets addressed to it
+        self.rx_ids      = {}      # esc id -> packets received from it
+        self.fb_requests = {}      # esc id -> feedback requests
+        self.fb_missed   = {}      # esc id -> requests without a response
+        self.fb_pending  = {}      # esc id -> time of the unanswered request
+        self.fb_last     = {}      # esc id -> time of the latest feedback
+        self.latency     = {}      # esc id -> array of command to feedback latencies, seconds
+        self.age         = {}      # esc id -> array of feedback ages at read time, seconds
+        self.t_start     = None
+        self.t_stop      = None
+        self.patched     = None
+
+    def install(self):
+        '''
+        Returns False if pyserial is not available
+        '''
+        try:
+            import serial
+        except ImportError:
+            return False
+        cls = serial.Serial
+        (orig_write, orig_read) = (cls.write, cls.read)
+        monitor = self
+
+        def write(port, data):
+            n = orig_write(port, data)
+            monitor.on_write(data)
+            return n
+
+        def read(port, *args, **kwargs):
+            data = orig_read(port, *args, **kwargs)
+            if data:
+                monitor.on_read(data)
+            return data
+
+        cls.write = write
+        cls.read  = read
+        self.patched = (cls, orig_write, orig_read)
+        self.t_start = monotonic()
+        return True
+
+    def uninstall(self):
+        if self.patched is not None:
+            (cls, cls.write, cls.read) = self.patched
+            self.patched = None
+            self.t_stop = monotonic()
+
+    def on_write(self, data):
+        t_now = monotonic()
+        with self.lock:
+            self.tx_bytes += len(data)
+            for (packet_type, payload) in self.tx_parser.feed(data):
+                self.tx_packets[packet_type] = self.tx_packets.get(packet_type, 0) + 1
+                esc_id = packet_esc_id(packet_type, payload)
+                if esc_id is None:
+                    continue
+                self.tx_ids[esc_id] = self.tx_ids.get(esc_id, 0) + 1
+                if packet_type in COMMAND_TYPES:
+                    self.fb_requests[esc_id] = self.fb_requests.get(esc_id, 0) + 1
+                    if esc_id in self.fb_pending:
+                        self.fb_missed[esc_id] = self.fb_missed.get(esc_id, 0) + 1
+                    self.fb_pending[esc_id] = t_now
+
+    def on_read(self, data):
+        t_now = monotonic()
+        with self.lock:
+            self.rx_bytes += len(data)
+            for (packet_type, payload) in self.rx_parser.feed(data):
+                self.rx_packets[packet_type] = self.rx_packets.get(packet_type, 0) + 1
+                esc_id = packet_esc_id(packet_type, payload)
+                if esc_id is None:
+                    continue
+                self.rx_ids[esc_id] = self.rx_ids.get(esc_id, 0) + 1
+                if packet_type == proto.ESC_PACKET_TYPE_FB_RESPONSE:
+                    self.fb_last[esc_id] = t_now
+                    t_request = self.fb_pending.pop(esc_id, None)
+                    if t_request is not None:
+                        self.latency.setdefault(esc_id, array('d')).append(t_now - t_request)
+
+    def feedback_read(self, esc_id, t_now=None):
+        '''
+        The tool is about to use the feedback values of esc_id
+        '''
+        if t_now is None:
+            t_now = monotonic()
+        with self.lock:
+            t_fb = self.fb_last.get(esc_id)
+            if t_fb is not None:
+                self.age.setdefault(esc_id, array('d')).append(max(0.0, t_now - t_fb))
+
+    def get_stats(self):
+        with self.lock:
+            t_end   = self.t_stop if self.t_stop is not None else monotonic()
+            elapsed = t_end - self.t_start if self.t_start is not None else 0.0
+            stats = {
+                'elapsed'        : elapsed,
+                'tx_bytes'       : self.tx_bytes,
+                'rx_bytes'       : self.rx_bytes,
+                'tx_packets'     : dict((proto.PACKET_TYPE_NAMES.get(k, str(k)), v) for (k, v) in self.tx_packets.items()),
+                'rx_packets'     : dict((proto.PACKET_TYPE_NAMES.get(k, str(k)), v) for (k, v) in self.rx_packets.items()),
+                'crc_errors'     : self.rx_parser.crc_errors,
+                'framing_errors' : self.rx_parser.framing_errors,
+                'bytes_dropped'  : self.rx_parser.bytes_dropped,
+                'escs'           : {},
+            }
+            for esc_id in sorted(set(self.tx_ids) | set(self.rx_ids)):
+                latency = sorted(v * 1000.0 for v in self.latency.get(esc_id, []))
+                age     = sorted(v * 1000.0 for v in self.age.get(esc_id, []))
+                num_fb  = len(self.latency.get(esc_id, []))
+                stats['escs'][esc_id] = {
+                    'tx_packets'      : self.tx_ids.get(esc_id, 0),
+                    'rx_packets'      : self.rx_ids.get(esc_id, 0),
+                    'fb_requests'     : self.fb_requests.get(esc_id, 0),
+                    'fb_missed'       : self.fb_missed.get(esc_id, 0),
+                    'fb_rate_hz'      : num_fb / elapsed if elapsed > 0 else 0.0,
+                    'latency_p50_ms'  : percentile(latency, 50),
+                    'latency_p99_ms'  : percentile(latency, 99),
+                    'latency_max_ms'  : latency[-1] if latency else 0.0,
+                    'latency_histogram' : histogram(latency),
+                    'age_p50_ms'      : percentile(age, 50),
+                    'age_p99_ms'      : percentile(age, 99),
+                    'age_max_ms'      : age[-1] if age else 0.0,
+                }
+        return stats
+
+    def summary(self):
+        s = self.get_stats()
+        lines = ['Link: %.1f s, sent %d bytes (%.0f B/s), received %d bytes (%.0f B/s)' % (
+                    s['elapsed'], s['tx_bytes'], s['tx_bytes'] / max(s['elapsed'], 1e-9),
+                    s['rx_bytes'], s['rx_bytes'] / max(s['elapsed'], 1e-9)),
+                 'Link errors: %d crc, %d framing, %d bytes dropped' % (
+                    s['crc_errors'], s['framing_errors'], s['bytes_dropped']),
+                 'Packets sent: ' + (', '.join('%s %d' % kv for kv in sorted(s['tx_packets'].items())) or 'none'),
+                 'Packets received: ' + (', '.join('%s %d' % kv for kv in sorted(s['rx_packets'].items())) or 'none')]
+        for (esc_id, e) in sorted(s['escs'].items()):
+            lines.append('[%d] sent %d, received %d, feedback %.1f Hz, %d of %d requests unanswered' % (
+                esc_id, e['tx_packets'], e['rx_packets'], e['fb_rate_hz'], e['fb_missed'], e['fb_requests']))
+            lines.append('[%d] cmd->fb latency: p50 %.2f ms, p99 %.2f ms, max %.2f ms; feedback age: p50 %.2f ms, p99 %.2f ms, max %.2f ms' % (
+                esc_id, e['latency_p50_ms'], e['latency_p99_ms'], e['latency_max_ms'],
+                e['age_p50_ms'], e['age_p99_ms'], e['age_max_ms']))
+            bins = e['latency_histogram']
+            while bins and bins[-1][1] == 0:
+                bins = bins[:-1]
+            if bins:
+                lines.append('[%d] latency histogram: %s' % (esc_id, ', '.join(
+                    ('<%g ms: %d' % (edge, n)) if edge is not None else ('more: %d' % n)
+                    for (edge, n) in bins)))
+        return lines
@@ -0,0 +1,353 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Helpers for reading ESC params XML files without going through libesc.
+# Packing params into bytes for the ESC is done by libesc (params_from_xml);
+# the helpers here only look at the param names and values in the file.
+#
+# ParamsIndex maps a hash of the packed param bytes of every XML file in the
+# params tree (including vehicle subdirectories) to the file paths, so that
+# matching the params read back from an ESC is a single lookup. The index is
+# kept in the tool cache and entries are refreshed when a file's mtime or size
+# changes, or when libesc (which packs the params) is updated.
+#
+# Packing an XML file is cached as well: load_compiled() keeps the packed
+# bytes (the .eep format) in the tool cache under the hash of the XML text,
+# so uploading or indexing an unchanged file skips parsing and validating it.
+
+import os
+import re
+import hashlib
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+import esccache
+
+PARAMS_INDEX_FILE = 'params-index.json'
+COMPILED_DIR      = 'eep'
+
+PARAMS_SECTIONS = ['IdParams', 'BoardParams', 'UartParams', 'TuneParams']
+
+
+def read_params_fields(xml_string):
+    '''
+    Return an OrderedDict of section name -> OrderedDict(param name -> value string)
+    for an ESC params XML document
+    '''
+    root = ET.fromstring(xml_string)
+    fields = OrderedDict()
+    for section in root:
+        if not isinstance(section.tag, str):
+            continue  # comments
+        values = OrderedDict()
+        for param in section.findall('param'):
+            values[param.get('name')] = param.get('value')
+        fields[section.tag] = values
+    return fields
+
+
+def read_params_file(params_file):
+    with open(params_file, 'r') as f:
+        return read_params_fields(f.read())
+
+
+def get_param(fields, name, default=None):
+    '''
+    Look up a numeric param by name in any section
+    '''
+    for values in fields.values():
+        if name in values:
+            value = values[name]
+            try:
+                return int(value)
+            except ValueError:
+                return float(value)
+    return default
+
+
+def update_params_xml(xml_string, updates):
+    '''
+    Return xml_string with the values of the params in updates (dict name ->
+    value) replaced. Formatting and comments of the file are kept.
+    '''
+    for (name, value) in updates.items():
+        pattern = r'(<param\s+name="%s"\s+value=")[^"]*(")' % re.escape(name)
+        if re.search(pattern, xml_string) is None:
+            raise KeyError('param %s not found' % name)
+        xml_string = re.sub(pattern, lambda m: m.group(1) + str(value) + m.group(2), xml_string)
+    return xml_string
+
+
+def flatten_fields(fields):
+    flat = {}
+    for values in fields.values():
+        flat.update(values)
+    return flat
+
+
+def _same_value(a, b):
+    if a == b:
+        return True
+    try:
+        fa = float(a)
+        fb = float(b)
+    except (TypeError, ValueError):
+        return a is not None and b is not None and a.replace(' ', '') == b.replace(' ', '')
+    return abs(fa - fb) <= 1e-6 * max(1.0, abs(fa), abs(fb))
+
+
+def diff_fields(flat_a, flat_b):
+    '''
+    Return the sorted list of param names whose values differ between two flattened param sets
+    '''
+    names = set(flat_a) | set(flat_b)
+    return sorted(n for n in names if not _same_value(flat_a.get(n), flat_b.get(n)))
+
+
+def params_digest(param_bytes):
+    return hashlib.sha1(bytearray(param_bytes)).hexdigest()
+
+
+# allowed values, from the ranges documented in the params files
+PARAM_RANGES = {
+    'dir'            : (0, 3),
+    'min_pwm'        : (0, 999),
+    'max_pwm'        : (0, 999),
+    'max_kpe'        : (0, 999),
+    'max_kie'        : (0, 999),
+    'latch_power'    : (0, 999),
+    'spinup_power'   : (0, 2000),
+    'tone_freqs_10hz': (0, 255),
+    'tone_powers'    : (0, 255),
+    'num_cycles_per_rev' : (1, 100),
+}
+PARAM_CHOICES = {
+    'id'             : list(range(8)) + [127],
+    'pwm_frequency'  : [24000, 48000],
+}
+# (lower, upper): lower must not exceed upper
+PARAM_ORDER = [('min_rpm', 'max_rpm'), ('min_pwm', 'max_pwm'), ('min_dt_ns', 'max_dt_ns')]
+
+
+def _param_numbers(value):
+    '''
+    Param value string -> list of numbers ('[1, 2]' or '3'), ValueError if not numeric
+    '''
+    value = value.strip()
+    if value.startswith('[') and value.endswith(']'):
+        return [float(v) for v in value[1:-1].split(',') if v.strip()]
+    return [float(value)]
+
+
+def validate_params_fields(fields):
+    '''
+    Return a list of problems with a params file (as returned by
+    read_params_fields): missing sections, non-numeric values and values
+    outside the documented ranges
+    '''
+    problems = ['missing section %s' % name for name in PARAMS_SECTIONS if name not in fields]
+    numbers = {}
+    for values in fields.values():
+        for (name, value) in values.items():
+            try:
+                numbers[name] = _param_numbers(value or '')
+            except ValueError:
+                problems.append('%s: value "%s" is not numeric' % (name, value))
+                continue
+            if name in PARAM_RANGES:
+                (lo, hi) = PARAM_RANGES[name]
+                if any(v < lo or v > hi for v in numbers[name]):
+                    problems.append('%s: %s is outside %g..%g' % (name, value, lo, hi))
+            if name in PARAM_CHOICES and any(v not in PARAM_CHOICES[name] for v in numbers[name]):
+                problems.append('%s: %s is not one of %s' % (name, value, ', '.join('%g' % c for c in PARAM_CHOICES[name])))
+    for (lower, upper) in PARAM_ORDER:
+        if lower in numbers and upper in numbers and numbers[lower][0] > numbers[upper][0]:
+            problems.append('%s is larger than %s' % (lower, upper))
+    return problems
+
+
+def xml_digest(xml_string):
+    if not isinstance(xml_string, bytes):
+        xml_string = xml_string.encode('utf-8')
+    return hashlib.sha1(xml_string).hexdigest()
+
+
+def compile_params(xml_string):
+    '''
+    Pack an XML params document into the bytes sent to the ESCs (.eep format)
+    '''
+    from libesc import params_from_xml
+    params = params_from_xml(xml_string)
+    if not params.is_valid():
+        raise ValueError('params could not be parsed')
+    return bytes(bytearray(params.get_param_bytes_all()))
+
+
+def _compiler_tag():
+    '''
+    Identifies the libesc build that packs the params, so that a libesc
+    update does not reuse bytes packed by the previous version
+    '''
+    import libesc
+    path = getattr(libesc, '__file__', None)
+    return '%s-%d' % (getattr(libesc, '__version__', ''), int(os.path.getmtime(path)) if path else 0)
+
+
+def load_compiled(xml_string):
+    '''
+    Packed params for an XML document, from the compile cache if the same
+    document was compiled by the same libesc before. Returns (param bytes,
+    True if cached)
+    '''
+    name = os.path.join(COMPILED_DIR, '%s-%s.eep' % (xml_digest(xml_string), xml_digest(_compiler_tag())[:8]))
+    param_bytes = esccache.load_bytes(name)
+    if param_bytes:
+        return (param_bytes, True)
+    param_bytes = compile_params(xml_string)
+    esccache.save_bytes(name, param_bytes)
+    return (param_bytes, False)
+
+
+def check_params_file(path):
+    '''
+    Compile and validate one params file: the XML is checked against the
+    documented ranges, compiled (through the cache) and unpacked again to make
+    sure no value is changed by packing. Returns a dict with path, errors
+    (empty if the file is fine), cached and size of the packed params
+    '''
+    result = {'path': path, 'errors': [], 'cached': False, 'size': None}
+    try:
+        with open(path, 'r') as f:
+            xml_string = f.read()
+        fields = read_params_fields(xml_string)
+    except (IOError, OSError, ET.ParseError) as e:
+        result['errors'].append(str(e))
+        return result
+    result['errors'].extend(validate_params_fields(fields))
+    try:
+        (param_bytes, result['cached']) = load_compiled(xml_string)
+        from libesc import params_from_xml
+        unpacked = params_from_xml(xml_string)
+        unpacked.parse_params_all(param_bytes)
+        changed = diff_fields(flatten_fields(fields), flatten_fields(read_params_fields(unpacked.get_xml_string())))
+    except Exception as e:
+        result['errors'].append('compile failed: %s' % e)
+        return result
+    result['size'] = len(param_bytes)
+    if changed:
+        result['errors'].append('values changed by packing: %s' % ', '.join(changed))
+    return result
+
+
+def find_params_files(root):
+    files = []
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        for name in filenames:
+            if name.endswith('.xml'):
+                files.append(os.path.join(dirpath, name))
+    return sorted(files)
+
+
+class ParamsIndex(object):
+    '''
+    Index of the params tree under root: packed param bytes digest -> files,
+    plus the param values of every file for nearest-match lookups. Entries
+    packed by another libesc build are indexed again
+    '''
+    def __init__(self, root):
+        self.root    = os.path.abspath(root)
+        self.entries = {}    # path -> {mtime, size, compiler, digest, fields}
+        self.by_digest = {}  # packed params digest -> paths
+
+    def update(self):
+        cached = esccache.load_json(PARAMS_INDEX_FILE, {})
+        try:
+            compiler = _compiler_tag()
+        except ImportError:
+            compiler = None
+        changed = False
+        entries = {}
+        for path in find_params_files(self.root):
+            st = os.stat(path)
+            entry = cached.get(path)
+            if entry is None or entry['mtime'] != st.st_mtime or entry['size'] != st.st_size or \
+                    entry.get('compiler') != compiler:
+                with open(path, 'r') as f:
+                    xml_string = f.read()
+                try:
+                    digest = params_digest(load_compiled(xml_string)[0])
+                    fields = flatten_fields(read_params_fields(xml_string))
+                except Exception:
+                    digest = None    # not a valid params file, keep it out of the lookups
+                    fields = {}
+                entry = {'mtime': st.st_mtime, 'size': st.st_size, 'compiler': compiler,
+                         'digest': digest, 'fields': fields}
+                changed = True
+            entries[path] = entry
+
+        # files removed from this tree
+        for path in list(cached):
+            if path.startswith(self.root + os.sep) and path not in entries:
+                del cached[path]
+                changed = True
+
+        cached.update(entries)
+        if changed:
+            esccache.save_json(PARAMS_INDEX_FILE, cached)
+        self.entries = entries
+        self.by_digest = {}
+        for (path, entry) in sorted(entries.items()):
+            if entry['digest'] is not None:
+                self.by_digest.setdefault(entry['digest'], []).append(path)
+        return self
+
+    def find(self, param_bytes):
+        '''
+        Return the list of files whose packed params equal param_bytes
+        '''
+        return self.by_digest.get(params_digest(param_bytes), [])
+
+    def nearest(self, fields):
+        '''
+        Return (path, differing param names) of the file with the fewest
+        differing params, or (None, []) if the index is empty
+        '''
+        flat = flatten_fields(fields)
+        best = (None, [])
+        for (path, entry) in sorted(self.entries.items()):
+            if not entry['fields']:
+                continue
+            diff = diff_fields(flat, entry['fields'])
+            if best[0] is None or len(diff) < len(best[1]):
+                best = (path, diff)
+        return best
@@ -0,0 +1,136 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Command profiles for voxl-esc-playback.py. A profile is a table with one
+# row per command update and these columns (ESC IDs 0..7):
+#
+#   t          optional, seconds since the start. Without it, rows are played
+#              one per command period
+#   rpm_<id>   target rpm of ESC <id>, or
+#   power_<id> target power (%) of ESC <id>; all ESCs of a profile use the
+#              same mode, since one command packet carries all targets
+#   led_<id>   optional LED bits of ESC <id>: 1 red, 2 green, 4 blue
+#
+# Profiles are CSV files with a header row, or NumPy .npy files holding a
+# structured array with the same field names. Neither is loaded into memory:
+# CSV rows are parsed as they are played and .npy files are memory mapped.
+
+import csv
+import re
+
+COLUMN_PATTERN = re.compile(r'^(rpm|power|led)_(\d+)$')
+NPY_CHUNK_ROWS = 4096
+
+
+class ProfileError(Exception):
+    pass
+
+
+class ProfileReader(object):
+    '''
+    Streaming reader of a command profile. rows() yields (t or None,
+    targets: list of (esc_id, target), leds: list of (esc_id, led bits))
+    '''
+    def __init__(self, path):
+        self.path = path
+        if path.endswith('.npy'):
+            import numpy as np
+            self.array = np.load(path, mmap_mode='r')
+            if self.array.dtype.names is None:
+                raise ProfileError('%s does not hold a structured array with named columns' % path)
+            columns = list(self.array.dtype.names)
+            self.num_rows = len(self.array)
+        elif path.endswith('.csv'):
+            self.array = None
+            with open(path, 'r') as f:
+                header = next(csv.reader(f), None)
+            if header is None:
+                raise ProfileError('%s is empty' % path)
+            columns = [c.strip() for c in header]
+            self.num_rows = None
+        else:
+            raise ProfileError('unsupported profile file %s, use .csv or .npy' % path)
+
+        self.columns = columns
+        self.has_time = 't' in columns
+        targets = {}
+        leds    = {}
+        for (i, name) in enumerate(columns):
+            m = COLUMN_PATTERN.match(name)
+            if m is None:
+                if name != 't':
+                    raise ProfileError('unknown column "%s"' % name)
+                continue
+            (kind, esc_id) = (m.group(1), int(m.group(2)))
+            if kind == 'led':
+                leds[esc_id] = i
+            else:
+                targets.setdefault(kind, {})[esc_id] = i
+        if len(targets) == 0:
+            raise ProfileError('profile has no rpm_<id> or power_<id> columns')
+        if len(targets) > 1:
+            raise ProfileError('profile needs rpm_<id> or power_<id> columns, not both')
+        (self.mode, target_columns) = list(targets.items())[0]
+        self.esc_ids = sorted(target_columns)
+        self.target_columns = sorted(target_columns.items())
+        self.led_columns    = sorted(leds.items())
+        self.time_column    = columns.index('t') if self.has_time else None
+
+    def rows(self):
+        if self.array is not None:
+            return self._npy_rows()
+        return self._csv_rows()
+
+    def _row(self, values):
+        t = float(values[self.time_column]) if self.time_column is not None else None
+        targets = [(esc_id, float(values[i])) for (esc_id, i) in self.target_columns]
+        leds    = [(esc_id, int(float(values[i]))) for (esc_id, i) in self.led_columns]
+        return (t, targets, leds)
+
+    def _csv_rows(self):
+        with open(self.path, 'r') as f:
+            reader = csv.reader(f)
+            next(reader)
+            for values in reader:
+                if len(values) == 0:
+                    continue
+                try:
+                    yield self._row(values)
+                except (ValueError, IndexError):
+                    raise ProfileError('%s line %d: bad row %s' % (self.path, reader.line_num, ','.join(values)))
+
+    def _npy_rows(self):
+        for start in range(0, self.num_rows, NPY_CHUNK_ROWS):
+            # copy one chunk out of the memory map, then iterate over plain tuples
+            for values in self.array[start:start + NPY_CHUNK_ROWS].tolist():
+                yield self._row(values)
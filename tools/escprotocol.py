@@ -0,0 +1,218 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Packet framing of the ESC UART protocol, shared by the ESC simulator and
+# the link monitor. The full protocol implementation lives in libesc; this
+# module only knows enough to frame, check and decode packets on the wire:
+#
+#   [0xAF] [length] [type] [payload ...] [crc16 lo] [crc16 hi]
+#
+# length is the total packet length, crc16 (modbus) covers length..payload.
+
+import struct
+
+ESC_PACKET_HEADER   = 0xAF
+ESC_PACKET_OVERHEAD = 5     # header, length, type and two crc bytes
+ESC_PACKET_MAX_LEN  = 255
+
+# packet type ids. libesc.esctypes is the reference, values found there
+# override the defaults below so that both sides always agree
+PACKET_TYPES = {
+    'ESC_PACKET_TYPE_VERSION_REQUEST'      : 0,
+    'ESC_PACKET_TYPE_PWM_CMD'              : 1,
+    'ESC_PACKET_TYPE_RPM_CMD'              : 2,
+    'ESC_PACKET_TYPE_SOUND_CMD'            : 3,
+    'ESC_PACKET_TYPE_STEP_CMD'             : 4,
+    'ESC_PACKET_TYPE_LED_CMD'              : 5,
+    'ESC_PACKET_TYPE_RESET_CMD'            : 10,
+    'ESC_PACKET_TYPE_SET_ID_CMD'           : 11,
+    'ESC_PACKET_TYPE_SET_DIR_CMD'          : 12,
+    'ESC_PACKET_TYPE_CONFIG_BOARD_REQUEST' : 20,
+    'ESC_PACKET_TYPE_CONFIG_USER_REQUEST'  : 21,
+    'ESC_PACKET_TYPE_CONFIG_UART_REQUEST'  : 22,
+    'ESC_PACKET_TYPE_CONFIG_TUNE_REQUEST'  : 23,
+    'ESC_PACKET_TYPE_CONFIG_ID_REQUEST'    : 24,
+    'ESC_PACKET_TYPE_EEPROM_WRITE_UNLOCK'  : 45,
+    'ESC_PACKET_TYPE_PARAMS'               : 47,
+    'ESC_PACKET_TYPE_BOARD_CONFIG'         : 48,
+    'ESC_PACKET_TYPE_USER_CONFIG'          : 49,
+    'ESC_PACKET_TYPE_UART_CONFIG'          : 50,
+    'ESC_PACKET_TYPE_TUNE_CONFIG'          : 51,
+    'ESC_PACKET_TYPE_ID_CONFIG'            : 52,
+    'ESC_PACKET_TYPE_VERSION_RESPONSE'     : 109,
+    'ESC_PACKET_TYPE_FB_RESPONSE'          : 128,
+    'ESC_PACKET_TYPE_FB_POWER_STATUS'      : 132,
+}
+
+# serial protocols of EscManager.set_protocol(): ESC firmware or bootloader
+PROTOCOLS = {
+    'ESC_PROTOCOL_FIRMWARE'   : 0,
+    'ESC_PROTOCOL_BOOTLOADER' : 1,
+}
+
+try:
+    from libesc.esctypes import EscTypes as _types
+    for _name in PACKET_TYPES:
+        if hasattr(_types, _name):
+            PACKET_TYPES[_name] = getattr(_types, _name)
+    for _name in PROTOCOLS:
+        if hasattr(_types, _name):
+            PROTOCOLS[_name] = getattr(_types, _name)
+except ImportError:
+    pass
+
+globals().update(PACKET_TYPES)
+globals().update(PROTOCOLS)
+
+PACKET_TYPE_NAMES = dict((v, k.replace('ESC_PACKET_TYPE_', '')) for (k, v) in PACKET_TYPES.items())
+
+# config section pushed by the host -> request packet that reads it back
+CONFIG_REQUESTS = {
+    ESC_PACKET_TYPE_CONFIG_BOARD_REQUEST : ESC_PACKET_TYPE_BOARD_CONFIG,
+    ESC_PACKET_TYPE_CONFIG_UART_REQUEST  : ESC_PACKET_TYPE_UART_CONFIG,
+    ESC_PACKET_TYPE_CONFIG_TUNE_REQUEST  : ESC_PACKET_TYPE_TUNE_CONFIG,
+    ESC_PACKET_TYPE_CONFIG_ID_REQUEST    : ESC_PACKET_TYPE_ID_CONFIG,
+}
+
+# payload layouts (little endian)
+FB_RESPONSE_FORMAT      = '<BHBbHhh'  # id_state, rpm, cmd_counter, power(%), voltage(mV), current(8mA), temperature(0.01C)
+VERSION_RESPONSE_FORMAT = '<BHHI'     # id, sw version, hw version, unique id
+FB_CURRENT_SCALE        = 0.008       # A per lsb
+FB_TEMPERATURE_SCALE    = 0.01        # C per lsb
+CMD_POWER_SCALE         = 10.0        # pwm command lsb per percent of power
+
+
+def _make_crc16_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return table
+
+_CRC16_TABLE = _make_crc16_table()
+
+
+def crc16(data, crc=0xFFFF):
+    for b in bytearray(data):
+        crc = (crc >> 8) ^ _CRC16_TABLE[(crc ^ b) & 0xFF]
+    return crc
+
+
+def create_packet(packet_type, payload=b''):
+    payload = bytearray(payload)
+    length  = len(payload) + ESC_PACKET_OVERHEAD
+    if length > ESC_PACKET_MAX_LEN:
+        raise ValueError('ESC packet payload too long: %d bytes' % len(payload))
+    packet = bytearray([ESC_PACKET_HEADER, length, packet_type]) + payload
+    crc = crc16(packet[1:])
+    packet += bytearray([crc & 0xFF, crc >> 8])
+    return packet
+
+
+def parse_commands(payload):
+    '''
+    Split a PWM / RPM command payload into (commands, led_bits, fb_id).
+    Commands are int16 per ESC, followed by 16 bits of LED state (3 bits per
+    ESC) and an optional byte with the ID that should send feedback.
+    '''
+    payload = bytearray(payload)
+    fb_id = None
+    if len(payload) % 2:
+        fb_id   = payload[-1]
+        payload = payload[:-1]
+    num_cmds = len(payload) // 2 - 1
+    if num_cmds < 1:
+        return ([], 0, fb_id)
+    values = struct.unpack('<%dhH' % num_cmds, bytes(payload))
+    return (list(values[:-1]), values[-1], fb_id)
+
+
+def create_commands(packet_type, commands, led_bits=0, fb_id=None):
+    payload = bytearray(struct.pack('<%dhH' % len(commands), *(list(commands) + [led_bits])))
+    if fb_id is not None:
+        payload.append(fb_id)
+    return create_packet(packet_type, payload)
+
+
+class PacketParser(object):
+    '''
+    Incremental packet parser for a raw byte stream. feed() returns the list
+    of (packet_type, payload) tuples completed by the new bytes. Bytes that
+    cannot start a packet and packets with a bad crc are dropped and counted.
+    '''
+    def __init__(self):
+        self.buffer        = bytearray()
+        self.num_packets   = 0
+        self.crc_errors    = 0
+        self.framing_errors = 0
+        self.bytes_dropped = 0
+
+    def feed(self, data):
+        self.buffer += bytearray(data)
+        packets = []
+        buf = self.buffer
+        while True:
+            start = buf.find(bytearray([ESC_PACKET_HEADER]))
+            if start < 0:
+                self.bytes_dropped += len(buf)
+                del buf[:]
+                break
+            if start > 0:
+                self.bytes_dropped += start
+                del buf[:start]
+            if len(buf) < 2:
+                break
+            length = buf[1]
+            if length < ESC_PACKET_OVERHEAD:
+                self.framing_errors += 1
+                self.bytes_dropped  += 1
+                del buf[:1]
+                continue
+            if len(buf) < length:
+                break
+            crc = buf[length-2] | (buf[length-1] << 8)
+            if crc16(buf[1:length-2]) != crc:
+                # resync on the next header byte rather than skipping the whole packet
+                self.crc_errors    += 1
+                self.bytes_dropped += 1
+                del buf[:1]
+                continue
+            packets.append((buf[2], bytes(buf[3:length-2])))
+            self.num_packets += 1
+            del buf[:length]
+        return packets
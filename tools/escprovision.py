@@ -0,0 +1,146 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Fleet provisioning: scan -> upload params -> verify params on several ports
+# at once, one worker process per port, so end-of-line throughput scales with
+# the number of adapters. Workers report their progress through a queue; the
+# result of every port is a report dict (see provision_port).
+
+import time
+import multiprocessing
+
+from escscan import probe_port, BAUD_RATES
+from escparams import read_params_fields
+from escconnect import RESET_BOOT_TIME, EscConnectError, open_escs
+from escconfig import CONFIG_SECTIONS, READBACK_TIMEOUT, load_params, upload_config, readback_config, diff_sections
+
+STAGES = ['scan', 'upload', 'reset', 'verify']
+
+
+class ProvisionError(Exception):
+    pass
+
+
+def provision_port(devpath, params_data, params_type, sections=CONFIG_SECTIONS,
+                   baud_rates=BAUD_RATES, readback_timeout=READBACK_TIMEOUT, expect_escs=None, status=None):
+    '''
+    Run the provisioning pipeline on one port, failing if fewer than
+    expect_escs ESCs are detected. status(text) is called at the
+    start of every stage. Returns a report dict: devpath, result ('pass' or
+    'fail'), baudrate, esc_ids, versions (id -> [sw, hw]), pushed sections,
+    elapsed time per stage and error (None on success)
+    '''
+    report = {'devpath': devpath, 'result': 'fail', 'baudrate': None, 'esc_ids': [], 'versions': {},
+              'pushed': [], 'stages': {}, 'error': None}
+    if status is None:
+        status = lambda text: None
+    stage = [None, 0.0]
+
+    def start(name):
+        t_now = time.time()
+        if stage[0] is not None:
+            report['stages'][stage[0]] = round(t_now - stage[1], 3)
+        stage[0] = name
+        stage[1] = t_now
+        if name is not None:
+            status(name)
+
+    esc_manager = None
+    try:
+        start('scan')
+        scan = probe_port(devpath, baud_rates)
+        if scan is None:
+            raise ProvisionError('no ESCs found')
+        report['baudrate'] = scan.baudrate
+
+        start('upload')
+        (esc_manager, escs) = open_escs(devpath, scan.baudrate, scan.esc_ids, expect_escs)
+        esc_ids = sorted(e.get_id() for e in escs)
+        report['esc_ids']  = esc_ids
+        report['versions'] = dict((str(e.get_id()), list(e.get_versions())) for e in escs)
+        load_params(esc_manager, params_data, params_type)
+        (pushed, failed) = upload_config(esc_manager, esc_ids, sections,
+                                         differential=True, timeout=readback_timeout)
+        report['pushed'] = pushed
+        if len(failed) > 0:
+            raise ProvisionError('upload not confirmed by ESC ID(s) %s' % ', '.join(str(i) for i in failed))
+
+        if len(pushed) > 0:
+            start('reset')
+            esc_manager.reset_all()
+            esc_manager.close()
+            esc_manager = None
+            time.sleep(RESET_BOOT_TIME)
+            (esc_manager, escs) = open_escs(devpath, scan.baudrate, esc_ids)
+            load_params(esc_manager, params_data, params_type)
+
+        start('verify')
+        expected = read_params_fields(esc_manager.esc_dummy.params.get_xml_string())
+        latency = readback_config(esc_manager, esc_ids, timeout=readback_timeout)
+        missing = [i for i in esc_ids if latency[i] is None]
+        if len(missing) > 0:
+            raise ProvisionError('no params read back from ESC ID(s) %s' % ', '.join(str(i) for i in missing))
+        mismatch = [i for i in esc_ids if diff_sections(expected, esc_manager.get_esc_by_id(i), sections)]
+        if len(mismatch) > 0:
+            raise ProvisionError('params mismatch on ESC ID(s) %s' % ', '.join(str(i) for i in mismatch))
+        report['result'] = 'pass'
+    except (ProvisionError, EscConnectError) as e:
+        report['error'] = str(e)
+    except Exception as e:
+        report['error'] = 'unexpected error: %s' % (e)
+    finally:
+        start(None)
+        if esc_manager is not None:
+            esc_manager.close()
+    return report
+
+
+def _worker(queue, devpath, args, kwargs):
+    kwargs['status'] = lambda text: queue.put(('status', devpath, text))
+    queue.put(('report', devpath, provision_port(devpath, *args, **kwargs)))
+
+
+def start_workers(ports, queue, *args, **kwargs):
+    '''
+    Start one provision_port() process per port. Each process puts
+    ('status', devpath, text) and finally ('report', devpath, report) on queue.
+    Pass compiled params ('eep', see escparams.load_compiled) so that the
+    workers do not each parse the XML
+    '''
+    workers = []
+    for devpath in ports:
+        p = multiprocessing.Process(target=_worker, args=(queue, devpath, args, dict(kwargs)))
+        p.daemon = True
+        p.start()
+        workers.append(p)
+    return workers
@@ -0,0 +1,154 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Binary telemetry recorder. Samples are written as fixed size records into
+# a preallocated, memory mapped file, so long runs use constant memory and
+# each sample costs one struct.pack_into. The file can be opened as a NumPy
+# structured array without copying (see load_records).
+#
+# File layout (little endian):
+#   header  : magic(8) version(u32) record_size(u32) num_records(u64) reserved(40)
+#   records : t(f64) esc_id(u8) pad(3) command(f32) rpm(f32) power(f32)
+#             voltage(f32) current(f32) temperature(f32)
+#
+# t is UNIX time in seconds, command is the commanded power (%) or rpm (nan if none).
+
+import os
+import mmap
+import time
+import struct
+
+from escloop import monotonic
+
+RECORD_MAGIC   = b'VXLESCR1'
+RECORD_VERSION = 1
+HEADER_FORMAT  = '<8sIIQ40x'
+HEADER_SIZE    = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT  = '<dB3xffffff'
+RECORD_SIZE    = struct.calcsize(RECORD_FORMAT)
+RECORD_FIELDS  = ['t', 'esc_id', 'command', 'rpm', 'power', 'voltage', 'current', 'temperature']
+CHUNK_RECORDS  = 65536
+
+_COUNT_OFFSET  = struct.calcsize('<8sII')
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype({'names'   : RECORD_FIELDS,
+                     'formats' : ['<f8', 'u1', '<f4', '<f4', '<f4', '<f4', '<f4', '<f4'],
+                     'offsets' : [0, 8, 12, 16, 20, 24, 28, 32],
+                     'itemsize': RECORD_SIZE})
+
+
+def read_header(f):
+    data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError('not an ESC telemetry record file')
+    (magic, version, record_size, num_records) = struct.unpack(HEADER_FORMAT, data)
+    if magic != RECORD_MAGIC or version != RECORD_VERSION or record_size != RECORD_SIZE:
+        raise ValueError('not an ESC telemetry record file (or unsupported version)')
+    return num_records
+
+
+def load_records(path):
+    '''
+    Map a record file as a read-only NumPy structured array (no copy)
+    '''
+    import numpy as np
+    with open(path, 'rb') as f:
+        num_records = read_header(f)
+    if num_records == 0:
+        return np.zeros(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode='r', offset=HEADER_SIZE, shape=(num_records,))
+
+
+def iter_records(path):
+    '''
+    Iterate over records as tuples without NumPy
+    '''
+    with open(path, 'rb') as f:
+        num_records = read_header(f)
+        for _ in range(num_records):
+            yield struct.unpack(RECORD_FORMAT, f.read(RECORD_SIZE))
+
+
+class TelemetryRecorder(object):
+    '''
+    Append telemetry samples (esctelemetry.TelemetrySample) to a record file.
+    If the file already holds a recording, new samples are appended to it.
+    Space is preallocated in chunks of CHUNK_RECORDS and the file is trimmed
+    to the used size on close().
+    '''
+    def __init__(self, path, chunk_records=CHUNK_RECORDS):
+        self.path  = path
+        self.chunk = chunk_records
+        self.num_records = 0
+        # samples carry monotonic timestamps, convert them to UNIX time
+        self.time_offset = time.time() - monotonic()
+
+        if os.path.isfile(path) and os.path.getsize(path) >= HEADER_SIZE:
+            with open(path, 'rb') as f:
+                self.num_records = read_header(f)
+            self.f = open(path, 'r+b')
+        else:
+            self.f = open(path, 'w+b')
+            self.f.write(struct.pack(HEADER_FORMAT, RECORD_MAGIC, RECORD_VERSION, RECORD_SIZE, 0))
+            self.f.flush()
+        self.capacity = 0
+        self.mm = None
+        self._map(self.num_records + self.chunk)
+
+    def _map(self, capacity):
+        if self.mm is not None:
+            self.mm.close()
+        self.f.truncate(HEADER_SIZE + capacity * RECORD_SIZE)
+        self.mm = mmap.mmap(self.f.fileno(), HEADER_SIZE + capacity * RECORD_SIZE)
+        self.capacity = capacity
+
+    def append(self, sample, command=float('nan')):
+        if self.num_records >= self.capacity:
+            self._map(self.capacity + self.chunk)
+        struct.pack_into(RECORD_FORMAT, self.mm, HEADER_SIZE + self.num_records * RECORD_SIZE,
+                         sample.t + self.time_offset, sample.esc_id, command, sample.rpm,
+                         sample.power, sample.voltage, sample.current, sample.temperature)
+        self.num_records += 1
+        struct.pack_into('<Q', self.mm, _COUNT_OFFSET, self.num_records)
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.mm.flush()
+        self.mm.close()
+        self.mm = None
+        self.f.truncate(HEADER_SIZE + self.num_records * RECORD_SIZE)
+        self.f.close()
@@ -0,0 +1,259 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# RPM step response analysis. A profile is a sequence of segments given as a
+# comma separated string:
+#
+#   RPM:SECONDS   step to RPM and hold it for SECONDS
+#   RPM/SECONDS   ramp linearly from the previous target to RPM in SECONDS
+#
+# e.g. '3000:2,6000:2,9000/3,3000:2'. The first segment starts from 0 RPM.
+# For every segment the feedback is compared with the target:
+#
+# - rise time: 10% to 90% of the step (steps only)
+# - overshoot: peak beyond the new target, percent of the step size (steps only)
+# - settling time: time until the RPM stays within the settle band of the target (steps only)
+# - steady state error: mean RPM - target over the last part of the segment
+# - rms / max error: RPM - target over the whole segment (for ramps, against
+#   the moving target)
+
+import numpy as np
+
+from escloop import RateLoop
+from esctelemetry import read_sample
+
+DEFAULT_PROFILE = '3000:2,6000:2,9000:2,6000:2,3000:2,9000/3,3000/3'
+SETTLE_BAND     = 100.0    # rpm, the tracking accuracy expected from a tuned ESC
+STEADY_FRACTION = 0.25     # last part of a segment used for the steady state error
+
+
+def parse_profile(spec):
+    '''
+    Profile string -> list of (kind, rpm, duration), kind is 'step' or 'ramp'
+    '''
+    segments = []
+    for item in spec.split(','):
+        item = item.strip()
+        if ':' in item:
+            (kind, (rpm, duration)) = ('step', item.split(':', 1))
+        elif '/' in item:
+            (kind, (rpm, duration)) = ('ramp', item.split('/', 1))
+        else:
+            raise ValueError('profile segment "%s" is not RPM:SECONDS or RPM/SECONDS' % item)
+        (rpm, duration) = (float(rpm), float(duration))
+        if duration <= 0:
+            raise ValueError('profile segment "%s" has no duration' % item)
+        segments.append((kind, rpm, duration))
+    if len(segments) == 0:
+        raise ValueError('empty profile')
+    return segments
+
+
+class Profile(object):
+    '''
+    Target RPM as a function of the time since the start of the profile
+    '''
+    def __init__(self, segments):
+        self.segments = segments
+        self.starts   = np.cumsum([0.0] + [d for (_, _, d) in segments])
+        self.duration = self.starts[-1]
+        self.origins  = [0.0] + [rpm for (_, rpm, _) in segments[:-1]]
+
+    def target(self, t):
+        '''
+        (segment index, target rpm) at time t, segment index is None after the end
+        '''
+        if t >= self.duration:
+            return (None, 0.0)
+        i = max(0, int(np.searchsorted(self.starts, t, side='right')) - 1)
+        (kind, rpm, duration) = self.segments[i]
+        if kind == 'ramp':
+            rpm = self.origins[i] + (rpm - self.origins[i]) * (t - self.starts[i]) / duration
+        return (i, rpm)
+
+
+def run_profile(esc_manager, escs, profile, rate_hz, on_segment=None, on_sample=None, check=None):
+    '''
+    Command the profile to all escs and collect their feedback. on_segment(i)
+    is called when segment i starts, on_sample(sample, target) for every
+    sample. check(sample) may return a reason to abort the run. The motors
+    are commanded to 0 RPM at the end.
+    Returns (data, loop, abort reason or None); data maps esc id -> (t, rpm,
+    target, segment) lists, t is the time since the start of the profile
+    '''
+    data = dict((e.get_id(), ([], [], [], [])) for e in escs)
+    loop = RateLoop(rate_hz)
+    segment_now = None
+    reason = None
+    try:
+        while reason is None:
+            t_now = loop.wait()
+            t_profile = t_now - loop.t_start
+            (segment, target) = profile.target(t_profile)
+            if segment is None:
+                break
+            if segment != segment_now:
+                if on_segment is not None:
+                    on_segment(segment)
+                segment_now = segment
+
+            for e in escs:
+                e.set_target_rpm(int(round(target)))
+            esc_manager.send_rpm_targets()
+
+            for e in escs:
+                sample = read_sample(e, t_now)
+                if on_sample is not None:
+                    on_sample(sample, target)
+                (t, rpm, cmd, seg) = data[sample.esc_id]
+                t.append(t_profile)
+                rpm.append(sample.rpm)
+                cmd.append(target)
+                seg.append(segment)
+                if check is not None:
+                    reason = reason or check(sample)
+    except KeyboardInterrupt:
+        reason = 'stopped by user'
+    finally:
+        for e in escs:
+            e.set_target_rpm(0)
+        esc_manager.send_rpm_targets()
+    return (data, loop, reason)
+
+
+def segment_metrics(kind, t, rpm, target, rpm_from, rpm_to,
+                    settle_band=SETTLE_BAND, steady_fraction=STEADY_FRACTION):
+    '''
+    Metrics of one segment. t is the time since the start of the segment
+    (seconds), rpm the feedback and target the commanded rpm at each sample.
+    Times are in seconds; NaN where a metric does not apply or was not reached
+    '''
+    t      = np.asarray(t, dtype=float)
+    rpm    = np.asarray(rpm, dtype=float)
+    target = np.asarray(target, dtype=float)
+    nan    = float('nan')
+    m = {'kind': kind, 'rpm_from': rpm_from, 'rpm_to': rpm_to, 'samples': len(t),
+         'rise_time': nan, 'overshoot': nan, 'settling_time': nan,
+         'steady_state_error': nan, 'rms_error': nan, 'max_error': nan}
+    if len(t) == 0:
+        return m
+
+    error = rpm - target
+    m['rms_error'] = float(np.sqrt(np.mean(error ** 2)))
+    m['max_error'] = float(np.max(np.abs(error)))
+    steady = t >= t[-1] - steady_fraction * (t[-1] - t[0])
+    m['steady_state_error'] = float(np.mean(error[steady]))
+
+    step = rpm_to - rpm_from
+    if kind != 'step' or step == 0:
+        return m
+
+    progress = (rpm - rpm_from) / step
+    above_10 = np.nonzero(progress >= 0.1)[0]
+    above_90 = np.nonzero(progress >= 0.9)[0]
+    if len(above_10) and len(above_90):
+        m['rise_time'] = float(t[above_90[0]] - t[above_10[0]])
+    m['overshoot'] = float(max(0.0, np.max(progress) - 1.0) * 100.0)
+
+    outside = np.nonzero(np.abs(rpm - rpm_to) > settle_band)[0]
+    if len(outside) == 0:
+        m['settling_time'] = 0.0
+    elif outside[-1] < len(t) - 1:
+        m['settling_time'] = float(t[outside[-1] + 1])
+    return m
+
+
+def analyze(profile, t, rpm, target, segment, settle_band=SETTLE_BAND):
+    '''
+    Split the samples of one ESC by segment and compute the metrics of each.
+    t is the time since the start of the profile
+    '''
+    t       = np.asarray(t, dtype=float)
+    rpm     = np.asarray(rpm, dtype=float)
+    target  = np.asarray(target, dtype=float)
+    segment = np.asarray(segment)
+    results = []
+    for (i, (kind, rpm_to, _)) in enumerate(profile.segments):
+        sel = segment == i
+        results.append(segment_metrics(kind, t[sel] - profile.starts[i], rpm[sel], target[sel],
+                                       profile.origins[i], rpm_to, settle_band))
+    return results
+
+
+def summarize(results):
+    '''
+    Aggregate the segment metrics of one ESC
+    '''
+    def values(key, kind=None):
+        v = np.array([r[key] for r in results if kind is None or r['kind'] == kind], dtype=float)
+        return v[~np.isnan(v)]
+    nan = float('nan')
+    rise   = values('rise_time', 'step')
+    over   = values('overshoot', 'step')
+    settle = values('settling_time', 'step')
+    steady = values('steady_state_error')
+    rms    = values('rms_error')
+    num_steps = sum(1 for r in results if r['kind'] == 'step' and r['rpm_to'] != r['rpm_from'])
+    return {'mean_rise_time'       : float(np.mean(rise)) if len(rise) else nan,
+            'max_overshoot'        : float(np.max(over)) if len(over) else nan,
+            'mean_settling_time'   : float(np.mean(settle)) if len(settle) else nan,
+            'unsettled_steps'      : num_steps - len(settle),
+            'max_steady_state_error' : float(np.max(np.abs(steady))) if len(steady) else nan,
+            'rms_error'            : float(np.sqrt(np.mean(rms ** 2))) if len(rms) else nan}
+
+
+def format_table(esc_id, results):
+    def ms(v):
+        return '%8s' % '-' if v != v else '%8.0f' % (v * 1000.0)
+    def num(v, fmt='%8.1f'):
+        return '%8s' % '-' if v != v else fmt % v
+    lines = ['[%d] seg  kind  from ->    to  rise ms  over %% settle ms  ss err  rms err  max err' % esc_id]
+    for (i, r) in enumerate(results):
+        lines.append('[%d] %3d  %-4s %5.0f -> %5.0f %s %s %s %s %s %s' % (
+            esc_id, i, r['kind'], r['rpm_from'], r['rpm_to'],
+            ms(r['rise_time']), num(r['overshoot']), ms(r['settling_time']),
+            num(r['steady_state_error']), num(r['rms_error']), num(r['max_error'])))
+    return lines
+
+
+def json_safe(value):
+    '''
+    Replace NaN (metrics that do not apply) with None for json.dump()
+    '''
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, dict):
+        return dict((k, json_safe(v)) for (k, v) in value.items())
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    return value
@@ -0,0 +1,228 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# ESC autodetection. SerialScanner from libesc probes one port and baud rate
+# at a time; scan_ports() probes all candidate ports concurrently (baud rates
+# of one port are still tried in order, since a port can only be opened once)
+# and returns every port with ESCs on it, or with first=True returns as soon
+# as one port has answered.
+#
+# wait_for_escs() replaces a fixed sleep after opening a port: it returns as
+# soon as the expected ESCs have answered.
+#
+# libesc is imported when first needed, so that tools started with --device
+# do not pay for it.
+#
+# autodetect() first tries the adapters remembered in the autodetect cache
+# (see esccache) with a single quick probe at the cached baud rate, and only
+# falls back to a full scan if that fails.
+
+import glob
+import time
+import threading
+from collections import namedtuple
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+import esccache
+
+PORT_PATTERNS = ['/dev/ttyUSB*', '/dev/ttyACM*', '/dev/cu.usbserial-*', '/dev/cu.usbmodem*']
+BAUD_RATES    = [250000, 2000000, 921600, 230400, 115200, 57600]
+PROBE_TIMEOUT = 0.5    # seconds to wait for ESCs to answer on one port / baud rate
+PROBE_SETTLE  = 0.05   # stop waiting once no new ESC has shown up for this long
+CACHED_PROBE_TIMEOUT = 0.3
+DISCOVERY_TIMEOUT = 2.0    # seconds to wait for ESCs after opening a port
+DISCOVERY_SETTLE  = 0.1    # without an expected number of ESCs, stop once no new ESC has shown up for this long
+
+ScanResult = namedtuple('ScanResult', ['devpath', 'baudrate', 'esc_ids', 'versions'])
+
+
+def list_ports():
+    ports = []
+    for pattern in PORT_PATTERNS:
+        ports.extend(glob.glob(pattern))
+    return sorted(ports)
+
+
+def wait_for_escs(esc_manager, expect=None, ids=None, timeout=DISCOVERY_TIMEOUT, settle=DISCOVERY_SETTLE):
+    '''
+    Wait for ESCs to be detected after opening the port: until at least
+    expect ESCs and all ESC ids in ids have been seen, or, if neither is
+    given, until no new ESC has shown up for settle seconds. Returns the list
+    of detected ESCs, which is incomplete if the timeout expired
+    '''
+    t_start    = time.time()
+    t_last_new = t_start
+    num_escs   = 0
+    while True:
+        escs = esc_manager.get_escs()
+        t_now = time.time()
+        if expect is not None or ids is not None:
+            if (expect is None or len(escs) >= expect) and \
+               (ids is None or set(ids) <= set(e.get_id() for e in escs)):
+                return escs
+        elif len(escs) != num_escs:
+            num_escs   = len(escs)
+            t_last_new = t_now
+        elif num_escs > 0 and t_now - t_last_new >= settle:
+            return escs
+        if t_now - t_start >= timeout:
+            return escs
+        time.sleep(0.005)
+
+
+def probe(devpath, baudrate, timeout=PROBE_TIMEOUT):
+    '''
+    Open one port at one baud rate and wait up to timeout for ESCs to answer.
+    Returns a ScanResult, or None if no ESC answered
+    '''
+    from libesc.escmanager import EscManager
+    esc_manager = EscManager()
+    try:
+        esc_manager.open(devpath, baudrate)
+    except Exception:
+        return None
+
+    try:
+        escs = wait_for_escs(esc_manager, timeout=timeout, settle=PROBE_SETTLE)
+        if len(escs) == 0:
+            return None
+        return ScanResult(devpath, baudrate,
+                          [e.get_id() for e in escs],
+                          [tuple(e.get_versions()) for e in escs])
+    finally:
+        esc_manager.close()
+
+
+def probe_port(devpath, baud_rates=BAUD_RATES, timeout=PROBE_TIMEOUT, stop=None):
+    '''
+    Probe devpath at each baud rate in turn until ESCs answer, or until the
+    threading.Event stop is set
+    '''
+    for baudrate in baud_rates:
+        if stop is not None and stop.is_set():
+            return None
+        result = probe(devpath, baudrate, timeout)
+        if result is not None:
+            return result
+    return None
+
+
+def scan_ports(ports=None, baud_rates=BAUD_RATES, timeout=PROBE_TIMEOUT, first=False):
+    '''
+    Probe all ports concurrently, one worker thread per port. Returns the list
+    of ScanResult for every port where ESCs answered, sorted by port. With
+    first=True, return as soon as one port has answered; the other workers
+    stop after the baud rate they are probing
+    '''
+    if ports is None:
+        ports = list_ports()
+    results = Queue()
+    stop = threading.Event()
+
+    def worker(devpath):
+        results.put(probe_port(devpath, baud_rates, timeout, stop))
+
+    for devpath in ports:
+        t = threading.Thread(target=worker, args=(devpath,))
+        t.daemon = True
+        t.start()
+
+    found = []
+    for _ in ports:
+        result = results.get()
+        if result is not None:
+            found.append(result)
+            if first:
+                stop.set()
+                break
+    return sorted(found, key=lambda r: r.devpath)
+
+
+def probe_cached():
+    '''
+    Quick probe of the ports remembered in the autodetect cache, returns a
+    ScanResult or None
+    '''
+    cache = esccache.load_autodetect()
+    if not cache:
+        return None
+    ports = list_ports()
+    keys = esccache.get_adapter_keys(ports)
+    for devpath in ports:
+        entry = cache.get(keys[devpath])
+        if entry is None:
+            continue
+        result = probe(devpath, entry['baudrate'], CACHED_PROBE_TIMEOUT)
+        if result is not None:
+            esccache.store_autodetect([result])
+            return result
+    return None
+
+
+def store_detected(devpath, baudrate, escs):
+    '''
+    Update the autodetect cache with the ESCs detected on an autodetected port
+    '''
+    esccache.store_autodetect([ScanResult(devpath, baudrate, [e.get_id() for e in escs],
+                                          [tuple(e.get_versions()) for e in escs])])
+
+
+def autodetect(parallel=False, use_cache=True):
+    '''
+    Find a port with ESCs, returns (devpath, baudrate) or (None, None)
+    '''
+    if use_cache:
+        result = probe_cached()
+        if result is not None:
+            print('INFO: Using cached autodetect result for %s' % (result.devpath))
+            return (result.devpath, result.baudrate)
+
+    if not parallel:
+        from libesc import SerialScanner
+        scanner = SerialScanner()
+        (devpath, baudrate) = scanner.scan()
+        if devpath is not None and baudrate is not None and use_cache:
+            # the scanner only reports the port, the ESCs are added by store_detected()
+            # once the caller has opened the port
+            esccache.store_autodetect([ScanResult(devpath, baudrate, [], [])])
+        return (devpath, baudrate)
+
+    results = scan_ports(first=True)
+    if len(results) == 0:
+        return (None, None)
+    if use_cache:
+        esccache.store_autodetect(results)
+    return (results[0].devpath, results[0].baudrate)
@@ -0,0 +1,362 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Simulated 4-in-1 ESC on a pseudo-terminal. The simulator answers the same
+# packets as the ESC firmware (version, config request / push, PWM and RPM
+# commands with feedback, reset and bootloader traffic), so that all tools
+# can be run and timed without hardware:
+#
+#   python voxl-esc-sim.py --params-file ../params/Starling_V2/Starling_V2_mavic_mini_2_2S_Rev_C.xml
+#   python voxl-esc-spin.py --device /dev/pts/N --baud-rate 250000 --id 255 --power 10
+#
+# Motor speed follows a first order model: the steady state RPM for the applied
+# motor voltage is found by inverting the pwm_vs_rpm_curve_a0..a2 quadratic from
+# the params file and the RPM approaches it with time constant tau.
+
+import os
+import pty
+import tty
+import math
+import time
+import struct
+import select
+
+import escparams
+import escprotocol as proto
+from escprotocol import create_packet
+
+DEFAULT_SW_VERSION  = 39
+DEFAULT_HW_VERSION  = 31
+BOOTLOADER_WINDOW   = 1.0     # seconds the bootloader waits for the host after reset
+BATTERY_RESISTANCE  = 0.05    # ohm, for voltage sag under load
+AMBIENT_TEMPERATURE = 30.0
+
+# defaults used when no params file is given (Starling V2, 2S)
+DEFAULT_PARAMS = {
+    'baud_rate'           : 250000,
+    'cmd_timeout_ns'      : 100000000,
+    'vbat_nominal_mv'     : 7400,
+    'min_rpm'             : 1000,
+    'max_rpm'             : 19000,
+    'pwm_vs_rpm_curve_a0' : 394.105848401,
+    'pwm_vs_rpm_curve_a1' : 0.16833396333,
+    'pwm_vs_rpm_curve_a2' : 1.6812043136e-05,
+}
+
+
+class MotorModel(object):
+    '''
+    First order motor + propeller model driven by the ESC feed-forward curve
+    motor_voltage_mv = a2*rpm^2 + a1*rpm + a0
+    '''
+    def __init__(self, params, tau=0.05, max_current=10.0):
+        self.a0 = float(params['pwm_vs_rpm_curve_a0'])
+        self.a1 = float(params['pwm_vs_rpm_curve_a1'])
+        self.a2 = float(params['pwm_vs_rpm_curve_a2'])
+        self.min_rpm = float(params['min_rpm'])
+        self.max_rpm = float(params['max_rpm'])
+        self.vbat_nominal_mv = float(params['vbat_nominal_mv'])
+        self.tau = tau
+        # propeller power grows with rpm^3, scale so that max_rpm draws max_current
+        self.current_gain = max_current / (self.max_rpm ** 3)
+
+        self.rpm         = 0.0
+        self.power       = 0.0    # applied power, percent
+        self.voltage_mv  = self.vbat_nominal_mv
+        self.current     = 0.0
+        self.temperature = AMBIENT_TEMPERATURE
+
+    def rpm_for_voltage(self, motor_voltage_mv):
+        if motor_voltage_mv <= self.a0:
+            return 0.0
+        if self.a2 == 0.0:
+            return (motor_voltage_mv - self.a0) / self.a1
+        disc = self.a1 * self.a1 - 4.0 * self.a2 * (self.a0 - motor_voltage_mv)
+        return (-self.a1 + math.sqrt(disc)) / (2.0 * self.a2)
+
+    def voltage_for_rpm(self, rpm):
+        return self.a2 * rpm * rpm + self.a1 * rpm + self.a0
+
+    def update(self, dt, power=None, rpm=None):
+        '''
+        Advance the model by dt seconds, commanded either by power (percent)
+        or by rpm (closed loop in the ESC, modeled as ideal feed-forward)
+        '''
+        if rpm is not None:
+            if rpm == 0:
+                power = 0.0
+            else:
+                rpm = min(max(abs(rpm), self.min_rpm), self.max_rpm)
+                power = min(100.0, 100.0 * self.voltage_for_rpm(rpm) / self.voltage_mv)
+        power = min(abs(power or 0.0), 100.0)
+        self.power = power
+
+        rpm_ss = self.rpm_for_voltage(power / 100.0 * self.voltage_mv)
+        alpha  = min(1.0, dt / self.tau)
+        self.rpm += (rpm_ss - self.rpm) * alpha
+
+        self.current    = self.current_gain * self.rpm ** 3 * self.vbat_nominal_mv / self.voltage_mv
+        self.voltage_mv = self.vbat_nominal_mv - 1000.0 * BATTERY_RESISTANCE * self.current
+        # slow thermal model, heating with i^2
+        self.temperature += dt * (0.05 * self.current ** 2 - 0.01 * (self.temperature - AMBIENT_TEMPERATURE))
+
+
+class SimulatedEsc(object):
+    def __init__(self, esc_id, params, tau, sw_version, hw_version):
+        self.esc_id       = esc_id
+        self.sw_version   = sw_version
+        self.hw_version   = hw_version
+        self.unique_id    = 0x5E5C0000 + esc_id
+        self.motor        = MotorModel(params, tau)
+        self.config       = {}     # packet type -> pushed section bytes (simulated EEPROM)
+        self.power_cmd    = 0.0
+        self.rpm_cmd      = None
+        self.leds         = 0
+        self.cmd_counter  = 0
+        self.t_last_cmd   = None
+        self.bootloader_until = None
+        self.flash        = bytearray()
+
+    def feedback_packet(self):
+        m = self.motor
+        state = 2 if m.rpm > 0 else 0
+        payload = struct.pack(proto.FB_RESPONSE_FORMAT,
+                              (self.esc_id << 4) | state,
+                              int(min(m.rpm, 65535)),
+                              self.cmd_counter & 0xFF,
+                              int(round(m.power)),
+                              int(m.voltage_mv),
+                              int(m.current / proto.FB_CURRENT_SCALE),
+                              int(m.temperature / proto.FB_TEMPERATURE_SCALE))
+        return create_packet(proto.ESC_PACKET_TYPE_FB_RESPONSE, payload)
+
+    def version_packet(self):
+        payload = struct.pack(proto.VERSION_RESPONSE_FORMAT, self.esc_id,
+                              self.sw_version, self.hw_version, self.unique_id)
+        return create_packet(proto.ESC_PACKET_TYPE_VERSION_RESPONSE, payload)
+
+
+class EscSimulator(object):
+    '''
+    A bus of simulated ESCs behind the master side of a pty. Call open() to
+    create the pty, then run() to serve requests until stop() is called.
+    Transmitted bytes are paced at the configured baud rate (10 bits per byte).
+    '''
+    def __init__(self, params_file=None, num_escs=4, tau=0.05,
+                 sw_version=DEFAULT_SW_VERSION, hw_version=DEFAULT_HW_VERSION,
+                 tick=0.001, link=None):
+        params = dict(DEFAULT_PARAMS)
+        if params_file is not None:
+            fields = escparams.read_params_file(params_file)
+            for name in DEFAULT_PARAMS:
+                params[name] = escparams.get_param(fields, name, params[name])
+        self.params      = params
+        self.baud_rate   = int(params['baud_rate'])
+        self.cmd_timeout = params['cmd_timeout_ns'] * 1e-9
+        self.escs        = [SimulatedEsc(i, params, tau, sw_version, hw_version) for i in range(num_escs)]
+        self.tick        = tick
+        self.link        = link
+        self.parser      = proto.PacketParser()
+        self.tx_queue    = bytearray()
+        self.t_tx_free   = 0.0
+        self.running     = False
+        self.master_fd   = None
+        self.slave_fd    = None
+        self.device      = None
+
+        # traffic counters for throughput / latency benchmarks
+        self.rx_bytes    = 0
+        self.tx_bytes    = 0
+        self.rx_packets  = {}
+        self.tx_packets  = {}
+
+    def open(self):
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        tty.setraw(self.master_fd)
+        self.device = os.ttyname(self.slave_fd)
+        if self.link is not None:
+            if os.path.lexists(self.link):
+                os.remove(self.link)
+            os.symlink(self.device, self.link)
+        return self.device
+
+    def close(self):
+        if self.link is not None and os.path.islink(self.link):
+            os.remove(self.link)
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self.master_fd = self.slave_fd = None
+
+    def stop(self):
+        self.running = False
+
+    def get_esc(self, esc_id):
+        if esc_id < len(self.escs):
+            return self.escs[esc_id]
+        return None
+
+    def send(self, packet):
+        self.tx_queue += packet
+        self.tx_packets[packet[2]] = self.tx_packets.get(packet[2], 0) + 1
+
+    def run(self, duration=None):
+        self.running = True
+        t_last  = time.time()
+        t_stop  = None if duration is None else t_last + duration
+        while self.running:
+            rlist, _, _ = select.select([self.master_fd], [], [], self.tick)
+            if rlist:
+                try:
+                    data = os.read(self.master_fd, 4096)
+                except OSError:
+                    data = b''
+                self.rx_bytes += len(data)
+                for (packet_type, payload) in self.parser.feed(data):
+                    self.rx_packets[packet_type] = self.rx_packets.get(packet_type, 0) + 1
+                    self.handle_packet(packet_type, bytearray(payload))
+
+            t_now = time.time()
+            self.update_motors(t_now, t_now - t_last)
+            t_last = t_now
+            self.flush_tx(t_now)
+
+            if t_stop is not None and t_now >= t_stop:
+                break
+
+    def flush_tx(self, t_now):
+        # pace the output like a real uart at the configured baud rate
+        if not self.tx_queue or t_now < self.t_tx_free:
+            return
+        num_bytes = max(1, int(self.tick * self.baud_rate / 10.0))
+        chunk = self.tx_queue[:num_bytes]
+        try:
+            written = os.write(self.master_fd, bytes(chunk))
+        except OSError:
+            written = len(chunk)   # nobody listening, drop like an open uart line
+        del self.tx_queue[:written]
+        self.tx_bytes += written
+        self.t_tx_free = t_now + written * 10.0 / self.baud_rate
+
+    def update_motors(self, t_now, dt):
+        for esc in self.escs:
+            if esc.bootloader_until is not None and t_now > esc.bootloader_until:
+                esc.bootloader_until = None   # bootloader timed out, boot the firmware again
+            if esc.t_last_cmd is None or t_now - esc.t_last_cmd > self.cmd_timeout:
+                esc.power_cmd = 0.0
+                esc.rpm_cmd   = None
+            esc.motor.update(dt, power=esc.power_cmd, rpm=esc.rpm_cmd)
+
+    def handle_packet(self, packet_type, payload):
+        # resets are sent with the firmware protocol and reach the ESCs that are
+        # not in their bootloader, all other traffic goes to the bootloader(s)
+        if any(esc.bootloader_until is not None for esc in self.escs) and \
+                packet_type != proto.ESC_PACKET_TYPE_RESET_CMD:
+            self.handle_bootloader_packet(packet_type, payload)
+            return
+
+        if packet_type == proto.ESC_PACKET_TYPE_VERSION_REQUEST:
+            esc_ids = range(len(self.escs))
+            if payload and payload[0] != 0xFF:
+                esc_ids = [payload[0]]
+            for esc_id in esc_ids:
+                esc = self.get_esc(esc_id)
+                if esc is not None:
+                    self.send(esc.version_packet())
+
+        elif packet_type in (proto.ESC_PACKET_TYPE_PWM_CMD, proto.ESC_PACKET_TYPE_RPM_CMD):
+            (commands, led_bits, fb_id) = proto.parse_commands(payload)
+            t_now = time.time()
+            for (esc_id, cmd) in enumerate(commands):
+                esc = self.get_esc(esc_id)
+                if esc is None:
+                    continue
+                if packet_type == proto.ESC_PACKET_TYPE_PWM_CMD:
+                    esc.power_cmd = cmd / proto.CMD_POWER_SCALE
+                    esc.rpm_cmd   = None
+                else:
+                    esc.rpm_cmd   = cmd
+                esc.leds        = (led_bits >> (3 * esc_id)) & 0x07
+                esc.cmd_counter += 1
+                esc.t_last_cmd  = t_now
+            esc = self.get_esc(fb_id) if fb_id is not None else None
+            if esc is not None:
+                self.send(esc.feedback_packet())
+
+        elif packet_type in proto.CONFIG_REQUESTS:
+            esc = self.get_esc(payload[0]) if payload else None
+            section_type = proto.CONFIG_REQUESTS[packet_type]
+            if esc is not None and section_type in esc.config:
+                self.send(create_packet(section_type, bytearray([esc.esc_id]) + esc.config[section_type]))
+
+        elif packet_type in proto.CONFIG_REQUESTS.values():
+            # config pushes are broadcast, every ESC stores the section
+            for esc in self.escs:
+                esc.config[packet_type] = bytearray(payload)
+
+        elif packet_type == proto.ESC_PACKET_TYPE_RESET_CMD:
+            esc_id = payload[0] if payload else 0xFF
+            for esc in self.escs:
+                if esc_id in (0xFF, esc.esc_id) and esc.bootloader_until is None:
+                    esc.power_cmd = 0.0
+                    esc.rpm_cmd   = None
+                    esc.motor.rpm = 0.0
+                    esc.flash     = bytearray()
+                    esc.bootloader_until = time.time() + BOOTLOADER_WINDOW
+
+    def handle_bootloader_packet(self, packet_type, payload):
+        '''
+        Bootloader traffic is modeled at the framing level: every packet
+        addressed to an ESC in its bootloader window extends the window, page
+        data is stored to its flash image and the packet is acknowledged with
+        a packet of the same type carrying only the ESC ID.
+        '''
+        esc_id = payload[0] if payload else 0xFF
+        for esc in self.escs:
+            if esc.bootloader_until is None or esc_id not in (0xFF, esc.esc_id):
+                continue
+            esc.bootloader_until = time.time() + BOOTLOADER_WINDOW
+            if len(payload) > 1:
+                esc.flash += payload[1:]
+            self.send(create_packet(packet_type, bytearray([esc.esc_id])))
+
+    def get_stats(self):
+        return {
+            'rx_bytes'      : self.rx_bytes,
+            'tx_bytes'      : self.tx_bytes,
+            'rx_packets'    : dict((proto.PACKET_TYPE_NAMES.get(k, k), v) for (k, v) in self.rx_packets.items()),
+            'tx_packets'    : dict((proto.PACKET_TYPE_NAMES.get(k, k), v) for (k, v) in self.tx_packets.items()),
+            'crc_errors'    : self.parser.crc_errors,
+            'bytes_dropped' : self.parser.bytes_dropped,
+        }
@@ -0,0 +1,132 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Telemetry samples and the display stage used by the spin and calibration
+# tools. The command loop only reads feedback into a sample and pushes it to
+# the display, which is a bounded buffer; a separate thread renders the
+# latest sample of each ESC at a limited rate, so a slow terminal can no
+# longer stretch the command period.
+
+import sys
+import threading
+from collections import deque, namedtuple
+
+TelemetrySample = namedtuple('TelemetrySample',
+    ['t', 'esc_id', 'rpm', 'power', 'voltage', 'current', 'temperature'])
+
+
+def read_sample(esc, t):
+    return TelemetrySample(t, esc.get_id(), esc.get_rpm(), esc.get_power(),
+                           esc.get_voltage(), esc.get_current(), esc.get_temperature())
+
+
+def format_sample(s):
+    return '[%d] RPM: %.0f, PWR: %.0f, VBAT: %.2fV, TEMPERATURE: %.2fC, CURRENT: %.2fA' % (
+        s.esc_id, s.rpm, s.power, s.voltage, s.temperature, s.current)
+
+
+class TelemetryDisplay(object):
+    '''
+    Rate limited telemetry display. push() never blocks: samples go into a
+    bounded deque and the oldest ones are dropped if the consumer falls
+    behind. On a terminal the table (one row per ESC) is redrawn in place,
+    otherwise rows are appended at the display rate. With quiet=True
+    nothing is printed and push() is a no-op.
+    '''
+    def __init__(self, display_rate=10.0, quiet=False, max_samples=1024, stream=None):
+        self.period  = 1.0 / display_rate if display_rate > 0 else 0.1
+        self.quiet   = quiet
+        self.samples = deque(maxlen=max_samples)
+        self.stream  = stream if stream is not None else sys.stdout
+        self.in_place = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.latest  = {}
+        self.num_rows_drawn = 0
+        self.header  = None
+        self.stop_event = threading.Event()
+        self.thread  = None
+
+    def start(self):
+        if self.quiet:
+            return self
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        self._render()
+
+    def push(self, sample):
+        if not self.quiet:
+            self.samples.append(sample)
+
+    def set_header(self, header):
+        '''
+        Optional status line drawn above the table (e.g. current calibration step)
+        '''
+        self.header = header
+
+    def _run(self):
+        while not self.stop_event.wait(self.period):
+            self._render()
+
+    def _render(self):
+        updated = False
+        while True:
+            try:
+                s = self.samples.popleft()
+            except IndexError:
+                break
+            self.latest[s.esc_id] = s
+            updated = True
+        if not updated:
+            return
+
+        lines = []
+        if self.header is not None:
+            lines.append(self.header)
+        lines.extend(format_sample(self.latest[esc_id]) for esc_id in sorted(self.latest))
+
+        out = []
+        if self.in_place and self.num_rows_drawn:
+            out.append('\033[%dF' % self.num_rows_drawn)
+        for line in lines:
+            out.append(line + ('\033[K\n' if self.in_place else '\n'))
+        self.stream.write(''.join(out))
+        self.stream.flush()
+        self.num_rows_drawn = len(lines)
@@ -0,0 +1,188 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Auto-tuning of the ESC RPM controller (TuneParams kp, ki, max_kpe, max_kie,
+# max_rpm_delta). Every candidate costs a bench run (push the tune config,
+# reset the ESCs, run a short step response profile), so the search is a
+# bounded Nelder-Mead simplex that needs few evaluations, works on integer
+# params (evaluations of a rounded candidate are cached) and never leaves the
+# safety limits: candidates are clipped to the limits before they are pushed.
+#
+# The cost of a run is in RPM: rms tracking error, plus OVERSHOOT_WEIGHT per
+# percent of overshoot and UNSETTLED_PENALTY per step that did not settle.
+
+import numpy as np
+
+TUNE_PARAMS = ['kp', 'ki', 'max_kpe', 'max_kie', 'max_rpm_delta']
+
+# hard limits, --limit can only narrow them
+SAFETY_LIMITS = {
+    'kp'            : (0, 500),
+    'ki'            : (0, 300),
+    'max_kpe'       : (0, 999),
+    'max_kie'       : (0, 999),
+    'max_rpm_delta' : (100, 5000),
+}
+
+OVERSHOOT_WEIGHT  = 20.0     # rpm of cost per percent of overshoot
+UNSETTLED_PENALTY = 500.0    # rpm of cost per step that did not settle
+FAILED_COST       = 1.0e6    # cost of a run that was aborted by a safety check
+MAX_EVALS         = 30
+INITIAL_STEP      = 0.2      # initial simplex size, fraction of the search range
+MIN_SIMPLEX_SIZE  = 0.01     # converged when all candidates are this close, fraction of the range
+
+
+class SearchDone(Exception):
+    '''
+    Raised by the objective to end the search early (e.g. evaluation budget used)
+    '''
+    pass
+
+
+def parse_limits(specs, names=TUNE_PARAMS):
+    '''
+    ['kp=50:300', ...] -> dict name -> (lo, hi) for all names, starting from
+    SAFETY_LIMITS. Raises ValueError for unknown names and for limits
+    outside SAFETY_LIMITS
+    '''
+    for name in names:
+        if name not in SAFETY_LIMITS:
+            raise ValueError('%s is not a tunable param (%s)' % (name, ', '.join(TUNE_PARAMS)))
+    limits = dict((name, SAFETY_LIMITS[name]) for name in names)
+    for spec in specs or []:
+        try:
+            (name, rng) = spec.split('=', 1)
+            (lo, hi) = [int(v) for v in rng.split(':', 1)]
+        except ValueError:
+            raise ValueError('limit "%s" is not NAME=LO:HI' % spec)
+        if name not in SAFETY_LIMITS:
+            raise ValueError('%s is not a tunable param (%s)' % (name, ', '.join(TUNE_PARAMS)))
+        (safe_lo, safe_hi) = SAFETY_LIMITS[name]
+        if lo > hi or lo < safe_lo or hi > safe_hi:
+            raise ValueError('limit for %s must be within %d:%d' % (name, safe_lo, safe_hi))
+        if name in limits:
+            limits[name] = (lo, hi)
+    return limits
+
+
+def tune_profile(min_rpm, max_rpm):
+    '''
+    Short step profile spanning the RPM range of the params file: steps up
+    and down between 25%, 50% and 75% of the range and one ramp
+    '''
+    levels = [int(round(min_rpm + f * (max_rpm - min_rpm), -2)) for f in (0.25, 0.5, 0.75)]
+    return '%d:1,%d:1,%d:1,%d:1,%d/1' % (levels[0], levels[1], levels[2], levels[0], levels[2])
+
+
+def run_cost(summaries):
+    '''
+    Cost of a run from the escresponse.summarize() result of every ESC (mean over ESCs)
+    '''
+    costs = []
+    for s in summaries:
+        cost = s['rms_error']
+        if cost != cost:
+            return FAILED_COST
+        if s['max_overshoot'] == s['max_overshoot']:
+            cost += OVERSHOOT_WEIGHT * s['max_overshoot']
+        cost += UNSETTLED_PENALTY * s['unsettled_steps']
+        costs.append(cost)
+    return float(np.mean(costs)) if costs else FAILED_COST
+
+
+def minimize(f, x0, lower, upper, initial_step=INITIAL_STEP, min_size=MIN_SIMPLEX_SIZE, max_calls=1000):
+    '''
+    Nelder-Mead simplex search for the minimum of f(x) with lower <= x <= upper.
+    The search runs in coordinates normalized to the bounds and every point is
+    clipped to them. Stops when the simplex has collapsed, after max_calls
+    calls of f or when f raises SearchDone. Returns (best x, best f(x))
+    '''
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    span  = np.where(upper > lower, upper - lower, 1.0)
+    n     = len(lower)
+    best  = [None, float('inf')]
+    calls = [0]
+
+    def evaluate(u):
+        if calls[0] >= max_calls:
+            raise SearchDone()
+        calls[0] += 1
+        x = lower + np.clip(u, 0.0, 1.0) * span
+        fx = f(x)
+        if fx < best[1]:
+            best[0] = x
+            best[1] = fx
+        return fx
+
+    u0 = np.clip((np.asarray(x0, dtype=float) - lower) / span, 0.0, 1.0)
+    simplex = [u0]
+    for i in range(n):
+        u = u0.copy()
+        u[i] = u[i] + initial_step if u[i] + initial_step <= 1.0 else u[i] - initial_step
+        simplex.append(u)
+
+    try:
+        values = [evaluate(u) for u in simplex]
+        while True:
+            order   = np.argsort(values)
+            simplex = [simplex[i] for i in order]
+            values  = [values[i] for i in order]
+            if max(np.max(np.abs(u - simplex[0])) for u in simplex[1:]) < min_size:
+                break
+
+            centroid = np.mean(simplex[:-1], axis=0)
+            worst    = simplex[-1]
+            ur = np.clip(centroid + (centroid - worst), 0.0, 1.0)
+            fr = evaluate(ur)
+            if fr < values[0]:
+                ue = np.clip(centroid + 2.0 * (centroid - worst), 0.0, 1.0)
+                fe = evaluate(ue)
+                (simplex[-1], values[-1]) = (ue, fe) if fe < fr else (ur, fr)
+            elif fr < values[-2]:
+                (simplex[-1], values[-1]) = (ur, fr)
+            else:
+                if fr < values[-1]:
+                    uc = centroid + 0.5 * (ur - centroid)
+                else:
+                    uc = centroid + 0.5 * (worst - centroid)
+                fc = evaluate(uc)
+                if fc < min(fr, values[-1]):
+                    (simplex[-1], values[-1]) = (uc, fc)
+                else:
+                    for i in range(1, n + 1):
+                        simplex[i] = simplex[0] + 0.5 * (simplex[i] - simplex[0])
+                        values[i]  = evaluate(simplex[i])
+    except SearchDone:
+        pass
+    return (best[0], best[1])
@@ -0,0 +1,147 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Flashes several simulated ESCs with escfirmware.flash_escs. The bootloader
+# window is shortened so that an ESC which is reset long before its upload
+# starts times out, like the real bootloader does. Run from the tools directory:
+#
+#   python -m unittest test_escfirmware
+
+import os
+import time
+import select
+import threading
+import unittest
+
+import escsim
+import escfirmware
+import escprotocol as proto
+from escprotocol import create_packet
+
+BOOTLOADER_WINDOW = 0.3    # seconds, shortened from escsim.BOOTLOADER_WINDOW
+PAGE_TIME         = 0.03   # seconds to write one page
+ACK_TIMEOUT       = 0.1
+PAGE_TYPE         = 0x80   # bootloader packets are only modeled at the framing level
+
+
+class SimBootloaderManager(object):
+    '''
+    The parts of EscManager used by flash_escs, talking to an EscSimulator
+    directly over its pty. Each page is sent to the bootloader and must be
+    acknowledged before the next one is sent.
+    '''
+    def __init__(self, device, page_size=64):
+        self.fd        = os.open(device, os.O_RDWR | os.O_NOCTTY)
+        self.parser    = proto.PacketParser()
+        self.page_size = page_size
+        self.calls     = []
+
+    def close(self):
+        os.close(self.fd)
+
+    def set_protocol(self, protocol):
+        self.calls.append(('set_protocol', protocol))
+
+    def set_baudrate(self, baudrate):
+        self.calls.append(('set_baudrate', baudrate))
+
+    def reset_id(self, esc_id):
+        self.calls.append(('reset_id', esc_id))
+        os.write(self.fd, bytes(create_packet(proto.ESC_PACKET_TYPE_RESET_CMD, bytearray([esc_id]))))
+
+    def wait_ack(self, esc_id):
+        t_stop = time.time() + ACK_TIMEOUT
+        while time.time() < t_stop:
+            rlist, _, _ = select.select([self.fd], [], [], 0.01)
+            if not rlist:
+                continue
+            for (packet_type, payload) in self.parser.feed(os.read(self.fd, 4096)):
+                if packet_type == PAGE_TYPE and bytearray(payload)[:1] == bytearray([esc_id]):
+                    return True
+        return False
+
+    def upload_firmware(self, image, esc_id):
+        self.calls.append(('upload_firmware', esc_id))
+        pages = [image[i:i + self.page_size] for i in range(0, len(image), self.page_size)]
+        for (num, page) in enumerate(pages):
+            os.write(self.fd, bytes(create_packet(PAGE_TYPE, bytearray([esc_id]) + page)))
+            if not self.wait_ack(esc_id):
+                yield -1
+                return
+            time.sleep(PAGE_TIME)
+            yield float(num + 1) / len(pages)
+
+
+class FlashEscsTest(unittest.TestCase):
+    def setUp(self):
+        self.window = escsim.BOOTLOADER_WINDOW
+        escsim.BOOTLOADER_WINDOW = BOOTLOADER_WINDOW
+        self.sim = escsim.EscSimulator(num_escs=4)
+        self.manager = SimBootloaderManager(self.sim.open())
+        self.thread = threading.Thread(target=self.sim.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.sim.stop()
+        self.thread.join()
+        self.manager.close()
+        self.sim.close()
+        escsim.BOOTLOADER_WINDOW = self.window
+
+    def test_flash_all_escs(self):
+        # each upload takes longer than the bootloader window
+        image = bytearray(os.urandom(640))
+        esc_ids = [esc.esc_id for esc in self.sim.escs]
+        results = escfirmware.flash_escs(self.manager, image, esc_ids, esc_ids, 250000, 230400,
+                                         reset_delay=0.05)
+
+        self.assertEqual([r[0] for r in results], esc_ids)
+        for (esc_id, success, duration) in results:
+            self.assertTrue(success, 'ESC %d was not flashed' % esc_id)
+            self.assertEqual(self.sim.get_esc(esc_id).flash, image)
+        self.assertTrue(all(r[2] > BOOTLOADER_WINDOW for r in results))
+
+    def test_reset_before_each_upload(self):
+        image = bytearray(64)
+        escfirmware.flash_escs(self.manager, image, [1, 2], [1, 2], 250000, 230400, reset_delay=0.05)
+        self.assertEqual(self.manager.calls, [
+            ('set_protocol', proto.ESC_PROTOCOL_FIRMWARE), ('set_baudrate', 250000), ('reset_id', 1),
+            ('set_protocol', proto.ESC_PROTOCOL_BOOTLOADER), ('set_baudrate', 230400), ('upload_firmware', 1),
+            ('set_protocol', proto.ESC_PROTOCOL_FIRMWARE), ('set_baudrate', 250000), ('reset_id', 2),
+            ('set_protocol', proto.ESC_PROTOCOL_BOOTLOADER), ('set_baudrate', 230400), ('upload_firmware', 2),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
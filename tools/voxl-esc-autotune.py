@@ -0,0 +1,247 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Bench auto-tuning of the RPM controller. Starting from the TuneParams of a
+# params file, candidate kp / ki / max_kpe / max_kie / max_rpm_delta values
+# are pushed to the ESCs and scored with a short RPM step response run (see
+# esctune.py). The best candidate is left on the ESCs and written to a new
+# params file; all other params are kept from the original file.
+
+import sys
+sys.path.append('./voxl-esc-tools-bin')
+
+import json
+import time
+import argparse
+from escconnect import RESET_BOOT_TIME, EscConnectError, add_connection_args, connect, open_escs
+from escparams import read_params_fields, update_params_xml
+from escconfig import load_params, select_sections, upload_config
+from escresponse import SETTLE_BAND, parse_profile, Profile, run_profile, analyze, summarize, json_safe
+from esctune import TUNE_PARAMS, MAX_EVALS, FAILED_COST, SearchDone, parse_limits, tune_profile, run_cost, minimize
+
+MAX_SAFE_RPM = 30000
+
+parser = argparse.ArgumentParser(description='ESC RPM Controller Auto-Tune Script')
+add_connection_args(parser, daemon=False)
+parser.add_argument('--id',              type=int,   required=True,  default=0)  # 255 = all detected ESCs
+parser.add_argument('--params-file',     type=str,   required=True,  default=None)  # params of the motor / prop to tune
+parser.add_argument('--output-params',   type=str,   required=True,  default=None)
+parser.add_argument('--tune',            type=str,   required=False, default=','.join(TUNE_PARAMS))
+parser.add_argument('--limit',           type=str,   required=False, default=[], action='append')  # NAME=LO:HI, narrows the safety limits
+parser.add_argument('--max-evals',       type=int,   required=False, default=MAX_EVALS)  # bench runs
+parser.add_argument('--profile',         type=str,   required=False, default=None)  # default: steps within min_rpm..max_rpm of the params file
+parser.add_argument('--rate-hz',         type=float, required=False, default=100.0)
+parser.add_argument('--settle-band',     type=float, required=False, default=SETTLE_BAND)
+parser.add_argument('--max-current',     type=float, required=False, default=20.0)  # A, abort a run above this
+parser.add_argument('--max-temperature', type=float, required=False, default=80.0)  # C, abort a run above this
+parser.add_argument('--json',            type=str,   required=False, default=None)  # write all evaluations to a json file
+parser.add_argument('--skip-prompt',     type=str,   required=False, default='False')
+args = parser.parse_args()
+
+esc_id = args.id
+skip_prompt = 'True' in args.skip_prompt or 'true' in args.skip_prompt
+
+try:
+    base_xml = open(args.params_file, 'r').read()
+except IOError as e:
+    print('ERROR: Could not read params file: ' + str(e))
+    sys.exit(1)
+tune_fields = read_params_fields(base_xml).get('TuneParams', {})
+
+names = [n.strip() for n in args.tune.split(',') if n.strip()]
+try:
+    limits = parse_limits(args.limit, names)
+except ValueError as e:
+    print('ERROR: ' + str(e))
+    sys.exit(1)
+if len(names) == 0 or any(n not in tune_fields for n in names):
+    print('ERROR: --tune must name params in the TuneParams of the params file: %s' % ', '.join(TUNE_PARAMS))
+    sys.exit(1)
+
+try:
+    min_rpm = float(tune_fields['min_rpm'])
+    max_rpm = float(tune_fields['max_rpm'])
+    profile_spec = args.profile if args.profile is not None else tune_profile(min_rpm, max_rpm)
+    profile = Profile(parse_profile(profile_spec))
+except (KeyError, ValueError) as e:
+    print('ERROR: Invalid profile or params file: ' + str(e))
+    sys.exit(1)
+
+max_profile_rpm = max(abs(rpm) for (_, rpm, _) in profile.segments)
+if max_profile_rpm > min(max_rpm, MAX_SAFE_RPM):
+    print('ERROR: Profile rpm must not exceed max_rpm of the params file (%d)' % max_rpm)
+    sys.exit(1)
+overspeed_rpm = max_profile_rpm + 0.5 * (max_rpm - max_profile_rpm) + 1000
+
+if args.max_evals < len(names) + 1:
+    print('ERROR: --max-evals must be at least %d to tune %d params' % (len(names) + 1, len(names)))
+    sys.exit(1)
+
+if args.rate_hz <= 0 or args.rate_hz > 1000:
+    print('ERROR: Command rate must be between 0 and 1000 Hz')
+    sys.exit(1)
+
+(esc_manager, escs) = connect(args, [esc_id] if esc_id != 255 else None)
+all_ids = sorted(e.get_id() for e in escs)
+test_ids = [esc_id] if esc_id != 255 else all_ids
+if not set(test_ids) <= set(all_ids):
+    print('ERROR: Specified ESC ID not found--exiting.')
+    sys.exit(1)
+
+if not skip_prompt:
+    print('WARNING: ')
+    print('This test requires motors to spin at high speeds with')
+    print('propellers attached. Please ensure that appropriate')
+    print('protective equipment is being worn at all times and')
+    print('that the motor and propeller are adequately isolated')
+    print('from all persons.')
+    print('')
+    print('Every candidate is uploaded to the ESCs, which are reset')
+    print('in between runs. The tuning will take about %d minutes.' % max(1, round(args.max_evals * (profile.duration + 3.0) / 60.0)))
+    print('')
+    response = raw_input('Type "Yes" to continue: ')
+    if response not in ['yes', 'Yes', 'YES']:
+        print('Test canceled by user')
+        sys.exit(1)
+
+state = {'esc_manager': esc_manager}
+
+def push_tune_params(candidate):
+    '''
+    Upload the tune section with the candidate values and reset the ESCs if
+    anything changed. The ESCs are reopened after the reset
+    '''
+    xml = update_params_xml(base_xml, dict((k, str(v)) for (k, v) in candidate.items()))
+    load_params(state['esc_manager'], xml, 'xml')
+    (pushed, failed) = upload_config(state['esc_manager'], all_ids, select_sections(['tune']))
+    if len(failed) > 0:
+        raise EscConnectError('upload not confirmed by ESC ID(s) %s' % ', '.join(str(i) for i in failed))
+    if len(pushed) > 0:
+        state['esc_manager'].reset_all()
+        state['esc_manager'].close()
+        time.sleep(RESET_BOOT_TIME)
+        (state['esc_manager'], _) = open_escs(args.device, args.baud_rate, all_ids)
+    return xml
+
+def check(sample):
+    if sample.rpm > overspeed_rpm:
+        return 'overspeed (%d RPM)' % sample.rpm
+    if sample.current > args.max_current:
+        return 'overcurrent (%.1f A)' % sample.current
+    if sample.temperature > args.max_temperature:
+        return 'overtemperature (%.1f C)' % sample.temperature
+    return None
+
+evaluations = []
+cache = {}
+
+def objective(x):
+    candidate = dict((n, int(round(v))) for (n, v) in zip(names, x))
+    key = tuple(candidate[n] for n in names)
+    if key in cache:
+        return cache[key]
+    if len(evaluations) >= args.max_evals:
+        raise SearchDone()
+
+    text = ', '.join('%s=%d' % (n, candidate[n]) for n in names)
+    try:
+        push_tune_params(candidate)
+    except Exception as e:
+        print('ERROR: Could not upload %s: %s' % (text, str(e)))
+        raise SearchDone()
+
+    em = state['esc_manager']
+    if esc_id != 255:
+        em.set_highspeed_fb(esc_id)
+    test_escs = [em.get_esc_by_id(i) for i in test_ids]
+    (data, loop, reason) = run_profile(em, test_escs, profile, args.rate_hz, check=check)
+    if reason == 'stopped by user':
+        print('')
+        print('INFO: Stopped by user')
+        raise SearchDone()
+
+    summaries = dict((i, summarize(analyze(profile, *data[i], settle_band=args.settle_band))) for i in test_ids)
+    cost = run_cost(summaries.values()) if reason is None else FAILED_COST
+    cache[key] = cost
+    evaluations.append({'params': candidate, 'cost': cost, 'aborted': reason,
+                        'summary': dict((str(i), s) for (i, s) in summaries.items())})
+
+    s = summaries[test_ids[0]] if len(test_ids) == 1 else None
+    if reason is not None:
+        detail = 'aborted: ' + reason
+    elif s is not None:
+        detail = 'rms %.1f RPM, overshoot %.1f%%, settling %.0f ms' % (s['rms_error'], s['max_overshoot'], s['mean_settling_time'] * 1000.0)
+    else:
+        detail = 'mean over %d ESCs' % len(test_ids)
+    print('INFO: Run %2d/%d: %s -> cost %.1f (%s)' % (len(evaluations), args.max_evals, text, cost, detail))
+    return cost
+
+x0     = [min(max(float(tune_fields[n]), limits[n][0]), limits[n][1]) for n in names]
+lower  = [limits[n][0] for n in names]
+upper  = [limits[n][1] for n in names]
+t_start = time.time()
+print('INFO: Tuning %s with profile %s' % (', '.join('%s in %d..%d' % (n, limits[n][0], limits[n][1]) for n in names), profile_spec))
+minimize(objective, x0, lower, upper)
+
+if len(evaluations) == 0:
+    print('ERROR: No runs completed')
+    state['esc_manager'].close()
+    sys.exit(1)
+
+best = min(evaluations, key=lambda e: e['cost'])
+print('INFO: %d runs in %.0f seconds' % (len(evaluations), time.time() - t_start))
+print('INFO: Start: %s -> cost %.1f' % (', '.join('%s=%d' % (n, evaluations[0]['params'][n]) for n in names), evaluations[0]['cost']))
+print('INFO: Best:  %s -> cost %.1f' % (', '.join('%s=%d' % (n, best['params'][n]) for n in names), best['cost']))
+
+if best['cost'] >= FAILED_COST:
+    print('ERROR: All runs were aborted, not writing %s' % args.output_params)
+    state['esc_manager'].close()
+    sys.exit(1)
+
+# leave the best candidate on the ESCs
+try:
+    xml = push_tune_params(best['params'])
+except Exception as e:
+    print('ERROR: Could not upload the best params: ' + str(e))
+    xml = update_params_xml(base_xml, dict((k, str(v)) for (k, v) in best['params'].items()))
+state['esc_manager'].close()
+
+with open(args.output_params, 'w') as f:
+    f.write(xml)
+print('INFO: Wrote tuned params to %s' % args.output_params)
+
+if args.json is not None:
+    with open(args.json, 'w') as f:
+        json.dump(json_safe({'params_file': args.params_file, 'profile': profile_spec, 'limits': limits,
+                          'best': best, 'evaluations': evaluations}), f, indent=2, sort_keys=True)
+    print('INFO: Wrote %d runs to %s' % (len(evaluations), args.json))
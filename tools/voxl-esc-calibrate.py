@@ -32,44 +32,43 @@
 # For a license to use on non-ModalAI hardware, please contact license@modalai.com
 
 import sys
+import os
 sys.path.append('./voxl-esc-tools-bin')
 
-from libesc import *
 import time
 import numpy as np
 import argparse
+from escconnect import add_connection_args, connect
+from esctelemetry import TelemetryDisplay, read_sample
+from escrecord import TelemetryRecorder
+from escexport import add_export_args, open_exporter
+from escmonitor import LinkMonitor
+from escloop import monotonic
+from esccalib import SettlingDetector, AdaptiveStep, fit_curve, rpm_limits, motor_voltages, coefficient_spread, save_sweep
 
 parser = argparse.ArgumentParser(description='ESC Calibration Script')
-parser.add_argument('--device',              required=False, default=None)
-parser.add_argument('--baud_rate',           required=False, default=None)
-parser.add_argument('--id',        type=int, required=False, default=0)
+add_connection_args(parser, baud_rate_option='--baud_rate')
+parser.add_argument('--id',        type=int, required=False, default=0)  # 255 = all detected ESCs
 parser.add_argument('--pwm-min',   type=int, required=False, default=10)
 parser.add_argument('--pwm-max',   type=int, required=False, default=90)
+parser.add_argument('--display-rate', type=float, required=False, default=10.0)
+parser.add_argument('--quiet',     action='store_true')
+parser.add_argument('--record',    type=str, required=False, default=None)
+parser.add_argument('--stats',     action='store_true')  # link health summary at exit
+parser.add_argument('--adaptive',  action='store_true')
+parser.add_argument('--max-step',  type=int, required=False, default=4)
+parser.add_argument('--schedule',  type=str, required=False, default='together', choices=['together', 'staggered'])
+parser.add_argument('--base-params',   type=str, required=False, default=None)  # params file to start from, e.g. params/...xml
+parser.add_argument('--output-params', type=str, required=False, default=None)  # write base params with the fitted curve
+parser.add_argument('--save-sweep', type=str, required=False, default=None)  # save raw measurements for voxl-esc-refit.py
+parser.add_argument('--label',     type=str, required=False, default=None)  # motor / prop name, defaults to the base params name
+add_export_args(parser)
 args = parser.parse_args()
 
-devpath  = args.device
-baudrate = args.baud_rate
 esc_id   = args.id
 PWM_MIN  = args.pwm_min
 PWM_MAX  = args.pwm_max
 
-if devpath is not None and baudrate is None:
-    print 'ERROR: Please provide baud rate with --baud-rate option'
-    sys.exit(1)
-
-if devpath is None:
-    print 'INFO: Device and baud rate are not provided, attempting to autodetect..'
-    scanner = SerialScanner()
-    (devpath, baudrate) = scanner.scan()
-
-    if devpath is not None and baudrate is not None:
-        print ''
-        print 'INFO: ESC(s) detected on port: ' + devpath + ' using baudrate: ' + str(baudrate)
-        print 'INFO: Attempting to open...'
-    else:
-        print 'ERROR: No ESC(s) detected, exiting.'
-        sys.exit(1)
-
 #check input arguments
 if PWM_MIN < 10 or PWM_MIN > 50:
     print 'ERROR: Minimum power must be between 10 and 50'
@@ -83,31 +82,50 @@ if PWM_MAX < PWM_MIN:
     print 'ERROR: Maximum power must be greater than minimum power'
     sys.exit(1)
 
+if args.display_rate <= 0:
+    print 'ERROR: Display rate must be positive'
+    sys.exit(1)
+
+if args.stats and args.daemon is not None:
+    print 'ERROR: --stats needs direct access to the serial port and cannot be used with --daemon'
+    sys.exit(1)
+
+if args.max_step < 1:
+    print 'ERROR: Maximum power step must be at least 1'
+    sys.exit(1)
+
+if (args.base_params is None) != (args.output_params is None):
+    print 'ERROR: --base-params and --output-params must be used together'
+    sys.exit(1)
+
+base_xml = None
+if args.base_params is not None:
+    try:
+        base_xml = open(args.base_params, 'r').read()
+    except IOError as e:
+        print 'ERROR: Could not read base params file: ' + str(e)
+        sys.exit(1)
+
 # PWM goal
 PWM_STEP       = 1
 STEPDURATION   = 0.50 #seconds
 TRANSITIONTIME = 0.40
 
-# create ESC manager and search for ESCs
-try:
-    esc_manager = EscManager()
-    esc_manager.open(devpath, baudrate)
-except Exception as e:
-    print 'ERROR: Unable to connect to ESCs :'
-    print e
-    sys.exit(1)
+# adaptive sweep: a step ends when RPM has settled (but not before MIN_TRANSITIONTIME)
+MIN_TRANSITIONTIME = 0.10
+MAX_STEPDURATION   = 1.00
+SETTLING_SAMPLES   = 10
 
-# wait a little to let manager find all ESCs
-time.sleep(0.25)
-num_escs = len(esc_manager.get_escs())
-if num_escs < 1:
-    print 'ERROR: No ESCs detected--exiting.'
-    sys.exit(1)
+# create ESC manager and search for ESCs
+(esc_manager, escs) = connect(args, [esc_id] if esc_id != 255 else None)
 
-esc = esc_manager.get_esc_by_id(esc_id)
-if esc is None:
-    print 'ERROR: Specified ESC ID not found--exiting.'
-    sys.exit(1)
+escs = sorted(escs, key=lambda e: e.get_id())
+if esc_id != 255:
+    escs = [e for e in escs if e.get_id() == esc_id]
+    if len(escs) == 0:
+        print 'ERROR: Specified ESC ID not found--exiting.'
+        sys.exit(1)
+esc_ids = [e.get_id() for e in escs]
 
 # warn user
 print 'WARNING: '
@@ -126,63 +144,196 @@ if response not in ['yes', 'Yes', 'YES']:
     sys.exit(1)
 
 # get ESC software version. sw_version < 20 means gen1 ESC, otherwise gen2
-sw_version = esc.get_versions()[0]
+sw_version = escs[0].get_versions()[0]
 
-# spin up
-esc_manager.set_highspeed_fb(esc_id)  #tell ESC manager to only request feedback from this ID (so we get feedback 4x more often)
-esc.set_target_power(10)
-t_start = time.time()
-while time.time() - t_start < 1.0:
-    time.sleep(0.05)
-    esc_manager.send_pwm_targets()
+display = TelemetryDisplay(args.display_rate, args.quiet).start()
+recorder = TelemetryRecorder(args.record) if args.record is not None else None
+exporter = open_exporter(args)
+monitor = LinkMonitor() if args.stats else None
+if monitor is not None and not monitor.install():
+    print 'ERROR: --stats requires pyserial'
+    sys.exit(1)
 
-measurements = []
-t_test_start= time.time()
+def sweep(sweep_escs):
+    '''
+    Step the power of all sweep_escs together from 10% to PWM_MAX.
+    Returns (dict esc_id -> measurements, number of steps, number of steps that did not settle)
+    '''
+    measurements = dict((e.get_id(), []) for e in sweep_escs)
+    num_steps = 0
+    num_unsettled = 0
 
-# ramp up from min to max
-pwm_now = 10
-while pwm_now < PWM_MAX:
-    esc.set_target_power(pwm_now)
+    # spin up
+    if len(sweep_escs) == 1:
+        esc_manager.set_highspeed_fb(sweep_escs[0].get_id())  #tell ESC manager to only request feedback from this ID (so we get feedback 4x more often)
+    for e in sweep_escs:
+        e.set_target_power(10)
     t_start = time.time()
-    print ''
-    while time.time() - t_start < STEPDURATION:
-        time.sleep(0.01)
+    while time.time() - t_start < 1.0:
+        time.sleep(0.05)
         esc_manager.send_pwm_targets()
-        if pwm_now >= PWM_MIN and time.time() - t_start >= TRANSITIONTIME:
-            measurements.append(
-                [esc.get_power(), esc.get_rpm(), esc.get_voltage(), esc.get_current()])
-            print 'POW: %d, RPM: %.2f, Voltage: %.2fV, Current: %.2fA' % (esc.get_power(), esc.get_rpm(), esc.get_voltage(), esc.get_current())
-    pwm_now += PWM_STEP
+
+    settling = dict((e.get_id(), SettlingDetector(SETTLING_SAMPLES)) for e in sweep_escs)
+    step_size = AdaptiveStep(PWM_STEP, args.max_step)
+
+    # ramp up from min to max
+    pwm_now = 10
+    while pwm_now < PWM_MAX:
+        for e in sweep_escs:
+            e.set_target_power(pwm_now)
+        display.set_header('Step: %d%% power, ID(s): %s' % (pwm_now, ', '.join(str(e.get_id()) for e in sweep_escs)))
+        for detector in settling.values():
+            detector.reset()
+        settled = set()
+        t_start = time.time()
+        while time.time() - t_start < (MAX_STEPDURATION if args.adaptive else STEPDURATION):
+            time.sleep(0.01)
+            esc_manager.send_pwm_targets()
+            t_now = monotonic()
+            for e in sweep_escs:
+                sample = read_sample(e, t_now)
+                if monitor is not None:
+                    monitor.feedback_read(sample.esc_id, t_now)
+                if recorder is not None:
+                    recorder.append(sample, pwm_now)
+                if exporter is not None:
+                    exporter.push(sample, pwm_now)
+                if args.adaptive:
+                    display.push(sample)
+                    if sample.esc_id not in settled and time.time() - t_start >= MIN_TRANSITIONTIME and \
+                            settling[sample.esc_id].add(sample):
+                        settled.add(sample.esc_id)
+                elif pwm_now >= PWM_MIN and time.time() - t_start >= TRANSITIONTIME:
+                    measurements[sample.esc_id].append([sample.power, sample.rpm, sample.voltage, sample.current])
+                    display.push(sample)
+            if args.adaptive and len(settled) == len(sweep_escs):
+                break
+        num_steps += 1
+
+        if args.adaptive:
+            # keep the settled window of every ESC as the measurement of this step
+            if len(settled) < len(sweep_escs):
+                num_unsettled += 1
+            step_rpms = []
+            for (sweep_id, detector) in settling.items():
+                if pwm_now >= PWM_MIN:
+                    measurements[sweep_id].extend([s.power, s.rpm, s.voltage, s.current] for s in detector.samples)
+                step_rpms.extend(s.rpm for s in detector.samples)
+            pwm_now += step_size.update(pwm_now, np.mean(step_rpms) if step_rpms else 0.0)
+        else:
+            pwm_now += PWM_STEP
+
+    for e in sweep_escs:
+        e.set_target_power(0)
+    return (measurements, num_steps, num_unsettled)
+
+t_test_start= time.time()
+
+# sweep all motors together, or one after another (less supply current, high speed feedback for each)
+measurements = {}
+num_steps = 0
+num_unsettled = 0
+if args.schedule == 'staggered':
+    sweep_groups = [[e] for e in escs]
+else:
+    sweep_groups = [escs]
+for sweep_escs in sweep_groups:
+    (group_measurements, group_steps, group_unsettled) = sweep(sweep_escs)
+    measurements.update(group_measurements)
+    num_steps += group_steps
+    num_unsettled += group_unsettled
+
+display.stop()
+if monitor is not None:
+    monitor.uninstall()
+if exporter is not None:
+    exporter.stop()
+if recorder is not None:
+    recorder.close()
+    print 'INFO: Recorded %d samples to %s' % (recorder.num_records, args.record)
 
 # close the manager and UART thread
 esc_manager.close()
 t_test_stop= time.time()
 print 'INFO: Test took %.2f seconds' % (t_test_stop-t_test_start)
+if monitor is not None:
+    for line in monitor.summary():
+        print 'INFO: ' + line
 
-# parse measurements
-pwms     = [data[0] for data in measurements]
-rpms     = [data[1] for data in measurements]
-voltages = [data[2] for data in measurements]
-currents = [data[3] for data in measurements]
+if args.save_sweep is not None:
+    label = args.label
+    if label is None:
+        label = os.path.splitext(os.path.basename(args.base_params))[0] if args.base_params is not None else ''
+    try:
+        save_sweep(args.save_sweep, measurements, label, (PWM_MIN, PWM_MAX))
+        print 'INFO: Saved sweep to %s' % (args.save_sweep)
+    except IOError as e:
+        print 'WARNING: Could not save sweep: ' + str(e)
+if args.adaptive:
+    print 'INFO: Adaptive sweep: %d steps, %d did not settle within %.1f seconds' % (num_steps, num_unsettled, MAX_STEPDURATION)
 
-#reported power is 0-100, but in ESC firmware it is 0-1000
-motor_voltages = [pwms[i]*10.0/999.0*(voltages[i]*1000) for i in range(len(pwms))]
-#print motor_voltages
+# fit every motor separately; with several motors also fit all data together
+fits = {}
+for esc_id in esc_ids:
+    if len(measurements[esc_id]) < 3:
+        print 'ERROR: Not enough measurements for ESC ID %d' % (esc_id)
+        sys.exit(1)
+    try:
+        fits[esc_id] = fit_curve(measurements[esc_id])
+    except ValueError as e:
+        print 'ERROR: Fit failed for ESC ID %d: %s' % (esc_id, str(e))
+        sys.exit(1)
 
-# linear fit or quadratic fit
-ply = np.polyfit(rpms, motor_voltages, 2)
-motor_voltages_fit = np.polyval(ply, rpms)
+all_measurements = np.concatenate([np.asarray(measurements[esc_id], dtype=float) for esc_id in esc_ids])
+fit = fit_curve(all_measurements)
+ply = fit['coeffs']
+rpms = all_measurements[fit['mask'], 1]
+
+def print_residuals(prefix, f):
+    print '%sresiduals: rms %.1f mV, max %.1f mV, R^2 %.5f, %d of %d samples rejected' % (prefix,
+        f['rms'], f['max'], f['r2'], np.sum(~f['mask']), len(f['mask']))
+
+if len(esc_ids) > 1:
+    print 'Per-motor quadratic fits: motor_voltage = a2*rpm_desired^2 + a1*rpm_desired + a0'
+    for esc_id in esc_ids:
+        c = fits[esc_id]['coeffs']
+        print '    ID %d: a0 = %.6g, a1 = %.6g, a2 = %.6g' % (esc_id, c[2], c[1], c[0])
+        print_residuals('           ', fits[esc_id])
+    spread = coefficient_spread(dict((esc_id, fits[esc_id]['coeffs']) for esc_id in esc_ids), (np.min(rpms), np.max(rpms)))
+    print 'Per-motor coefficient spread (min / max / std):'
+    for (name, i) in [('a0', 2), ('a1', 1), ('a2', 0)]:
+        print '    %s: %.6g / %.6g / %.6g' % (name, spread['min'][i], spread['max'][i], spread['std'][i])
+    print '    max difference between motor curves and mean curve: %.1f mV' % (spread['max_curve_diff'])
+    print 'Combined fit of all motors:'
 
 # print corresponding params
 print 'Quadratic fit: motor_voltage = a2*rpm_desired^2 + a1*rpm_desired + a0'
 print '    a0 = ' + str(ply[2])
 print '    a1 = ' + str(ply[1])
 print '    a2 = ' + str(ply[0])
+print_residuals('    ', fit)
 print 'ESC Params (after scaling):'
 print '    pwm_vs_rpm_curve_a0 = ' + str(ply[2])
 print '    pwm_vs_rpm_curve_a1 = ' + str(ply[1])
 print '    pwm_vs_rpm_curve_a2 = ' + str(ply[0])
 
+# write a params file that can be uploaded directly. the rpm range is limited to
+# what every motor reached at the lowest / highest tested power
+if base_xml is not None:
+    from escparams import update_params_xml
+    limits = [rpm_limits(measurements[esc_id], fits[esc_id]['mask']) for esc_id in esc_ids]
+    updates = [('pwm_vs_rpm_curve_a0', repr(float(ply[2]))),
+               ('pwm_vs_rpm_curve_a1', repr(float(ply[1]))),
+               ('pwm_vs_rpm_curve_a2', repr(float(ply[0]))),
+               ('min_rpm', max(l[0] for l in limits)),
+               ('max_rpm', min(l[1] for l in limits))]
+    try:
+        open(args.output_params, 'w').write(update_params_xml(base_xml, dict(updates)))
+    except (KeyError, IOError) as e:
+        print 'ERROR: Could not write params file: ' + str(e)
+        sys.exit(1)
+    print 'INFO: Wrote %s (min_rpm = %d, max_rpm = %d)' % (args.output_params, updates[3][1], updates[4][1])
+
 # plot results if possible
 try:
   import matplotlib.pyplot as plt
@@ -191,18 +342,26 @@ except:
   sys.exit(0)
 
 # plot the results
-plt.plot(rpms, motor_voltages, 'bo')
-plt.plot(rpms, motor_voltages_fit)
+legend = []
+for esc_id in esc_ids:
+    data = np.asarray(measurements[esc_id], dtype=float)
+    order = np.argsort(data[:, 1])
+    lines = plt.plot(data[:, 1], motor_voltages(data), 'o')
+    plt.plot(data[order, 1], np.polyval(fits[esc_id]['coeffs'], data[order, 1]), color=lines[0].get_color())
+    legend += ['Data ID %d' % esc_id, 'Fit ID %d' % esc_id]
 plt.xlabel('Measured RPM')
 plt.ylabel('Commanded Motor Voltage (mV)')
 plt.title('Motor Voltage vs. RPM Test')
-plt.legend(['Data', 'Fit'], loc=2)
-plt.ylim([0, np.max(motor_voltages)+1000])
+plt.legend(legend, loc=2)
+plt.ylim([0, np.max(motor_voltages(all_measurements))+1000])
 #plt.show()
 
 plt.figure()
-plt.plot(pwms, rpms, 'bo')
+for esc_id in esc_ids:
+    data = np.asarray(measurements[esc_id], dtype=float)
+    plt.plot(data[:, 0], data[:, 1], 'o')
 plt.xlabel('Commanded PWM (x/100)')
 plt.ylabel('Measured RPM')
 plt.title('RPM vs. PWM Test')
+plt.legend(['ID %d' % esc_id for esc_id in esc_ids], loc=2)
 plt.show()
@@ -0,0 +1,75 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+import sys
+sys.path.append('./voxl-esc-tools-bin')
+
+import signal
+import argparse
+from escconnect import add_connection_args, connect
+from escdaemon import EscDaemon, EscDaemonError, DEFAULT_SOCKET, daemon_running
+
+parser = argparse.ArgumentParser(description='ESC Session Daemon')
+add_connection_args(parser, daemon=False)
+parser.add_argument('--socket',      type=str,  required=False, default=DEFAULT_SOCKET)
+parser.add_argument('--verbose',                action='store_true')
+args = parser.parse_args()
+
+if daemon_running(args.socket):
+    print 'ERROR: An ESC daemon is already running on ' + args.socket
+    sys.exit(1)
+
+(esc_manager, escs) = connect(args)
+for e in escs:
+    versions = e.get_versions()
+    print 'INFO: ID: %d, SW: %d, HW: %d' % (e.get_id(), versions[0], versions[1])
+
+def log(msg):
+    if args.verbose:
+        print 'INFO: ' + msg
+
+daemon = EscDaemon(esc_manager, args.socket, log)
+signal.signal(signal.SIGTERM, lambda signum, frame: daemon.shutdown())
+
+print 'INFO: Serving ESCs on ' + args.socket
+try:
+    daemon.serve_forever()
+except KeyboardInterrupt:
+    print ''
+except EscDaemonError as e:
+    print 'ERROR: ' + str(e)
+    esc_manager.close()
+    sys.exit(1)
+daemon.shutdown()
+esc_manager.close()
+print 'INFO: ESC daemon stopped'
@@ -34,52 +34,16 @@
 import sys
 sys.path.append('./voxl-esc-tools-bin')
 
-from libesc import *
 import time
 import argparse
+from escconnect import add_connection_args, connect
 
 parser = argparse.ArgumentParser(description='ESC LED Test Script')
-parser.add_argument('--device',                 required=False, default=None)
-parser.add_argument('--baud-rate',              required=False, default=None)
+add_connection_args(parser)
 args = parser.parse_args()
 
-devpath  = args.device
-baudrate = args.baud_rate
-
-if devpath is not None and baudrate is None:
-    print 'ERROR: Please provide baud rate with --baud-rate option'
-    sys.exit(1)
-
-if devpath is None:
-    print 'INFO: Device and baud rate are not provided, attempting to autodetect..'
-    scanner = SerialScanner()
-    (devpath, baudrate) = scanner.scan()
-
-    if devpath is not None and baudrate is not None:
-        print ''
-        print 'INFO: ESC(s) detected on port: ' + devpath + ' using baudrate: ' + str(baudrate)
-        print 'INFO: Attempting to open...'
-    else:
-        print 'ERROR: No ESC(s) detected, exiting.'
-        sys.exit(1)
-
 # create ESC manager and search for ESCs
-try:
-    esc_manager = EscManager()
-    esc_manager.open(devpath, baudrate)
-except Exception as e:
-    print 'ERROR: Unable to connect to ESCs :'
-    print e
-    sys.exit(1)
-
-# wait a little to let manager find all ESCs
-time.sleep(0.25)
-num_escs = len(esc_manager.get_escs())
-if num_escs < 1:
-    print 'ERROR: No ESCs detected--exiting.'
-    sys.exit(0)
-
-escs = esc_manager.get_escs()
+(esc_manager, escs) = connect(args)
 
 print 'INFO: Running LED Test...'
 update_cntr = 0
@@ -0,0 +1,103 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Compile and validate a whole params tree in one pass. Every XML file is
+# checked against the documented param ranges, packed into the .eep format
+# through the compile cache (so later uploads of the file are faster) and
+# unpacked again to catch values that do not survive packing. Exits with an
+# error if any file is invalid.
+
+import os
+import sys
+sys.path.append('./voxl-esc-tools-bin')
+
+import json
+import argparse
+from multiprocessing import Pool, cpu_count
+
+from escparams import find_params_files, check_params_file
+
+parser = argparse.ArgumentParser(description='ESC Params Compile and Validate Script')
+parser.add_argument('--params-dir', type=str, required=False, default='../params')
+parser.add_argument('--jobs',       type=int, required=False, default=cpu_count())
+parser.add_argument('--export',     type=str, required=False, default=None)  # also write <name>.eep files of the valid params to this directory
+parser.add_argument('--json',       type=str, required=False, default=None)  # write all results to a json file
+args = parser.parse_args()
+
+files = find_params_files(args.params_dir)
+if len(files) == 0:
+    print('ERROR: No params files found in %s' % args.params_dir)
+    sys.exit(1)
+
+if args.jobs > 1 and len(files) > 1:
+    pool = Pool(min(args.jobs, len(files)))
+    results = pool.map(check_params_file, files)
+    pool.close()
+    pool.join()
+else:
+    results = [check_params_file(f) for f in files]
+
+num_invalid = 0
+num_cached  = 0
+for r in results:
+    name = os.path.relpath(r['path'], args.params_dir)
+    if r['errors']:
+        num_invalid += 1
+        print('INVALID %s' % name)
+        for error in r['errors']:
+            print('    ' + error)
+    else:
+        num_cached += r['cached']
+        print('OK      %s (%d bytes%s)' % (name, r['size'], ', cached' if r['cached'] else ''))
+
+if args.export is not None:
+    from escparams import load_compiled
+    for r in results:
+        if not r['errors']:
+            with open(r['path'], 'r') as f:
+                (param_bytes, _) = load_compiled(f.read())
+            # same layout as the params tree, file names repeat across vehicles
+            eep_file = os.path.join(args.export, os.path.splitext(os.path.relpath(r['path'], args.params_dir))[0] + '.eep')
+            if not os.path.isdir(os.path.dirname(eep_file)):
+                os.makedirs(os.path.dirname(eep_file))
+            with open(eep_file, 'wb') as f:
+                f.write(param_bytes)
+    print('INFO: Exported %d .eep files to %s' % (len(results) - num_invalid, args.export))
+
+if args.json is not None:
+    with open(args.json, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+print('INFO: %d files, %d valid (%d from cache), %d invalid' % (len(results), len(results) - num_invalid, num_cached, num_invalid))
+if num_invalid > 0:
+    sys.exit(1)
@@ -0,0 +1,178 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Play a command profile (per-ESC rpm or power and LED targets, see
+# escplayback.py for the file format) at a fixed command rate, e.g. motor
+# rpm traces from flight logs for thermal and endurance tests. Commands are
+# sent on absolute deadlines; with a t column the latest row whose time has
+# passed is held until the next one. Feedback can be recorded together with
+# the commanded values (--record, see escrecord.py).
+
+import sys
+sys.path.append('./voxl-esc-tools-bin')
+
+import argparse
+from escconnect import add_connection_args, connect
+from escloop import RateLoop
+from esctelemetry import TelemetryDisplay, read_sample
+from escrecord import TelemetryRecorder
+from escplayback import ProfileReader, ProfileError
+
+MAX_SAFE_RPM = 30000
+
+parser = argparse.ArgumentParser(description='ESC Command Profile Playback Script')
+add_connection_args(parser)
+parser.add_argument('--file',        type=str,   required=True,  default=None)  # .csv or .npy profile
+parser.add_argument('--rate-hz',     type=float, required=False, default=100.0)
+parser.add_argument('--display-rate',type=float, required=False, default=10.0)
+parser.add_argument('--quiet',       action='store_true')
+parser.add_argument('--record',      type=str,   required=False, default=None)
+parser.add_argument('--skip-prompt', type=str,   required=False, default='False')
+args = parser.parse_args()
+
+skip_prompt = 'True' in args.skip_prompt or 'true' in args.skip_prompt
+
+try:
+    profile = ProfileReader(args.file)
+except (IOError, OSError, ValueError, ProfileError) as e:
+    print('ERROR: Could not open profile: ' + str(e))
+    sys.exit(1)
+
+if args.rate_hz <= 0 or args.rate_hz > 1000:
+    print('ERROR: Command rate must be between 0 and 1000 Hz')
+    sys.exit(1)
+
+if args.display_rate <= 0:
+    print('ERROR: Display rate must be positive')
+    sys.exit(1)
+
+print('INFO: Profile: %s targets for ESC ID(s) %s%s%s' % (profile.mode, ', '.join(str(i) for i in profile.esc_ids),
+      ', with LEDs' if profile.led_columns else '',
+      ', %d rows' % profile.num_rows if profile.num_rows is not None else ''))
+
+(esc_manager, escs) = connect(args, profile.esc_ids)
+escs = dict((e.get_id(), e) for e in escs)
+missing = [i for i in profile.esc_ids if i not in escs]
+if len(missing) > 0:
+    print('ERROR: ESC ID(s) %s of the profile not found--exiting.' % ', '.join(str(i) for i in missing))
+    esc_manager.close()
+    sys.exit(1)
+
+if not skip_prompt:
+    print('WARNING: ')
+    print('This test requires motors to spin at high speeds with')
+    print('propellers attached. Please ensure that appropriate')
+    print('protective equipment is being worn at all times and')
+    print('that the motor and propeller are adequately isolated')
+    print('from all persons.')
+    print('')
+    response = raw_input('Type "Yes" to continue: ')
+    if response not in ['yes', 'Yes', 'YES']:
+        print('Test canceled by user')
+        sys.exit(1)
+
+if profile.mode == 'rpm':
+    (limit, send_targets) = (MAX_SAFE_RPM, esc_manager.send_rpm_targets)
+    set_target = lambda esc, value: esc.set_target_rpm(int(round(value)))
+else:
+    (limit, send_targets) = (100, esc_manager.send_pwm_targets)
+    set_target = lambda esc, value: esc.set_target_power(value)
+
+display  = TelemetryDisplay(args.display_rate, args.quiet).start()
+recorder = TelemetryRecorder(args.record) if args.record is not None else None
+commands = dict((i, 0.0) for i in profile.esc_ids)
+leds     = {}
+rows     = profile.rows()
+num_rows = 0
+row      = None
+loop     = RateLoop(args.rate_hz)
+error    = None
+try:
+    next_row = next(rows, None)
+    while True:
+        t_now = loop.wait()
+        if profile.has_time:
+            t_play = t_now - loop.t_start
+            while next_row is not None and next_row[0] <= t_play:
+                (row, next_row) = (next_row, next(rows, None))
+                num_rows += 1
+            if next_row is None and (row is None or t_play >= row[0] + loop.period):
+                break
+        else:
+            if next_row is None:
+                break
+            (row, next_row) = (next_row, next(rows, None))
+            num_rows += 1
+
+        if row is not None:
+            (t_row, targets, row_leds) = row
+            for (esc_id, value) in targets:
+                if abs(value) > limit:
+                    raise ProfileError('%s target %g of ESC ID %d in row %d is outside -%d..%d' % (
+                        profile.mode, value, esc_id, num_rows, limit, limit))
+                set_target(escs[esc_id], value)
+                commands[esc_id] = value
+            for (esc_id, bits) in row_leds:
+                if leds.get(esc_id) != bits and esc_id in escs:
+                    escs[esc_id].set_leds([bits & 1, (bits >> 1) & 1, (bits >> 2) & 1])
+                    leds[esc_id] = bits
+            display.set_header('Row %d, %.1f s' % (num_rows, t_now - loop.t_start))
+        send_targets()
+
+        for esc_id in profile.esc_ids:
+            sample = read_sample(escs[esc_id], t_now)
+            display.push(sample)
+            if recorder is not None:
+                recorder.append(sample, commands[esc_id])
+except ProfileError as e:
+    error = str(e)
+except KeyboardInterrupt:
+    print('')
+    print('INFO: Stopped by user')
+finally:
+    for esc in escs.values():
+        set_target(esc, 0)
+    send_targets()
+
+display.stop()
+if recorder is not None:
+    recorder.close()
+    print('INFO: Recorded %d samples to %s' % (recorder.num_records, args.record))
+print('INFO: Played %d rows in %.1f seconds' % (num_rows, loop.elapsed()))
+for line in loop.summary():
+    print('INFO: ' + line)
+esc_manager.close()
+
+if error is not None:
+    print('ERROR: ' + error)
+    sys.exit(1)
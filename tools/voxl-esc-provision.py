@@ -0,0 +1,146 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+import sys
+sys.path.append('./voxl-esc-tools-bin')
+
+import os
+import time
+import json
+import argparse
+import multiprocessing
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+from escscan import list_ports, BAUD_RATES
+from escparams import read_params_fields, load_compiled
+from escconfig import select_sections
+from escprovision import start_workers, STAGES
+
+parser = argparse.ArgumentParser(description='ESC Fleet Provisioning Script')
+parser.add_argument('--ports',               type=str, required=False, default=None)  # comma separated, default: all serial adapters
+parser.add_argument('--baud-rate',           type=int, required=False, default=None)  # default: scan all supported baud rates
+parser.add_argument('--params-file',         type=str, required=True,  default="")
+parser.add_argument('--params-filter',       type=str, required=False, default="all")
+parser.add_argument('--readback-timeout',    type=float, required=False, default=1.0)
+parser.add_argument('--expect-escs',         type=int, required=False, default=None)  # fail ports with fewer ESCs
+parser.add_argument('--report',              type=str, required=False, default=None)  # json report file
+args = parser.parse_args()
+
+ports = args.ports.split(',') if args.ports is not None else list_ports()
+if len(ports) == 0:
+    print 'ERROR: No serial ports found, exiting.'
+    sys.exit(1)
+
+# read, check and compile the params file once, workers share the packed params
+filename, file_extension = os.path.splitext(args.params_file)
+if os.path.isfile(args.params_file) and file_extension == '.xml':
+    params_type = 'eep'
+    xml_string = open(args.params_file, 'r').read()
+    try:
+        read_params_fields(xml_string)
+        (params_data, cached) = load_compiled(xml_string)
+    except Exception as e:
+        print 'ERROR: Invalid params file: ' + str(e)
+        sys.exit(1)
+elif os.path.isfile(args.params_file) and file_extension == '.eep':
+    params_type = 'eep'
+    params_data = open(args.params_file, 'rb').read()
+else:
+    print 'ERROR: Unsupported file type, exiting.'
+    sys.exit(1)
+
+print 'INFO: Provisioning %d port(s) with %s' % (len(ports), args.params_file)
+
+baud_rates = [args.baud_rate] if args.baud_rate is not None else BAUD_RATES
+queue = multiprocessing.Queue()
+t_start = time.time()
+workers = start_workers(ports, queue, params_data, params_type, select_sections(args.params_filter),
+                        baud_rates=baud_rates, readback_timeout=args.readback_timeout,
+                        expect_escs=args.expect_escs)
+
+# live status, one line per port. redrawn in place on a terminal
+in_place = sys.stdout.isatty()
+status  = dict((p, 'starting') for p in ports)
+reports = {}
+
+def draw(redraw):
+    if in_place and redraw:
+        sys.stdout.write('\033[%dF' % len(ports))
+    for p in ports:
+        line = '%-28s %s' % (p, status[p])
+        sys.stdout.write(line + ('\033[K\n' if in_place else '\n'))
+    sys.stdout.flush()
+
+if in_place:
+    draw(False)
+while len(reports) < len(ports):
+    try:
+        (kind, devpath, value) = queue.get(timeout=0.5)
+    except Empty:
+        if not any(w.is_alive() for w in workers) and queue.empty():
+            break
+        continue
+    if kind == 'status':
+        status[devpath] = value + '...'
+    else:
+        reports[devpath] = value
+        status[devpath] = value['result'].upper() + ('' if value['error'] is None else ': ' + value['error'])
+    if in_place:
+        draw(True)
+    else:
+        print '%-28s %s' % (devpath, status[devpath])
+
+for w in workers:
+    w.join()
+
+# workers that died without a report
+for p in ports:
+    if p not in reports:
+        reports[p] = {'devpath': p, 'result': 'fail', 'error': 'worker exited unexpectedly'}
+
+num_pass = len([r for r in reports.values() if r['result'] == 'pass'])
+print 'INFO: %d of %d port(s) passed in %.2f seconds' % (num_pass, len(ports), time.time() - t_start)
+for p in ports:
+    r = reports[p]
+    stages = ', '.join('%s %.2fs' % (s, r['stages'][s]) for s in STAGES if s in r.get('stages', {}))
+    print '    %-28s %-4s IDs: %-12s %s' % (p, r['result'].upper(), ','.join(str(i) for i in r.get('esc_ids', [])), stages)
+
+if args.report is not None:
+    with open(args.report, 'w') as f:
+        json.dump([reports[p] for p in ports], f, indent=2, sort_keys=True)
+    print 'INFO: Report written to ' + args.report
+
+sys.exit(0 if num_pass == len(ports) else 1)
@@ -0,0 +1,61 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+import sys
+import argparse
+
+from escrecord import RECORD_FIELDS, iter_records
+
+parser = argparse.ArgumentParser(description='ESC Telemetry Record Export Script')
+parser.add_argument('--record-file', type=str, required=True,  default=None)
+parser.add_argument('--csv',         type=str, required=False, default=None)
+parser.add_argument('--id',          type=int, required=False, default=255)
+args = parser.parse_args()
+
+out = sys.stdout if args.csv is None else open(args.csv, 'w')
+out.write(','.join(RECORD_FIELDS) + '\n')
+
+num_rows = 0
+try:
+    for r in iter_records(args.record_file):
+        if args.id != 255 and r[1] != args.id:
+            continue
+        out.write('%.6f,%d,%g,%.1f,%.1f,%.3f,%.3f,%.2f\n' % r)
+        num_rows += 1
+except (IOError, ValueError) as e:
+    print('ERROR: Unable to read record file %s : %s' % (args.record_file, e))
+    sys.exit(1)
+
+if args.csv is not None:
+    out.close()
+    print('INFO: Exported %d samples to %s' % (num_rows, args.csv))
@@ -0,0 +1,100 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Fit saved calibration sweeps (voxl-esc-calibrate.py --save-sweep) again
+# without spinning any motors, e.g. after changing the fit or the power range.
+# A directory is searched for sweep files recursively and the files are fit in
+# parallel; results are summarized per motor / prop label.
+
+import sys
+import json
+import argparse
+from multiprocessing import Pool, cpu_count
+
+from esccalib import find_sweep_files, refit_sweep, summarize_fits
+
+parser = argparse.ArgumentParser(description='ESC Calibration Re-Fit Script')
+parser.add_argument('--sweep',   type=str, required=True,  default=None)  # sweep file or directory
+parser.add_argument('--pwm-min', type=int, required=False, default=None)
+parser.add_argument('--pwm-max', type=int, required=False, default=None)
+parser.add_argument('--jobs',    type=int, required=False, default=cpu_count())
+parser.add_argument('--json',    type=str, required=False, default=None)  # write all results to a json file
+parser.add_argument('--verbose', action='store_true')                     # print the fit of every motor
+args = parser.parse_args()
+
+files = find_sweep_files(args.sweep)
+if len(files) == 0:
+    print('ERROR: No sweep files found in %s' % args.sweep)
+    sys.exit(1)
+
+pwm_window = None
+if args.pwm_min is not None or args.pwm_max is not None:
+    pwm_window = (args.pwm_min if args.pwm_min is not None else 0,
+                  args.pwm_max if args.pwm_max is not None else 100)
+
+jobs = [(path, pwm_window) for path in files]
+if args.jobs > 1 and len(files) > 1:
+    pool = Pool(min(args.jobs, len(files)))
+    try:
+        results = pool.map(refit_sweep, jobs, chunksize=max(1, len(jobs) // (4 * args.jobs)))
+    finally:
+        pool.close()
+        pool.join()
+else:
+    results = [refit_sweep(job) for job in jobs]
+
+num_errors = 0
+for result in results:
+    if 'error' in result:
+        print('WARNING: %s : %s' % (result['path'], result['error']))
+        num_errors += 1
+        continue
+    for (esc_id, fit) in sorted(result['fits'].items()):
+        if 'error' in fit:
+            print('WARNING: %s ID %d : %s' % (result['path'], esc_id, fit['error']))
+            num_errors += 1
+        elif args.verbose:
+            c = fit['coeffs']
+            print('%s ID %d: a0 = %.6g, a1 = %.6g, a2 = %.6g, rms %.1f mV, %d rejected' % (
+                result['path'], esc_id, c[2], c[1], c[0], fit['rms'], fit['rejected']))
+
+summary = summarize_fits(results)
+print('Fit %d sweep files, %d errors' % (len(files), num_errors))
+print('%-40s %6s %12s %12s %12s %10s %8s %8s' % ('label', 'motors', 'a0', 'a1', 'a2', 'rms (mV)', 'min_rpm', 'max_rpm'))
+for (label, s) in summary:
+    print('%-40s %6d %12.6g %12.6g %12.6g %10.1f %8d %8d' % (label, s['motors'],
+        s['mean'][2], s['mean'][1], s['mean'][0], s['max_rms'], s['min_rpm'], s['max_rpm']))
+
+if args.json is not None:
+    with open(args.json, 'w') as f:
+        json.dump({'results': results, 'summary': summary}, f, indent=2, sort_keys=True)
@@ -34,56 +34,48 @@
 import sys
 sys.path.append('./voxl-esc-tools-bin')
 
-from libesc import *
+import time
 import argparse
+from escscan import scan_ports
+from escconnect import add_connection_args, connect
 
 parser = argparse.ArgumentParser(description='ESC Scan Script')
-parser.add_argument('--device',                 required=False, default=None)
-parser.add_argument('--baud-rate',              required=False, default=None)
+add_connection_args(parser)
 args = parser.parse_args()
 
-devpath  = args.device
-baudrate = args.baud_rate
+def get_hardware_name(hw_version):
+    if hw_version == 30:
+        return 'ModalAi 4-in-1 ESC V2 RevA'
+    elif hw_version == 31:
+        return 'ModalAi 4-in-1 ESC V2 RevB'
+    return 'Unknown Board'
 
-if devpath is not None and baudrate is None:
-    print 'ERROR: Please provide baud rate with --baud-rate option'
-    sys.exit(1)
-
-if devpath is None:
-    print 'INFO: Device and baud rate are not provided, attempting to autodetect..'
-    scanner = SerialScanner()
-    (devpath, baudrate) = scanner.scan()
-
-    if devpath is not None and baudrate is not None:
-        print ''
-        print 'INFO: ESC(s) detected on port: ' + devpath + ' using baudrate: ' + str(baudrate)
-        print 'INFO: Attempting to open...'
-    else:
+# probe all ports at once and list ESCs on every port
+if args.device is None and args.scan_parallel and args.daemon is None:
+    print 'INFO: Device and baud rate are not provided, scanning all ports..'
+    t_start = time.time()
+    results = scan_ports()
+    if len(results) == 0:
         print 'ERROR: No ESC(s) detected, exiting.'
         sys.exit(1)
+    for r in results:
+        print ''
+        print 'INFO: ESC(s) detected on port: ' + r.devpath + ' using baudrate: ' + str(r.baudrate)
+        print 'INFO: Detected ESCs With Firmware:'
+        print 'INFO: ---------------------'
+        for (esc_id, versions) in zip(r.esc_ids, r.versions):
+            print 'INFO: ID: %d, SW: %d, HW: %d (%s)' % (esc_id, versions[0], versions[1], get_hardware_name(versions[1]))
+        print '---------------------'
+    print 'INFO: Scan took %.2f seconds' % (time.time() - t_start)
+    sys.exit(0)
 
-try:
-    esc_manager = EscManager()
-    esc_manager.open(devpath, baudrate)
-except Exception as e:
-    print 'ERROR: Unable to connect to ESCs :'
-    print e
-    sys.exit(1)
-
-# wait a little to let manager find all ESCs
-time.sleep(0.25)
+(esc_manager, escs) = connect(args)
 
 print 'INFO: Detected ESCs With Firmware:'
 print 'INFO: ---------------------'
-time.sleep(0.2)
-for e in esc_manager.get_escs():
+for e in escs:
     versions = e.get_versions()
-    hardware_name = 'Unknown Board'
-    if versions[1] == 30:
-        hardware_name = 'ModalAi 4-in-1 ESC V2 RevA'
-    elif versions[1] == 31:
-        hardware_name = 'ModalAi 4-in-1 ESC V2 RevB'
-    print 'INFO: ID: %d, SW: %d, HW: %d (%s)' % (e.get_id(), versions[0], versions[1],hardware_name)
+    print 'INFO: ID: %d, SW: %d, HW: %d (%s)' % (e.get_id(), versions[0], versions[1], get_hardware_name(versions[1]))
 print '---------------------'
 
 esc_manager.close()
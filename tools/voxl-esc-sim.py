@@ -0,0 +1,82 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+import sys
+import json
+import argparse
+
+from escsim import EscSimulator
+
+parser = argparse.ArgumentParser(description='ESC Simulator Script')
+parser.add_argument('--params-file', type=str,   required=False, default=None)
+parser.add_argument('--num-escs',    type=int,   required=False, default=4)
+parser.add_argument('--tau',         type=float, required=False, default=0.05)
+parser.add_argument('--sw-version',  type=int,   required=False, default=39)
+parser.add_argument('--hw-version',  type=int,   required=False, default=31)
+parser.add_argument('--link',        type=str,   required=False, default=None)
+parser.add_argument('--duration',    type=float, required=False, default=None)
+args = parser.parse_args()
+
+if args.num_escs < 1 or args.num_escs > 8:
+    print('ERROR: Number of simulated ESCs must be between 1 and 8')
+    sys.exit(1)
+
+if args.tau <= 0:
+    print('ERROR: Motor time constant must be positive')
+    sys.exit(1)
+
+sim = EscSimulator(params_file = args.params_file,
+                   num_escs    = args.num_escs,
+                   tau         = args.tau,
+                   sw_version  = args.sw_version,
+                   hw_version  = args.hw_version,
+                   link        = args.link)
+device = sim.open()
+
+print('INFO: Simulating %d ESCs on %s' % (args.num_escs, device))
+if args.link is not None:
+    print('INFO: Linked to %s' % (args.link))
+print('INFO: Use --device %s --baud-rate %d with the ESC tools' % (device, sim.baud_rate))
+print('INFO: Press Ctrl-C to stop')
+sys.stdout.flush()
+
+try:
+    sim.run(args.duration)
+except KeyboardInterrupt:
+    pass
+finally:
+    sim.close()
+
+print('')
+print('INFO: Simulator traffic:')
+print(json.dumps(sim.get_stats(), indent=2, sort_keys=True))
@@ -34,31 +34,38 @@
 import sys
 sys.path.append('./voxl-esc-tools-bin')
 
-from libesc import *
-import time
-import numpy as np
 import argparse
+from escconnect import add_connection_args, connect
+from escloop import RateLoop
+from esctelemetry import TelemetryDisplay, read_sample
+from escrecord import TelemetryRecorder
+from escexport import add_export_args, open_exporter
+from escmonitor import LinkMonitor
 
 
 parser = argparse.ArgumentParser(description='ESC Test Spin Script')
-parser.add_argument('--device',                 required=False, default=None)
-parser.add_argument('--baud-rate',              required=False, default=None)
+add_connection_args(parser)
 parser.add_argument('--id',          type=int,  required=True,  default=0)
 parser.add_argument('--power',       type=int,  required=False, default=10)
 parser.add_argument('--rpm',         type=int,  required=False, default=None)
 parser.add_argument('--timeout',     type=int,  required=False, default=10000)
+parser.add_argument('--rate-hz',     type=float,required=False, default=100.0)
+parser.add_argument('--display-rate',type=float,required=False, default=10.0)
+parser.add_argument('--quiet',       action='store_true')
+parser.add_argument('--record',      type=str,  required=False, default=None)
+parser.add_argument('--stats',       action='store_true')  # link health summary at exit
 parser.add_argument('--skip-prompt', type=str,  required=False, default='False')
 parser.add_argument('--led-red',     type=int,  required=False, default=0)
 parser.add_argument('--led-green',   type=int,  required=False, default=0)
 parser.add_argument('--led-blue',    type=int,  required=False, default=0)
+add_export_args(parser)
 args = parser.parse_args()
 
-devpath  = args.device
-baudrate = args.baud_rate
 esc_id   = args.id
 spin_pwr = args.power #0-100
 spin_rpm = args.rpm #0-30000 .. limited to 30K for safety
 timeout  = args.timeout
+rate_hz  = args.rate_hz
 led_red  = int(args.led_red > 0)
 led_green= int(args.led_green > 0)
 led_blue = int(args.led_blue > 0)
@@ -68,10 +75,6 @@ MAX_SAFE_RPM = 30000
 #optionally skip the safety prompt that asks to enter "yes" before spinning
 skip_prompt = 'True' in args.skip_prompt or 'true' in args.skip_prompt
 
-if devpath is not None and baudrate is None:
-    print('ERROR: Please provide baud rate with --baud-rate option')
-    sys.exit(1)
-
 if spin_pwr < -100 or spin_pwr > 100:
     print('ERROR: Spin power must be between -100 and 100')
     sys.exit(1)
@@ -84,44 +87,26 @@ if timeout < 0:
     print('ERROR: Timeout should be non-negative value of seconds')
     sys.exit(1)
 
-if devpath is None:
-    print('INFO: Device and baud rate are not provided, attempting to autodetect..')
-    scanner = SerialScanner()
-    (devpath, baudrate) = scanner.scan()
-
-    if devpath is not None and baudrate is not None:
-        print('')
-        print('INFO: ESC(s) detected on port: ' + devpath + ' using baudrate: ' + str(baudrate))
-        print('INFO: Attempting to open...')
-    else:
-        print('ERROR: No ESC(s) detected, exiting.')
-        sys.exit(1)
+if rate_hz <= 0 or rate_hz > 1000:
+    print('ERROR: Command rate must be between 0 and 1000 Hz')
+    sys.exit(1)
 
-# create ESC manager and search for ESCs
-try:
-    esc_manager = EscManager()
-    esc_manager.open(devpath, baudrate)
-except Exception as e:
-    print('ERROR: Unable to connect to ESCs :')
-    print e
+if args.display_rate <= 0:
+    print('ERROR: Display rate must be positive')
     sys.exit(1)
 
-# wait a little to let manager find all ESCs
-time.sleep(0.25)
-num_escs = len(esc_manager.get_escs())
-if num_escs < 1:
-    print('ERROR: No ESCs detected--exiting.')
+if args.stats and args.daemon is not None:
+    print('ERROR: --stats needs direct access to the serial port and cannot be used with --daemon')
     sys.exit(1)
 
-escs = []
+# create ESC manager and search for ESCs
+(esc_manager, escs) = connect(args, [esc_id] if esc_id != 255 else None)
+
 if esc_id != 255:
-    esc = esc_manager.get_esc_by_id(esc_id)
-    if esc is None:
+    escs = [e for e in escs if e.get_id() == esc_id]
+    if len(escs) == 0:
         print('ERROR: Specified ESC ID not found--exiting.')
         sys.exit(1)
-    escs.append(esc)
-else:
-    escs = esc_manager.get_escs()
 
 # warn user
 if not skip_prompt:
@@ -147,20 +132,55 @@ if esc_id != 255:
 for esc in escs:
     esc.set_leds([led_red, led_green, led_blue])  #0 or 1 for R G and B values.. binary for now
 
-t_start = time.time()
 update_cntr = 0
-while time.time() - t_start < timeout:
-    update_cntr += 1
-    time.sleep(0.01)
+display = TelemetryDisplay(args.display_rate, args.quiet).start()
+recorder = TelemetryRecorder(args.record) if args.record is not None else None
+exporter = open_exporter(args)
+monitor = LinkMonitor() if args.stats else None
+if monitor is not None and not monitor.install():
+    print('ERROR: --stats requires pyserial')
+    sys.exit(1)
+spin_cmd = spin_rpm if spin_rpm is not None else spin_pwr
+loop = RateLoop(rate_hz)
+try:
+    while loop.elapsed() < timeout:
+        t_now = loop.wait()
+        update_cntr += 1
+
+        if spin_rpm is not None:
+            for esc in escs:
+                esc.set_target_rpm(spin_rpm)
+            esc_manager.send_rpm_targets()
+        else:
+            for esc in escs:
+                esc.set_target_power(spin_pwr)
+            esc_manager.send_pwm_targets()
 
-    if spin_rpm is not None:
         for esc in escs:
-            esc.set_target_rpm(spin_rpm)
-        esc_manager.send_rpm_targets()
-    else:
-        for esc in escs:
-            esc.set_target_power(spin_pwr)
-        esc_manager.send_pwm_targets()
-
-    for esc in escs:
-        print('[%d] RPM: %.0f, PWR: %.0f, VBAT: %.2fV, TEMPERATURE: %.2fC, CURRENT: %.2fA' % (esc.get_id(), esc.get_rpm(), esc.get_power(), esc.get_voltage(), esc.get_temperature(), esc.get_current()))
+            sample = read_sample(esc, t_now)
+            if monitor is not None:
+                monitor.feedback_read(sample.esc_id, t_now)
+            display.push(sample)
+            if recorder is not None:
+                recorder.append(sample, spin_cmd)
+            if exporter is not None:
+                exporter.push(sample, spin_cmd)
+except KeyboardInterrupt:
+    print('')
+    print('INFO: Stopped by user')
+
+display.stop()
+if monitor is not None:
+    monitor.uninstall()
+if exporter is not None:
+    exporter.stop()
+if recorder is not None:
+    recorder.close()
+    print('INFO: Recorded %d samples to %s' % (recorder.num_records, args.record))
+
+for line in loop.summary():
+    print('INFO: ' + line)
+if monitor is not None:
+    for line in monitor.summary():
+        print('INFO: ' + line)
+esc_manager.close()
@@ -0,0 +1,92 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Startup time of every voxl-esc.py subcommand: the wall time of running
+# "voxl-esc.py <subcommand> --help", which loads all modules a subcommand
+# imports at startup and then exits after parsing the arguments. The time of
+# starting a bare interpreter is measured as well and reported separately.
+
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import subprocess
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIR)
+from escloop import percentile
+
+# the list of subcommands lives in voxl-esc.py, which is not importable by name
+ENTRY = os.path.join(TOOLS_DIR, 'voxl-esc.py')
+SUBCOMMANDS = [name for (name, script, description) in runpy.run_path(ENTRY, run_name='voxl_esc')['SUBCOMMANDS']
+               if name != 'startup-bench']
+
+parser = argparse.ArgumentParser(description='ESC Tools Startup Benchmark')
+parser.add_argument('--subcommands', type=str, required=False, default=None)  # comma separated, default: all
+parser.add_argument('--runs',        type=int, required=False, default=10)
+parser.add_argument('--json',        type=str, required=False, default=None)
+args = parser.parse_args()
+
+subcommands = args.subcommands.split(',') if args.subcommands is not None else SUBCOMMANDS
+if args.runs < 1:
+    print('ERROR: Number of runs must be at least 1')
+    sys.exit(1)
+
+devnull = open(os.devnull, 'w')
+
+def measure(cmd):
+    times = []
+    for _ in range(args.runs):
+        t_start = time.time()
+        rc = subprocess.call(cmd, cwd=TOOLS_DIR, stdout=devnull, stderr=devnull)
+        times.append((time.time() - t_start) * 1000.0)
+    times.sort()
+    return {'returncode': rc, 'min_ms': times[0], 'median_ms': percentile(times, 50), 'max_ms': times[-1]}
+
+baseline = measure([sys.executable, '-c', 'pass'])
+results = {}
+print('%-16s %10s %10s %10s %12s' % ('subcommand', 'min (ms)', 'p50 (ms)', 'max (ms)', 'p50 - python'))
+print('%-16s %10.1f %10.1f %10.1f %12s' % ('(python)', baseline['min_ms'], baseline['median_ms'], baseline['max_ms'], '-'))
+for name in subcommands:
+    r = measure([sys.executable, ENTRY, name, '--help'])
+    results[name] = r
+    note = '' if r['returncode'] == 0 else '  (exit code %d)' % r['returncode']
+    print('%-16s %10.1f %10.1f %10.1f %12.1f%s' % (name, r['min_ms'], r['median_ms'], r['max_ms'],
+                                                  r['median_ms'] - baseline['median_ms'], note))
+
+if args.json is not None:
+    with open(args.json, 'w') as f:
+        json.dump({'python': sys.executable, 'runs': args.runs, 'baseline': baseline, 'subcommands': results},
+                  f, indent=2, sort_keys=True)
@@ -0,0 +1,155 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# RPM step response benchmark: drive the ESCs through a scripted sequence of
+# RPM steps and ramps (see escresponse.py for the profile format), record the
+# feedback and report rise time, overshoot, settling time and tracking errors
+# per ESC and per step. Run it with different params files or firmware
+# versions and compare the JSON reports.
+
+import sys
+sys.path.append('./voxl-esc-tools-bin')
+
+import json
+import argparse
+from escconnect import add_connection_args, connect
+from esctelemetry import TelemetryDisplay
+from escrecord import TelemetryRecorder
+from escresponse import DEFAULT_PROFILE, SETTLE_BAND, parse_profile, Profile, run_profile, analyze, summarize, format_table, json_safe
+
+MAX_SAFE_RPM = 30000
+
+parser = argparse.ArgumentParser(description='ESC RPM Step Response Benchmark')
+add_connection_args(parser)
+parser.add_argument('--id',          type=int,   required=True,  default=0)  # 255 = all detected ESCs
+parser.add_argument('--profile',     type=str,   required=False, default=DEFAULT_PROFILE)
+parser.add_argument('--rate-hz',     type=float, required=False, default=100.0)
+parser.add_argument('--settle-band', type=float, required=False, default=SETTLE_BAND)  # rpm
+parser.add_argument('--display-rate',type=float, required=False, default=10.0)
+parser.add_argument('--quiet',       action='store_true')
+parser.add_argument('--record',      type=str,   required=False, default=None)
+parser.add_argument('--json',        type=str,   required=False, default=None)  # write the report to a json file
+parser.add_argument('--label',       type=str,   required=False, default=None)  # e.g. params file or firmware under test
+parser.add_argument('--skip-prompt', type=str,   required=False, default='False')
+args = parser.parse_args()
+
+esc_id = args.id
+skip_prompt = 'True' in args.skip_prompt or 'true' in args.skip_prompt
+
+try:
+    profile = Profile(parse_profile(args.profile))
+except ValueError as e:
+    print('ERROR: Invalid profile: ' + str(e))
+    sys.exit(1)
+
+if any(abs(rpm) > MAX_SAFE_RPM for (_, rpm, _) in profile.segments):
+    print('ERROR: Profile rpm must be between %d and %d' % (-MAX_SAFE_RPM, MAX_SAFE_RPM))
+    sys.exit(1)
+
+if args.rate_hz <= 0 or args.rate_hz > 1000:
+    print('ERROR: Command rate must be between 0 and 1000 Hz')
+    sys.exit(1)
+
+if args.display_rate <= 0:
+    print('ERROR: Display rate must be positive')
+    sys.exit(1)
+
+(esc_manager, escs) = connect(args, [esc_id] if esc_id != 255 else None)
+
+if esc_id != 255:
+    escs = [e for e in escs if e.get_id() == esc_id]
+    if len(escs) == 0:
+        print('ERROR: Specified ESC ID not found--exiting.')
+        sys.exit(1)
+
+if not skip_prompt:
+    print('WARNING: ')
+    print('This test requires motors to spin at high speeds with')
+    print('propellers attached. Please ensure that appropriate')
+    print('protective equipment is being worn at all times and')
+    print('that the motor and propeller are adequately isolated')
+    print('from all persons.')
+    print('')
+    response = raw_input('Type "Yes" to continue: ')
+    if response not in ['yes', 'Yes', 'YES']:
+        print('Test canceled by user')
+        sys.exit(1)
+
+if esc_id != 255:
+    esc_manager.set_highspeed_fb(esc_id)  # feedback from the tested ESC only, 4x more often
+
+display  = TelemetryDisplay(args.display_rate, args.quiet).start()
+recorder = TelemetryRecorder(args.record) if args.record is not None else None
+
+def on_segment(i):
+    (kind, rpm, duration) = profile.segments[i]
+    display.set_header('Segment %d/%d: %s to %d RPM in %.1fs' % (i + 1, len(profile.segments), kind, rpm, duration))
+
+def on_sample(sample, target):
+    display.push(sample)
+    if recorder is not None:
+        recorder.append(sample, target)
+
+(data, loop, reason) = run_profile(esc_manager, escs, profile, args.rate_hz, on_segment, on_sample)
+if reason is not None:
+    print('')
+    print('INFO: %s, analyzing the completed segments' % reason.capitalize())
+
+display.stop()
+if recorder is not None:
+    recorder.close()
+    print('INFO: Recorded %d samples to %s' % (recorder.num_records, args.record))
+for line in loop.summary():
+    print('INFO: ' + line)
+
+report = {'label': args.label, 'profile': args.profile, 'settle_band': args.settle_band,
+          'rate_hz': args.rate_hz, 'escs': {}}
+for e in escs:
+    results = analyze(profile, *data[e.get_id()], settle_band=args.settle_band)
+    summary = summarize(results)
+    (sw_version, hw_version) = e.get_versions()[:2]
+    report['escs'][str(e.get_id())] = {'sw_version': sw_version, 'hw_version': hw_version,
+                                       'segments': results, 'summary': summary}
+    print('')
+    for line in format_table(e.get_id(), results):
+        print(line)
+    print('[%d] mean rise %.0f ms, max overshoot %.1f%%, mean settling %.0f ms (%d not settled), max steady state error %.1f RPM, rms error %.1f RPM' % (
+        e.get_id(), summary['mean_rise_time'] * 1000.0, summary['max_overshoot'], summary['mean_settling_time'] * 1000.0,
+        summary['unsettled_steps'], summary['max_steady_state_error'], summary['rms_error']))
+
+esc_manager.close()
+
+if args.json is not None:
+    with open(args.json, 'w') as f:
+        json.dump(json_safe(report), f, indent=2, sort_keys=True)
+    print('INFO: Wrote report to %s' % args.json)
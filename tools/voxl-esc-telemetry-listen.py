@@ -0,0 +1,102 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Receive the telemetry stream of voxl-esc-spin.py / voxl-esc-calibrate.py
+# --udp and print the latest sample and the sample rate of every ESC. Both
+# stream formats are detected automatically.
+
+import sys
+import time
+import socket
+import argparse
+
+from escexport import parse_address, decode_datagram
+
+parser = argparse.ArgumentParser(description='ESC Telemetry Listener')
+parser.add_argument('--listen',  type=str,   required=False, default='127.0.0.1:9870')  # [host:]port to receive on
+parser.add_argument('--period',  type=float, required=False, default=1.0)               # seconds between summaries
+parser.add_argument('--timeout', type=float, required=False, default=None)              # stop after this many seconds
+args = parser.parse_args()
+
+try:
+    address = parse_address(args.listen)
+except ValueError:
+    print('ERROR: Listen address must be given as [host:]port')
+    sys.exit(1)
+
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+try:
+    sock.bind(address)
+except socket.error as e:
+    print('ERROR: Could not bind %s:%d: %s' % (address[0], address[1], str(e)))
+    sys.exit(1)
+sock.settimeout(0.1)
+print('INFO: Listening on %s:%d' % address)
+
+latest      = {}
+counts      = {}
+num_samples = 0
+num_datagrams = 0
+num_errors  = 0
+t_start     = time.time()
+t_summary   = t_start
+try:
+    while args.timeout is None or time.time() - t_start < args.timeout:
+        try:
+            data = sock.recv(65536)
+            samples = decode_datagram(data)
+            num_datagrams += 1
+        except socket.timeout:
+            samples = []
+        except ValueError:
+            num_errors += 1
+            samples = []
+        for s in samples:
+            latest[s['esc_id']] = s
+            counts[s['esc_id']] = counts.get(s['esc_id'], 0) + 1
+            num_samples += 1
+
+        t_now = time.time()
+        if t_now - t_summary >= args.period:
+            for esc_id in sorted(latest):
+                s = latest[esc_id]
+                print('[%d] RPM: %.0f, PWR: %.0f, VBAT: %.2fV, CURRENT: %.2fA, TEMP: %.1fC, RATE: %.1f Hz' %
+                      (esc_id, s['rpm'], s['power'], s['voltage'], s['current'], s['temperature'],
+                       counts.get(esc_id, 0) / (t_now - t_summary)))
+            counts    = {}
+            t_summary = t_now
+except KeyboardInterrupt:
+    print('')
+
+sock.close()
+print('INFO: Received %d samples in %d datagrams, %d bad datagrams' % (num_samples, num_datagrams, num_errors))
@@ -34,33 +34,41 @@
 import sys
 sys.path.append('./voxl-esc-tools-bin')
 
-#from libesc.escmanager import EscManager
-from libesc import *
+from libesc.escmanager import EscManager
 import time
-import numpy as np
-from libesc.esctypes import EscTypes as types
 
 import argparse
+from escscan import autodetect, wait_for_escs
+from escfirmware import flash_escs
 
 parser = argparse.ArgumentParser(description='ESC Upload Firmware Script')
 parser.add_argument('--device',               required=False, default=None)
 parser.add_argument('--firmware-baud-rate',   required=False, default=None)
 parser.add_argument('--bootloader-baud-rate', type=int, required=False, default=230400)
+parser.add_argument('--scan-parallel',        action='store_true')
+parser.add_argument('--expect-escs',          type=int, required=False, default=None)  # wait until this many ESCs are detected
 parser.add_argument('--firmware-file',        type=str, required=True,  default="")
-parser.add_argument('--id',                   type=int, required=True,  default=0)
+parser.add_argument('--id',                   type=str, required=True,  default='0')  # ID, comma separated list of IDs or 'all'
+parser.add_argument('--trust-cache',          action='store_true')  # skip ESCs the firmware cache says run this image
 args = parser.parse_args()
 
 devpath              = args.device
 firmware_baud_rate   = args.firmware_baud_rate
 bootloader_baud_rate = args.bootloader_baud_rate
 firmware_file        = args.firmware_file
-esc_id               = args.id
+
+flash_all = args.id.strip().lower() in ['all', '255']
+if not flash_all:
+    try:
+        flash_ids = [int(i) for i in args.id.split(',')]
+    except ValueError:
+        print 'ERROR: ESC ID must be a number, a comma separated list of numbers or "all"'
+        sys.exit(1)
 
 # if the device path is not provided, attempt to find a device with ESCs
 if devpath is None:
     print 'INFO: Device and baud rate are not provided, attempting to autodetect..'
-    scanner = SerialScanner()
-    (devpath, firmware_baud_rate) = scanner.scan()
+    (devpath, firmware_baud_rate) = autodetect(args.scan_parallel)
 
     if devpath is not None and firmware_baud_rate is not None:
         print ''
@@ -70,19 +78,13 @@ if devpath is None:
         print 'ERROR: No ESC(s) detected, exiting.'
         sys.exit(1)
 
-# load file
-f = open(firmware_file, "rb")
-firmware_binary = []
+# load file once for all ESCs; indexing a bytearray yields ints, like the old list of bytes
 try:
-    byte = f.read(1)
-    while byte != "":
-        firmware_binary.append(ord(byte))
-        byte = f.read(1)
-except:
+    with open(firmware_file, 'rb') as f:
+        firmware_binary = bytearray(f.read())
+except IOError:
     print 'ERROR: Unable to open firmware file %s' % (firmware_file)
     sys.exit(1)
-finally:
-    f.close()
 
 # reset the required ESC so that it can enter bootloader
 esc_manager = EscManager()
@@ -100,29 +102,90 @@ if firmware_baud_rate is not None:
 else:
     esc_manager.open(devpath, bootloader_baud_rate)
 
-time.sleep(0.25)
-escs = esc_manager.get_escs()
+# wait until the ESCs to flash (or --expect-escs ESCs) have been detected
+escs = wait_for_escs(esc_manager, args.expect_escs, None if flash_all else flash_ids)
 esc_ids = [e.get_id() for e in escs]
-if not esc_id in esc_ids:
-    print 'WARNING: Specified ESC ID not detected; perform manual power cycle now'
-else:
-    esc_manager.reset_id(esc_id)
-    time.sleep(0.25)
+if flash_all:
+    flash_ids = sorted(esc_ids)
+    if len(flash_ids) == 0:
+        print 'ERROR: No ESCs detected, please specify ESC IDs explicitly to flash after a manual power cycle'
+        esc_manager.close()
+        sys.exit(1)
 
-# switch to bootloader protocol
-esc_manager.set_protocol(types.ESC_PROTOCOL_BOOTLOADER)
-esc_manager.set_baudrate(bootloader_baud_rate)
+# optionally skip ESCs that, according to the firmware cache, were last flashed with this
+# image and still report the same versions. Nothing on the ESC confirms this, see escfirmware
+if args.trust_cache:
+    from escfirmware import FirmwareCache
+    firmware_cache = FirmwareCache(devpath)
+    for esc_id in list(flash_ids):
+        if esc_id not in esc_ids:
+            continue
+        versions = esc_manager.get_esc_by_id(esc_id).get_versions()
+        if firmware_cache.is_current(esc_id, firmware_binary, versions):
+            print 'INFO: ESC id %d was last flashed with this image (SW: %d, HW: %d), skipping' % (esc_id, versions[0], versions[1])
+            flash_ids.remove(esc_id)
 
-print('')
-for progress in esc_manager.upload_firmware(firmware_binary, esc_id):
-    if progress == -1:
-        print 'ERROR: An error occured during the write process.'
-        sys.exit(1)
-    else:
-        bar_length = 50
-        bar_completed_length = int(bar_length*progress)
-        progress_bar = '#' * bar_completed_length + ' ' * (bar_length-bar_completed_length)
-        print('\033[FProgress: %3d%% [%s]' % ((100 * progress),progress_bar))
+    if len(flash_ids) == 0:
+        print 'INFO: All ESCs were last flashed with this image, nothing to flash'
+        esc_manager.close()
+        sys.exit(0)
+
+# reset each ESC into its bootloader right before flashing it, see escfirmware.flash_escs
+if any(esc_id not in esc_ids for esc_id in flash_ids):
+    print 'WARNING: Specified ESC ID(s) not detected; perform manual power cycle now'
+
+flashing = []
+def progress(esc_id, fraction):
+    if esc_id not in flashing:
+        flashing.append(esc_id)
+        print ''
+        print 'INFO: Flashing ESC id %d (%d bytes)' % (esc_id, len(firmware_binary))
+        print ''
+    bar_length = 50
+    bar_completed_length = int(bar_length*fraction)
+    progress_bar = '#' * bar_completed_length + ' ' * (bar_length-bar_completed_length)
+    print('\033[FProgress: %3d%% [%s]' % ((100 * fraction),progress_bar))
+
+results = flash_escs(esc_manager, firmware_binary, flash_ids, esc_ids, firmware_baud_rate,
+                     bootloader_baud_rate, progress=progress)
+for (esc_id, success, duration) in results:
+    if not success:
+        print 'ERROR: An error occured during the write process (ESC id %d).' % (esc_id)
 
 esc_manager.close()
-print 'INFO: Firmware successfully updated for ESC id %d' % (esc_id)
+
+print ''
+num_failed = 0
+for (esc_id, success, duration) in results:
+    if success:
+        print 'INFO: Firmware successfully updated for ESC id %d in %.2f seconds (%.0f bytes/s)' % \
+            (esc_id, duration, len(firmware_binary) / duration)
+    else:
+        print 'ERROR: Firmware update failed for ESC id %d' % (esc_id)
+        num_failed += 1
+
+# let the ESCs boot the new firmware and remember what they run now
+if args.trust_cache and firmware_baud_rate is not None:
+    esc_manager = EscManager()
+    try:
+        esc_manager.open(devpath, firmware_baud_rate)
+        wait_for_escs(esc_manager, ids=[esc_id for (esc_id, success, duration) in results if success])
+        for (esc_id, success, duration) in results:
+            esc = esc_manager.get_esc_by_id(esc_id)
+            if not success:
+                firmware_cache.forget(esc_id)   # partially written, never skip it
+                continue
+            if esc is None:
+                print 'WARNING: ESC id %d did not come back after the update' % (esc_id)
+                firmware_cache.forget(esc_id)
+                continue
+            firmware_cache.put(esc_id, firmware_binary, esc.get_versions())
+        firmware_cache.save()
+    except Exception as e:
+        print 'WARNING: Unable to read back firmware versions :'
+        print e
+    finally:
+        esc_manager.close()
+
+if num_failed > 0:
+    sys.exit(1)
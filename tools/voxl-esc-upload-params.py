@@ -34,60 +34,33 @@
 import sys
 sys.path.append('./voxl-esc-tools-bin')
 
-from libesc import *
 from libesc.esctypes import EscTypes as types
+import os
 import time
 import argparse
+from escconnect import add_connection_args, connect
+from escconfig import upload_config, select_sections
+from escparams import load_compiled
 
 parser = argparse.ArgumentParser(description='ESC Upload Parameters Script')
-parser.add_argument('--device',              required=False, default=None)
-parser.add_argument('--baud-rate',           required=False, default=None)
+add_connection_args(parser)
 parser.add_argument('--params-file',         type=str, required=True,  default="")
 parser.add_argument('--params-filter',       type=str, required=False, default="all")
+parser.add_argument('--differential',        action='store_true')
+parser.add_argument('--readback-timeout',    type=float, required=False, default=1.0)
+parser.add_argument('--no-cache',            action='store_true')  # parse the XML instead of using the compiled params cache
 args = parser.parse_args()
 
-devpath       = args.device
-baudrate      = args.baud_rate
 params_file   = args.params_file
 params_filter = args.params_filter
 
-if devpath is not None and baudrate is None:
-    print 'ERROR: Please provide baud rate with --baud-rate option'
-    sys.exit(1)
-
-if devpath is None:
-    print 'INFO: Device and baud rate are not provided, attempting to autodetect..'
-    scanner = SerialScanner()
-    (devpath, baudrate) = scanner.scan()
-
-    if devpath is not None and baudrate is not None:
-        print ''
-        print 'INFO: ESC(s) detected on port: ' + devpath + ' using baudrate: ' + str(baudrate)
-        print 'INFO: Attempting to open...'
-    else:
-        print 'ERROR: No ESC(s) detected, exiting.'
-        sys.exit(1)
-
 # create ESC manager and search for ESCs
-try:
-    esc_manager = EscManager()
-    esc_manager.open(devpath, baudrate)
-except Exception as e:
-    print 'ERROR: Unable to connect to ESCs :'
-    print e
-    sys.exit(1)
-
-time.sleep(0.25)
-escs = esc_manager.get_escs()
+(esc_manager, escs) = connect(args)
 esc_ids = [e.get_id() for e in escs]
-if len(escs) == 0:
-    print 'ERROR: No ESCs detected, exiting.'
-    esc_manager.close()
-    sys.exit(1)
 print 'INFO: ESCs detected:'
 print 'INFO: ---------------------'
 
-for e in esc_manager.get_escs():
+for e in escs:
     versions = e.get_versions()
     print 'ID: %d, SW: %d, HW: %d' % (e.get_id(), versions[0], versions[1])
 print '---------------------'
@@ -100,7 +73,18 @@ if os.path.isfile(params_file) and file_extension == '.xml':
     print 'INFO: Loading XML config file...'
     with open(params_file, 'r') as file:
         xml_string = file.read()
+    if args.no_cache:
         esc.params.parse_xml_string( xml_string )
+    else:
+        # packed params from the compile cache, the XML is only parsed if it changed
+        try:
+            (param_bytes, cached) = load_compiled(xml_string)
+        except Exception as e:
+            print 'ERROR: Invalid params file: ' + str(e)
+            esc_manager.close()
+            sys.exit(1)
+        print 'INFO: Using %s params (%d bytes)' % ('cached compiled' if cached else 'newly compiled', len(param_bytes))
+        esc.params.parse_params_all( param_bytes )
 
 elif os.path.isfile(params_file) and file_extension == '.eep':
     print 'INFO: Loading EEP config file...'
@@ -112,6 +96,31 @@ else:
     esc_manager.close()
     sys.exit(1)
 
+# read back current params, push only the sections that changed and confirm
+# each push by reading the params back
+if args.differential:
+    def log(msg):
+        print msg
+
+    print 'INFO: Uploading changed params...'
+    t_start = time.time()
+    (pushed, failed) = upload_config(esc_manager, esc_ids, select_sections(params_filter),
+                                     timeout=args.readback_timeout, log=log)
+    if len(failed) > 0:
+        print 'ERROR: Params upload not confirmed by ESC ID(s): %s' % (', '.join(str(i) for i in failed))
+        esc_manager.close()
+        sys.exit(1)
+    if len(pushed) == 0:
+        print 'INFO: Params already up to date (%.2f seconds), skipping reset' % (time.time() - t_start)
+        esc_manager.close()
+        sys.exit(0)
+    print '    DONE (%.2f seconds)' % (time.time() - t_start)
+    print 'INFO: Resetting ESCs...'
+    esc_manager.reset_all()
+    print '    DONE'
+    esc_manager.close()
+    sys.exit(0)
+
 print 'INFO: Uploading params...'
 
 if 'all' in params_filter or 'board' in params_filter:
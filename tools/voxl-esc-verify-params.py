@@ -34,68 +34,49 @@
 import sys
 sys.path.append('./voxl-esc-tools-bin')
 
-from libesc import *
+import os
+import time
 import argparse
+from escconnect import add_connection_args, connect
+from escparams import ParamsIndex, read_params_fields
+from escconfig import readback_config
 
 parser = argparse.ArgumentParser(description='ESC Params Verification Script')
-parser.add_argument('--device',        required=False, default=None)
-parser.add_argument('--baud-rate',     required=False, default=None)
+add_connection_args(parser)
 parser.add_argument('--num-escs',      type=int, required=False,  default=4)
 parser.add_argument('--save-params',   type=int, required=False,  default=0)
+parser.add_argument('--params-dir',    type=str, required=False,  default='../params')
+parser.add_argument('--readback-timeout', type=float, required=False, default=1.0)
 args = parser.parse_args()
 
-devpath     = args.device
-baudrate    = args.baud_rate
 num_escs    = args.num_escs
 save_params = args.save_params
 
-if devpath is not None and baudrate is None:
-    print 'ERROR: Please provide baud rate with --baud-rate option'
-    sys.exit(1)
-
-if devpath is None:
-    print 'INFO: Device and baud rate are not provided, attempting to autodetect..'
-    scanner = SerialScanner()
-    (devpath, baudrate) = scanner.scan()
-
-    if devpath is not None and baudrate is not None:
-        print 'INFO: ESC(s) detected on port: ' + devpath + ' using baudrate: ' + str(baudrate)
-    else:
-        print 'ERROR: No ESC(s) detected, exiting.'
-        sys.exit(1)
-
-try:
-    esc_manager = EscManager()
-    esc_manager.open(devpath, baudrate)
-except Exception as e:
-    print 'ERROR: Unable to open serial port :'
-    print e
-    sys.exit(1)
-
-print 'INFO: Successuflly opened serial port %s @ %s' % (devpath,baudrate)
-
-# wait a little to let manager find all ESCs
-time.sleep(0.25)
-
-escs = esc_manager.get_escs()
+# open the ESCs, waiting until ESC IDs 0..num_escs-1 (or --expect-escs ESCs) have been detected
+(esc_manager, escs) = connect(args, range(num_escs))
+if args.daemon is None:
+    print 'INFO: Successuflly opened serial port %s @ %s' % (args.device, args.baud_rate)
 esc_ids = [e.get_id() for e in escs]
 
 num_invalid_params = 0
 
-# send request for each ESC to send back its params
+# index of all params files (including subdirectories), cached on disk
+params_index = ParamsIndex(args.params_dir).update()
+
+# send requests to all ESCs at once and wait for the params to come back
+readback_ids = [esc_id for esc_id in range(num_escs) if esc_id in esc_ids]
+t_readback = time.time()
+latency = readback_config(esc_manager, readback_ids, timeout=args.readback_timeout)
+print 'INFO: Params readback from %d ESCs took %.1f ms' % (len(readback_ids), (time.time() - t_readback) * 1000.0)
+
 for esc_id in range(num_escs):
     if esc_id not in esc_ids:
         print 'ERROR: ESC ID %d not found' % (esc_id)
         continue
 
     esc = esc_manager.get_esc_by_id(esc_id)
-    esc_manager.request_config_id(esc_id)
-    esc_manager.request_config_board(esc_id)
-    esc_manager.request_config_uart(esc_id)
-    esc_manager.request_config_tune(esc_id)
-
-    # wait for the params responses to come back
-    time.sleep(0.1)
+    if latency[esc_id] is not None:
+        print 'INFO: Read params from ID %d in %.1f ms' % (esc_id, latency[esc_id] * 1000.0)
 
     if not esc.params.is_valid():
         print 'ERROR: Params for ID %d are invalid!' % (esc_id)
@@ -105,13 +86,14 @@ for esc_id in range(num_escs):
         params_str = esc.params.get_xml_string()
 
         # try to find a match with existing xml file in params directory
-        params_candidates = glob.glob('../params/*.xml')
-        for param_file in params_candidates:
-            with open(param_file, 'r') as f:
-                temp_param_str = f.read()
-            try_params = params_from_xml(temp_param_str)
-            if try_params.get_param_bytes_all() == esc.params.get_param_bytes_all():
-                print 'INFO: Params from ID %d match %s' % (esc_id,param_file)
+        param_files = params_index.find(esc.params.get_param_bytes_all())
+        for param_file in param_files:
+            print 'INFO: Params from ID %d match %s' % (esc_id, os.path.relpath(param_file))
+        if len(param_files) == 0:
+            (param_file, diff) = params_index.nearest(read_params_fields(params_str))
+            if param_file is not None:
+                print 'INFO: Params from ID %d do not match any file, nearest is %s (%d differences: %s)' % \
+                    (esc_id, os.path.relpath(param_file), len(diff), ', '.join(diff))
 
         if save_params:
             xml_out_file = 'esc%d_params.xml' % (esc_id)
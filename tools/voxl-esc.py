@@ -0,0 +1,98 @@
+# Copyright (c) 2020 ModalAI Inc.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+#    may be used to endorse or promote products derived from this software
+#    without specific prior written permission.
+#
+# 4. The Software is used solely in conjunction with devices provided by
+#    ModalAI Inc.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# For a license to use on non-ModalAI hardware, please contact license@modalai.com
+
+# Single entry point for all ESC tools:
+#
+#   python voxl-esc.py <subcommand> [options]
+#
+# Subcommands are the voxl-esc-<subcommand>.py scripts. Only the selected
+# script is loaded (with runpy), so every subcommand pays just for the
+# modules it imports itself; this file keeps its own imports minimal.
+
+import os
+import sys
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (subcommand, script, description)
+SUBCOMMANDS = [
+    ('scan',            'voxl-esc-scan.py',            'detect ESCs and print their firmware and hardware versions'),
+    ('spin',            'voxl-esc-spin.py',            'spin motors at a fixed power or rpm'),
+    ('led',             'voxl-esc-led.py',             'cycle the ESC LEDs'),
+    ('calibrate',       'voxl-esc-calibrate.py',       'measure and fit the motor voltage vs rpm curve'),
+    ('upload-params',   'voxl-esc-upload-params.py',   'upload a params file to the ESCs'),
+    ('verify-params',   'voxl-esc-verify-params.py',   'read back and check the ESC params'),
+    ('upload-firmware', 'voxl-esc-upload-firmware.py', 'flash ESC firmware'),
+    ('provision',       'voxl-esc-provision.py',       'upload and verify params on several serial adapters at once'),
+    ('daemon',          'voxl-esc-daemon.py',          'keep the ESCs open and serve them to other tools'),
+    ('sim',             'voxl-esc-sim.py',             'simulate ESCs on a pseudo terminal'),
+    ('record-export',   'voxl-esc-record-export.py',   'export recorded telemetry to CSV'),
+    ('refit',           'voxl-esc-refit.py',           'fit saved calibration sweeps again'),
+    ('telemetry',       'voxl-esc-telemetry-listen.py', 'print the telemetry stream of spin / calibrate --udp'),
+    ('step-response',   'voxl-esc-step-response.py',   'benchmark rpm tracking with a sequence of steps and ramps'),
+    ('autotune',        'voxl-esc-autotune.py',        'tune the rpm controller gains on the bench'),
+    ('params-compile',  'voxl-esc-params-compile.py',  'compile and validate all params files'),
+    ('playback',        'voxl-esc-playback.py',        'play per-ESC rpm / power profiles from a file'),
+    ('startup-bench',   'voxl-esc-startup-bench.py',   'measure the startup time of every subcommand'),
+]
+
+
+def usage(stream):
+    stream.write('usage: voxl-esc.py <subcommand> [options]\n\nsubcommands:\n')
+    for (name, script, description) in SUBCOMMANDS:
+        stream.write('  %-16s %s\n' % (name, description))
+    stream.write('\nuse "voxl-esc.py <subcommand> --help" for the options of a subcommand\n')
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] in ['-h', '--help']:
+        usage(sys.stdout if len(argv) >= 2 else sys.stderr)
+        return 0 if len(argv) >= 2 else 1
+
+    scripts = dict((name, script) for (name, script, description) in SUBCOMMANDS)
+    if argv[1] not in scripts:
+        sys.stderr.write('ERROR: Unknown subcommand %s\n\n' % argv[1])
+        usage(sys.stderr)
+        return 1
+
+    import runpy
+    script = os.path.join(TOOLS_DIR, scripts[argv[1]])
+    sys.argv = [script] + argv[2:]
+    sys.path.insert(0, TOOLS_DIR)
+    sys.path.append(os.path.join(TOOLS_DIR, 'voxl-esc-tools-bin'))
+    runpy.run_path(script, run_name='__main__')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))